@@ -0,0 +1,84 @@
+"""Microbenchmark del análisis de mensajes del chat.
+
+Compara el recorrido anidado anterior (`pattern in query` por cada frase)
+con QueryParser a medida que crece la cantidad de frases configuradas.
+
+Uso: python -m benchmarks.bench_query_parser [--output resultados.json]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from config import LANGUAGE_PATTERNS
+from utils.query_parser import QueryParser
+
+QUERIES = [
+    'restaurantes en san jose',
+    '¿qué hay en Cartago?',
+    'quiero conocer lugares históricos en la ciudad de heredia',
+    'me gustaría saber sobre parques en puerto viejo de talamanca',
+    'hola',
+    'algo interesante cerca de alajuela por favor',
+]
+
+
+def legacy_parse(patterns, query):
+    """Recorrido anidado del handler original, como referencia"""
+    for category, phrases in patterns.items():
+        for phrase in phrases:
+            if phrase in query:
+                return query.split(phrase)[-1].strip(), category
+    return None, 'general'
+
+
+def synthetic_patterns(extra, seed=7):
+    """LANGUAGE_PATTERNS más `extra` frases inventadas que no coinciden"""
+    rng = random.Random(seed)
+    patterns = {category: list(phrases) for category, phrases in LANGUAGE_PATTERNS.items()}
+    categories = list(patterns)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    for _ in range(extra):
+        word = ''.join(rng.choice(letters) for _ in range(rng.randint(5, 10)))
+        patterns[rng.choice(categories)].insert(0, f'{word} en')
+    return patterns
+
+
+def time_per_call(func, queries, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    return (time.perf_counter() - started) / (repeat * len(queries))
+
+
+def run(sizes=(0, 100, 1000, 5000), repeat=200):
+    results = []
+    for extra in sizes:
+        patterns = synthetic_patterns(extra)
+        parser = QueryParser(language_patterns=patterns)
+        lowered = [query.lower() for query in QUERIES]
+        results.append({
+            'phrases': len(parser),
+            'legacy_us': round(time_per_call(lambda q: legacy_parse(patterns, q), lowered, repeat) * 1e6, 3),
+            'parser_us': round(time_per_call(parser.parse, QUERIES, repeat) * 1e6, 3),
+        })
+    return {'benchmark': 'query_parser', 'results': results}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--repeat', type=int, default=200)
+    arg_parser.add_argument('--output', help='archivo JSON donde guardar los resultados')
+    args = arg_parser.parse_args(argv)
+
+    report = run(repeat=args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Servidores locales que imitan Overpass y Nominatim para las pruebas de carga.
+
+Permiten medir la aplicación sin tocar los servidores públicos de OSM, con
+latencia, tasa de errores y tamaño de respuesta configurables.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from config import BASE_DIR, PLACE_TYPES
+
+PLACES_FIXTURE = f'{BASE_DIR}/data/places_data.json'
+
+_AROUND = re.compile(r'around:([\d.]+),(-?[\d.]+),(-?[\d.]+)')
+_BBOX = re.compile(r'\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)')
+
+# Destinos conocidos por el Nominatim falso
+KNOWN_PLACES = {
+    'san jose': (9.9325, -84.0795, 'San José, Costa Rica'),
+    'heredia': (9.9986, -84.1165, 'Heredia, Costa Rica'),
+    'cartago': (9.8644, -83.9194, 'Cartago, Costa Rica'),
+}
+
+# Etiqueta OSM que corresponde a cada tipo de lugar
+TYPE_TAGS = {}
+for _key, _types in PLACE_TYPES.items():
+    for _type in _types:
+        TYPE_TAGS.setdefault(_type, _key)
+ALL_TYPES = sorted(TYPE_TAGS)
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).strip()
+
+
+def fixture_elements(path=PLACES_FIXTURE):
+    """Convierte data/places_data.json en elementos con el formato de Overpass"""
+    with open(path, encoding='utf-8') as f:
+        places = json.load(f)['places']
+    elements = []
+    for index, place in enumerate(places):
+        tags = {'name': place['name'], TYPE_TAGS.get(place['type'], 'tourism'): place['type']}
+        if place.get('opening_hours') and place['opening_hours'] != 'No disponible':
+            tags['opening_hours'] = place['opening_hours']
+        if place.get('website'):
+            tags['website'] = place['website']
+        elements.append({
+            'type': 'node', 'id': 1_000_000 + index,
+            'lat': place['latitude'], 'lon': place['longitude'], 'tags': tags
+        })
+    return elements
+
+
+def _areas(query):
+    """Círculos y rectángulos pedidos en la consulta, como rectángulos (s, w, n, e)"""
+    areas = []
+    for radius, lat, lon in _AROUND.findall(query):
+        radius, lat, lon = float(radius), float(lat), float(lon)
+        dlat = radius / 111320
+        dlon = radius / (111320 * max(math.cos(math.radians(lat)), 0.01))
+        areas.append((lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+    for south, west, north, east in _BBOX.findall(query):
+        areas.append((float(south), float(west), float(north), float(east)))
+    return areas
+
+
+class FakeOverpassData:
+    """POI de prueba: el fixture real más una ciudad sintética densa y estable"""
+
+    def __init__(self, mode='mixed', density=200, cell_deg=0.005):
+        self.mode = mode
+        self.density = density  # POI por celda de la cuadrícula sintética
+        self.cell_deg = cell_deg
+        self.fixture = fixture_elements() if mode in ('fixture', 'mixed') else []
+
+    def _synthetic(self, south, west, north, east):
+        # Cada celda genera siempre los mismos POI, así las áreas solapadas coinciden
+        for row in range(math.floor(south / self.cell_deg), math.floor(north / self.cell_deg) + 1):
+            for col in range(math.floor(west / self.cell_deg), math.floor(east / self.cell_deg) + 1):
+                rng = random.Random(row * 1_000_003 + col)
+                for i in range(self.density):
+                    place_type = rng.choice(ALL_TYPES)
+                    tags = {'name': f'Lugar {row}:{col}:{i}', TYPE_TAGS[place_type]: place_type}
+                    if rng.random() < 0.3:
+                        tags['opening_hours'] = 'Mo-Fr 08:00-17:00'
+                    if rng.random() < 0.2:
+                        tags['website'] = f'https://example.com/{row}/{col}/{i}'
+                    yield {
+                        'type': 'node', 'id': (row * 100_000 + col) * 1000 + i,
+                        'lat': (row + rng.random()) * self.cell_deg,
+                        'lon': (col + rng.random()) * self.cell_deg,
+                        'tags': tags
+                    }
+
+    def elements(self, query):
+        seen = set()
+        results = []
+        for south, west, north, east in _areas(query):
+            candidates = []
+            if self.mode in ('synthetic', 'mixed'):
+                candidates = self._synthetic(south, west, north, east)
+            for element in list(candidates) + self.fixture:
+                if element['id'] in seen:
+                    continue
+                if south <= element['lat'] <= north and west <= element['lon'] <= east:
+                    seen.add(element['id'])
+                    results.append(element)
+        return results
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(max(0.0, random.gauss(server.latency, server.latency * 0.2)))
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, b'{"error": "simulado"}', {'Retry-After': '0'})
+            return
+        status, body = server.respond(self)
+        self._send(status, body)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def counters(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes_sent': self.bytes_sent}
+
+    def respond(self, handler):
+        """Estado y cuerpo de la respuesta; las subclases imitan cada servicio"""
+        return 404, b'{"error": "ruta no simulada"}'
+
+
+class FakeOverpass(FakeServer):
+    def __init__(self, latency=0.0, error_rate=0.0, mode='mixed', density=200):
+        super().__init__(latency, error_rate)
+        self.data = FakeOverpassData(mode=mode, density=density)
+
+    @property
+    def url(self):
+        return f'{super().url}/api/interpreter'
+
+    def respond(self, handler):
+        query = parse_qs(urlparse(handler.path).query).get('data', [''])[0]
+        payload = {'version': 0.6, 'generator': 'fake-overpass', 'elements': self.data.elements(query)}
+        return 200, json.dumps(payload).encode('utf-8')
+
+
+class FakeNominatim(FakeServer):
+    @property
+    def domain(self):
+        return f'127.0.0.1:{self.server_port}'
+
+    def respond(self, handler):
+        params = parse_qs(urlparse(handler.path).query)
+        # "San José, Costa Rica" se resuelve igual que "San José"
+        name = _fold(params.get('q', [''])[0]).split(',')[0].strip()
+        if name in KNOWN_PLACES:
+            lat, lon, display_name = KNOWN_PLACES[name]
+        elif name:
+            # Nombres desconocidos: coordenadas estables dentro de Costa Rica
+            rng = random.Random(name)
+            lat, lon, display_name = rng.uniform(9.5, 10.5), rng.uniform(-85.0, -83.5), name.title()
+        else:
+            return 200, b'[]'
+        result = [{'place_id': 1, 'lat': str(lat), 'lon': str(lon), 'display_name': display_name}]
+        return 200, json.dumps(result).encode('utf-8')
@@ -0,0 +1,234 @@
+"""Prueba de carga de la aplicación contra Overpass y Nominatim locales.
+
+Levanta los servidores falsos de benchmarks.fake_upstreams, inicia la
+aplicación en un subproceso apuntando a ellos y recorre los endpoints con
+varios niveles de concurrencia. Reporta latencias p50/p95/p99, solicitudes
+por segundo, llamadas a servicios externos por solicitud y memoria máxima.
+
+Uso: python -m benchmarks.load_test [--concurrency 1 8 32] [--output resultados.json]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from config import BASE_DIR
+from benchmarks.fake_upstreams import FakeOverpass, FakeNominatim
+
+# Centros de búsqueda: San José y alrededores
+CENTERS = [(9.9325, -84.0795), (9.9986, -84.1165), (9.8644, -83.9194)]
+PLACE_NAMES = ['San José', 'Heredia', 'Cartago', 'Alajuela', 'Puerto Viejo']
+CHAT_MESSAGES = [
+    'restaurantes en san jose',
+    '¿qué hay en Cartago?',
+    'parques en heredia',
+    'hola',
+    'lugares históricos',
+]
+
+_APP_LAUNCHER = (
+    "import sys; from index import app; "
+    "app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True, use_reloader=False)"
+)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    """Percentil por rango más cercano de una lista no vacía"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_kb(pid):
+    """Memoria residente máxima del proceso (VmHWM), solo en Linux"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class AppProcess:
+    """La aplicación Flask en un subproceso configurado por variables de entorno"""
+
+    def __init__(self, overpass, nominatim, local_store=False):
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.env = dict(
+            os.environ,
+            OVERPASS_API_URLS=overpass.url,
+            NOMINATIM_DOMAIN=nominatim.domain,
+            NOMINATIM_SCHEME='http',
+            NOMINATIM_RATE_LIMIT='1000',
+            # Sin precarga para que las llamadas externas correspondan solo a la carga medida
+            PREFETCH_ENABLED='0',
+        )
+        if not local_store:
+            self.env['LOCAL_POI_PATHS'] = ''
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', _APP_LAUNCHER, str(self.port)],
+            cwd=BASE_DIR, env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('La aplicación terminó al iniciar')
+            try:
+                requests.get(self.url + '/', timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError('La aplicación no respondió a tiempo')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def _scenario_requests(endpoint, rng):
+    """Genera (método, ruta, cuerpo) para un endpoint"""
+    if endpoint == 'get-places':
+        lat, lon = rng.choice(CENTERS)
+        return 'POST', '/get-places', {
+            'latitude': lat + rng.uniform(-0.01, 0.01),
+            'longitude': lon + rng.uniform(-0.01, 0.01),
+            'radius': 1000
+        }
+    if endpoint == 'geocode':
+        return 'POST', '/geocode', {'place_name': rng.choice(PLACE_NAMES)}
+    if endpoint == 'chat':
+        return 'POST', '/chat', {'message': rng.choice(CHAT_MESSAGES)}
+    return 'GET', '/places-summary', None
+
+
+def _worker(base_url, endpoint, count, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    # Fijar una ubicación para que el chat y el resumen tengan lugares
+    lat, lon = CENTERS[seed % len(CENTERS)]
+    session.post(base_url + '/get-places', json={'latitude': lat, 'longitude': lon, 'radius': 1000})
+
+    latencies, errors = [], 0
+    for _ in range(count):
+        method, path, body = _scenario_requests(endpoint, rng)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=60)
+            if response.status_code >= 500:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    return latencies, errors
+
+
+def run_level(app, upstreams, endpoint, concurrency, requests_per_worker):
+    before = {name: server.counters()['requests'] for name, server in upstreams.items()}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(_worker, app.url, endpoint, requests_per_worker, seed)
+            for seed in range(concurrency)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker, _ in results for latency in worker]
+    total = len(latencies)
+    # Incluye la solicitud inicial de cada trabajador que fija la ubicación
+    sent = total + concurrency
+    upstream_calls = {
+        name: round((server.counters()['requests'] - before[name]) / sent, 4)
+        for name, server in upstreams.items()
+    }
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': sum(errors for _, errors in results),
+        'rps': round(sent / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'upstream_calls_per_request': upstream_calls,
+        'peak_rss_kb': peak_rss_kb(app.process.pid),
+    }
+
+
+def run(endpoints, concurrency_levels, requests_per_worker, latency, error_rate,
+        mode, density, local_store):
+    overpass = FakeOverpass(latency=latency, error_rate=error_rate, mode=mode, density=density).start()
+    nominatim = FakeNominatim(latency=latency, error_rate=error_rate).start()
+    upstreams = {'overpass': overpass, 'nominatim': nominatim}
+    results = []
+    try:
+        # Un proceso nuevo por endpoint para que la caché de uno no favorezca a otro
+        for endpoint in endpoints:
+            with AppProcess(overpass, nominatim, local_store=local_store) as app:
+                for concurrency in concurrency_levels:
+                    results.append(run_level(app, upstreams, endpoint, concurrency, requests_per_worker))
+    finally:
+        overpass.stop()
+        nominatim.stop()
+    return {
+        'benchmark': 'load_test',
+        'settings': {
+            'upstream_latency_s': latency,
+            'upstream_error_rate': error_rate,
+            'overpass_mode': mode,
+            'overpass_density': density,
+            'local_store': local_store,
+            'requests_per_worker': requests_per_worker,
+        },
+        'results': results,
+        'upstream_bytes_sent': {name: server.counters()['bytes_sent'] for name, server in upstreams.items()},
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--endpoints', nargs='+',
+                            default=['get-places', 'geocode', 'chat', 'places-summary'])
+    arg_parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    arg_parser.add_argument('--requests', type=int, default=20, help='solicitudes por trabajador')
+    arg_parser.add_argument('--latency', type=float, default=0.05,
+                            help='latencia media de los servidores falsos en segundos')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0)
+    arg_parser.add_argument('--mode', choices=['fixture', 'synthetic', 'mixed'], default='mixed',
+                            help='origen de los POI del Overpass falso')
+    arg_parser.add_argument('--density', type=int, default=200,
+                            help='POI sintéticos por celda de ~500 m (tamaño de la respuesta)')
+    arg_parser.add_argument('--local-store', action='store_true',
+                            help='mantener activos los POI locales de data/')
+    arg_parser.add_argument('--output', help='archivo JSON donde guardar los resultados')
+    args = arg_parser.parse_args(argv)
+
+    report = run(args.endpoints, args.concurrency, args.requests, args.latency,
+                 args.error_rate, args.mode, args.density, args.local_store)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Microbenchmarks de las rutas calientes de la aplicación.
+
+Mide geo_utils.get_nearby_places, OverpassAPI._process_results,
+LlamaHandler._parse_natural_query, el autocompletado del nomenclátor, el
+ranking de relevancia y el filtro "abierto ahora" con datos del Overpass
+falso, sin red.
+
+Uso: python -m benchmarks.microbench [--output resultados.json]
+"""
+import argparse
+import json
+import sys
+import time
+from benchmarks.fake_upstreams import FakeOverpassData
+from benchmarks.bench_query_parser import QUERIES
+from utils.gazetteer import Gazetteer
+from utils.geo_utils import get_nearby_places
+from utils.llama_handler import LlamaHandler
+from utils.opening_hours import OpeningHoursIndex, compile_opening_hours
+from utils.overpass_api import OverpassAPI
+from utils.place import Place, PlaceSet
+from utils.ranking import RankingFeatures, rank_places
+
+CENTER = (9.9325, -84.0795)
+# Prefijos, nombres completos y errores de tipeo (estos recorren el trie con Levenshtein)
+AUTOCOMPLETE_QUERIES = ['l', 'lu', 'lugar 19', 'lugar 1985 8', 'lugr 1985', 'lugar 1985 84077', 'zzzz']
+
+
+def _query(radius):
+    lat, lon = CENTER
+    return f'node(around:{radius},{lat},{lon});'
+
+
+def time_call(func, repeat):
+    """Mejor tiempo por llamada de varias rondas, en microsegundos"""
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, (time.perf_counter() - started) / repeat)
+    return round(best * 1e6, 3)
+
+
+def bench_process_results(data, radii, repeat):
+    overpass = OverpassAPI(cache={}, client=object())
+    results = []
+    for radius in radii:
+        payload = {'elements': data.elements(_query(radius))}
+        results.append({
+            'radius': radius,
+            'elements': len(payload['elements']),
+            'us_per_call': time_call(lambda: overpass._process_results(payload), repeat),
+        })
+    return results
+
+
+def bench_nearby_places(data, radii, repeat):
+    overpass = OverpassAPI(cache={}, client=object())
+    lat, lon = CENTER
+    results = []
+    for radius in radii:
+        places = overpass._process_results({'elements': data.elements(_query(radius))})
+        results.append({
+            'radius': radius,
+            'places': len(places),
+            'us_per_call': time_call(lambda: get_nearby_places(lat, lon, radius / 2, places), repeat),
+            'us_per_call_top20': time_call(
+                lambda: get_nearby_places(lat, lon, radius / 2, places, limit=20), repeat
+            ),
+        })
+    return results
+
+
+def bench_parse_natural_query(repeat):
+    handler = LlamaHandler(overpass_api=object(), geocoder=object())
+    return [{
+        'queries': len(QUERIES),
+        'us_per_call': time_call(lambda: [handler._parse_natural_query(q) for q in QUERIES], repeat)
+        / len(QUERIES),
+    }]
+
+
+def bench_autocomplete(data, repeat):
+    gazetteer = Gazetteer()
+    for element in data.elements(_query(5000)):
+        name = element.get('tags', {}).get('name')
+        if name:
+            gazetteer.add(name, element['lat'], element['lon'], 'poi')
+    gazetteer.finalize()
+    return [
+        {
+            'query': query,
+            'names': len(gazetteer),
+            'results': len(gazetteer.complete(query)),
+            'us_per_call': time_call(lambda: gazetteer.complete(query), repeat),
+        }
+        for query in AUTOCOMPLETE_QUERIES
+    ]
+
+
+def bench_ranking(data, sizes, repeat):
+    """Ranking de relevancia con las características ya calculadas, como en un PlaceSet reutilizado"""
+    overpass = OverpassAPI(cache={}, client=object())
+    lat, lon = CENTER
+    all_places = overpass._process_results({'elements': data.elements(_query(5000))})
+    results = []
+    for size in sizes:
+        places = PlaceSet(all_places[:size])
+        rank_places(places, lat, lon, 20)
+        results.append({
+            'candidates': len(places),
+            'features_us': time_call(lambda: RankingFeatures(places), 1),
+            'us_per_call_top20': time_call(lambda: rank_places(places, lat, lon, 20), repeat),
+            'us_per_call_top20_category': time_call(
+                lambda: rank_places(places, lat, lon, 20, category='restaurantes', max_distance=2000), repeat
+            ),
+        })
+    return results
+
+def bench_open_now(data, sizes, repeat):
+    """Filtro "abierto ahora": índice de horarios compilados contra interpretar cada cadena"""
+    overpass = OverpassAPI(cache={}, client=object())
+    base = overpass._process_results({'elements': data.elements(_query(5000))})
+    # Horarios variados: reglas comunes con horas de apertura distintas
+    hours = [
+        f'Mo-Fr {8 + i % 4:02d}:00-{17 + i % 5:02d}:00; Sa {9 + i % 3:02d}:00-13:00; Su off'
+        for i in range(60)
+    ] + ['24/7', '11:00-22:00', 'Tu-Su 10:00-02:00', 'Mo-Sa 07:00-12:00,14:00-19:00', '']
+    results = []
+    for size in sizes:
+        places = PlaceSet(
+            Place.from_dict(dict(place.to_dict(), opening_hours=hours[i % len(hours)]))
+            for i, place in enumerate(base[:size])
+        )
+        index = OpeningHoursIndex(places)
+        minute = 2 * 1440 + 10 * 60
+        results.append({
+            'places': len(places),
+            'distinct_hours': len(index.table),
+            'index_us': time_call(lambda: OpeningHoursIndex(places), 1),
+            'us_per_call_open_mask': time_call(lambda: index.open_mask(minute), repeat),
+            'parse_each_us': time_call(
+                lambda: [compile_opening_hours.__wrapped__(place.opening_hours) for place in places], 1
+            ),
+        })
+    return results
+
+
+def run(radii=(500, 1000, 2000), density=200, repeat=20):
+    data = FakeOverpassData(mode='mixed', density=density)
+    return {
+        'benchmark': 'microbench',
+        'settings': {'density': density, 'repeat': repeat},
+        'process_results': bench_process_results(data, radii, repeat),
+        'get_nearby_places': bench_nearby_places(data, radii, repeat),
+        'parse_natural_query': bench_parse_natural_query(repeat * 50),
+        'autocomplete': bench_autocomplete(data, repeat),
+        'ranking': bench_ranking(data, (1000, 10000), repeat * 10),
+        'open_now': bench_open_now(data, (1000, 10000), repeat * 10),
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--radii', nargs='+', type=int, default=[500, 1000, 2000])
+    arg_parser.add_argument('--density', type=int, default=200)
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    arg_parser.add_argument('--output', help='archivo JSON donde guardar los resultados')
+    args = arg_parser.parse_args(argv)
+
+    report = run(args.radii, args.density, args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,162 @@
+import os
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Configuración general
 SEARCH_RADIUS = 2000  # metros
+PLACES_MAX_RADIUS = 50000  # metros; radio máximo de /get-places
 DEFAULT_TIMEOUT = 10  # segundos
 MAX_PLACES_GENERAL = 8
 MAX_PLACES_CATEGORY = 5
 
+# Presupuesto de tiempo del chat
+CHAT_DEADLINE = 20  # segundos totales por mensaje
+CHAT_STAGE_BUDGET = {'geocode': 0.35, 'places': 0.65}  # fracción del total por etapa
+UPSTREAM_POOL_SIZE = 64  # hilos y conexiones para llamadas a servicios externos
+
+# Logging y métricas
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # DEBUG muestra el detalle de cada consulta del chat
+LOG_RATE_LIMIT = 20  # registros iguales permitidos por intervalo (0 = sin límite)
+LOG_RATE_INTERVAL = 10  # segundos
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+METRICS_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25)
+METRICS_BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
 # Configuración de Nominatim
 NOMINATIM_USER_AGENT = "my_travel_app"
+NOMINATIM_DOMAIN = os.getenv('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+NOMINATIM_SCHEME = os.getenv('NOMINATIM_SCHEME', 'https')
 NOMINATIM_TIMEOUT = 10
+# Solicitudes por segundo (política de uso de Nominatim)
+NOMINATIM_RATE_LIMIT = float(os.getenv('NOMINATIM_RATE_LIMIT', '1.0'))
+NOMINATIM_MAX_QUEUE_WAIT = 30  # segundos máximos en cola antes de desistir
+
+# Caché de geocodificación
+GEOCODE_CACHE_TTL = 7 * 24 * 3600  # segundos
+GEOCODE_NEGATIVE_TTL = 3600  # segundos para búsquedas sin resultado
+GEOCODE_CACHE_MAX_ENTRIES = 2048
+GEOCODE_CACHE_PATH = None  # ruta a un archivo SQLite para persistir la caché
+
+# Sesiones de conversación
+SESSION_COOKIE_NAME = "bp_session"
+SESSION_IDLE_TIMEOUT = 3600  # segundos sin actividad antes de descartar la sesión
+SESSION_MAX_ENTRIES = 10000
+SESSION_MAX_BYTES = 64 * 1024 * 1024  # memoria máxima para el backend en memoria
+SESSION_STORE_PATH = None  # archivo SQLite para compartir sesiones entre workers
 
 # Configuración de Overpass API
 OVERPASS_API_URL = "https://overpass-api.de/api/interpreter"
+# Réplicas en orden de preferencia; se usa la siguiente si la anterior falla
+OVERPASS_API_URLS = [
+    OVERPASS_API_URL,
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://overpass.private.coffee/api/interpreter"
+]
+if os.getenv('OVERPASS_API_URLS'):
+    OVERPASS_API_URLS = os.getenv('OVERPASS_API_URLS').split(',')
 OVERPASS_TIMEOUT = 25
+OVERPASS_MAX_ELEMENTS = 1000  # tope de resultados pedidos al servidor y leídos
+OVERPASS_STREAM_CHUNK_SIZE = 64 * 1024  # bytes por fragmento al leer la respuesta
+
+# Descarga por teselas (slippy map): búsquedas solapadas reutilizan lo ya descargado
+OVERPASS_TILE_ZOOM = 15  # ~1.2 km de lado en el ecuador
+OVERPASS_TILE_MAX_ELEMENTS = 20000  # tope por consulta; si se alcanza no se guardan las teselas
+OVERPASS_MAX_TILES_PER_QUERY = 64  # teselas nuevas por consulta combinada
+OVERPASS_MAX_TILES_PER_SEARCH = 256  # con más teselas se hace una sola consulta around:
+TILE_CACHE_MAX_ENTRIES = 4096
+
+# Reintentos y cortacircuitos para servicios externos
+UPSTREAM_MAX_RETRIES = 2  # reintentos por endpoint ante 429/502/503/504 o errores de red
+UPSTREAM_BACKOFF_BASE = 0.5  # segundos
+UPSTREAM_BACKOFF_MAX = 8  # segundos
+CIRCUIT_FAILURE_THRESHOLD = 5  # fallos seguidos para abrir el circuito de un endpoint
+CIRCUIT_RESET_TIMEOUT = 30  # segundos antes de volver a probar un endpoint
+
+# Control de admisión: llamadas simultáneas y cola acotada por servicio externo
+OVERPASS_MAX_CONCURRENT = int(os.getenv('OVERPASS_MAX_CONCURRENT', '4'))
+OVERPASS_MAX_QUEUE = int(os.getenv('OVERPASS_MAX_QUEUE', '16'))  # más allá se rechaza de inmediato
+OVERPASS_QUEUE_TIMEOUT = 5  # segundos máximos esperando turno
+NOMINATIM_MAX_CONCURRENT = int(os.getenv('NOMINATIM_MAX_CONCURRENT', '2'))
+NOMINATIM_MAX_QUEUE = int(os.getenv('NOMINATIM_MAX_QUEUE', '8'))
+NOMINATIM_QUEUE_TIMEOUT = 5
+OVERLOAD_RETRY_AFTER = 5  # segundos sugeridos en Retry-After al responder 503
+# Segundos tras el vencimiento en que una entrada se puede servir si el servicio no responde
+CACHE_STALE_TTL = 24 * 3600
+# Cachés en SQLite: entradas máximas por espacio de nombres y escrituras entre limpiezas
+CACHE_DISK_MAX_ENTRIES = int(os.getenv('CACHE_DISK_MAX_ENTRIES', '50000'))
+CACHE_DISK_PURGE_EVERY = 500
+
+# Respuestas HTTP de lugares
+PLACES_PAGE_SIZE = 100  # lugares por página si no se indica limit
+PLACES_MAX_PAGE_SIZE = 500
+PLACES_HTTP_MAX_AGE = 300  # segundos que navegadores y CDN pueden reutilizar una respuesta
+COMPRESS_MIN_BYTES = 1024  # respuestas más chicas se envían sin comprimir
+COMPRESS_LEVEL = 5  # nivel de gzip (1-9) y calidad de brotli (0-11)
+COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/plain')
+
+# Consultas de varios puntos (itinerarios y rutas)
+BATCH_MAX_POINTS = 50
+BATCH_MAX_POLYLINE_SAMPLES = 500  # puntos generados a lo largo de una ruta
+BATCH_MAX_RADIUS = 5000  # metros por punto
+BATCH_DEFAULT_CORRIDOR = 500  # metros a cada lado de la ruta
+BATCH_MAX_PLACES_PER_POINT = 50
+
+# Caché de resultados de Overpass
+PLACES_CACHE_TTL = 900  # segundos
+PLACES_CACHE_MAX_ENTRIES = 512
+PLACES_CACHE_GRID_PRECISION = 3  # decimales de lat/lon (~110 m por celda)
+PLACES_CACHE_PATH = None  # ruta a un archivo SQLite para persistir la caché (lugares y teselas)
+
+# Importación de extractos de OSM en fragmentos (python -m utils.ingest)
+INGEST_OUTPUT_DIR = os.getenv('INGEST_OUTPUT_DIR', os.path.join(BASE_DIR, 'data', 'poi'))
+INGEST_SHARD_DEG = 0.5  # lado de cada fragmento en grados; se redondea a celdas completas
+INGEST_CHUNK_ELEMENTS = 20000  # elementos por tarea del pool de procesos
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', os.cpu_count() or 1))
+
+# POI locales: responden sin red las áreas que el archivo declara cubiertas ("coverage");
+# sin esa declaración solo complementan lo que responde Overpass
+LOCAL_POI_PATHS = [os.path.join(BASE_DIR, 'data', 'places_data.json')]
+if os.path.exists(os.path.join(INGEST_OUTPUT_DIR, 'manifest.json')):
+    LOCAL_POI_PATHS.append(INGEST_OUTPUT_DIR)
+if os.getenv('LOCAL_POI_PATHS') is not None:
+    LOCAL_POI_PATHS = [path for path in os.getenv('LOCAL_POI_PATHS').split(os.pathsep) if path]
+LOCAL_POI_CELL_DEG = 0.01  # tamaño de celda del índice espacial (~1.1 km)
+
+# Nomenclátor local (autocompletado, geocodificación sin Nominatim e inversa)
+GAZETTEER_PATHS = [
+    os.path.join(BASE_DIR, 'data', 'gazetteer.json'),
+    os.path.join(BASE_DIR, 'data', 'places_data.json'),
+]
+if os.getenv('GAZETTEER_PATHS') is not None:
+    GAZETTEER_PATHS = [path for path in os.getenv('GAZETTEER_PATHS').split(os.pathsep) if path]
+GAZETTEER_SUGGESTIONS = 10  # sugerencias máximas por prefijo
+GAZETTEER_REVERSE_MAX_DISTANCE = 15000  # metros para nombrar una coordenada
+GAZETTEER_MAX_QUERY_LENGTH = 64  # caracteres considerados al autocompletar
+
+# Precarga de destinos populares
+# Desactivada por omisión: consulta los servidores públicos de OSM al iniciar
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '0') == '1'
+# Archivo de bloqueo: un solo proceso por máquina (de todos los workers) hace la precarga
+PREFETCH_LOCK_PATH = os.getenv(
+    'PREFETCH_LOCK_PATH',
+    f'{PLACES_CACHE_PATH}.prefetch.lock' if PLACES_CACHE_PATH
+    else os.path.join(tempfile.gettempdir(), 'backpacker-prefetch.lock')
+)
+# Destinos que se precargan al iniciar y se mantienen siempre vigentes (separados por ';')
+PREFETCH_DESTINATIONS = [
+    name.strip() for name in
+    os.getenv('PREFETCH_DESTINATIONS', 'San José, Costa Rica;Heredia, Costa Rica;Cartago, Costa Rica').split(';')
+    if name.strip()
+]
+PREFETCH_INTERVAL = 60  # segundos entre revisiones de vencimiento
+PREFETCH_REFRESH_MARGIN = 0.2  # se renueva al quedar esta fracción del TTL
+PREFETCH_HOT_SIZE = 20  # consultas y áreas frecuentes que se mantienen vigentes
+PREFETCH_MIN_HITS = 3  # solicitudes (con decaimiento) para considerar algo frecuente
+PREFETCH_DECAY = 0.9  # factor aplicado a los conteos en cada revisión
+PREFETCH_TRACKED_KEYS = 1000
+PREFETCH_WORKERS = 2
+PREFETCH_OVERPASS_RATE = 0.2  # consultas por segundo a Overpass hechas por la precarga
 
 # Tipos de lugares
 PLACE_TYPES = {
@@ -20,6 +166,36 @@ PLACE_TYPES = {
     'leisure': ['park', 'garden']
 }
 
+# Categorías del chat: tipos de lugar que responden a cada tipo de consulta
+PLACE_CATEGORIES = {
+    'restaurantes': ['restaurant', 'cafe', 'bar'],
+    'cultura': ['museum', 'theatre'] + PLACE_TYPES['historic'],
+    'naturaleza': PLACE_TYPES['leisure']
+}
+
+# Ranking de relevancia: peso de cada componente del puntaje
+RANKING_WEIGHTS = {
+    'distance': 1.0,  # decae exponencialmente con RANKING_DISTANCE_SCALE
+    'richness': 0.4,  # fracción de sitio web, horario, teléfono y descripción presentes
+    'category': 0.6,  # el tipo coincide con la categoría pedida
+    'name': 0.2,  # nombre propio y legible, no genérico
+}
+# Se puede ajustar con RANKING_WEIGHTS="distance=1.0,richness=0.5"
+RANKING_WEIGHTS.update(
+    (key.strip(), float(value))
+    for key, _, value in (item.partition('=') for item in os.getenv('RANKING_WEIGHTS', '').split(',') if item)
+)
+RANKING_DISTANCE_SCALE = 1000  # metros en que el puntaje por distancia cae a 1/e
+RANKING_FEATURES_CACHE_ENTRIES = 64  # conjuntos de lugares con características ya calculadas
+
+# Horarios (opening_hours): se evalúan en la hora local de los lugares
+OPENING_HOURS_TIMEZONE = os.getenv('OPENING_HOURS_TIMEZONE', 'America/Costa_Rica')
+OPENING_HOURS_CACHE_ENTRIES = 8192  # cadenas distintas compiladas que se conservan
+PLACES_OPEN_NOW_MAX_AGE = 60  # segundos de caché HTTP para respuestas filtradas por horario
+
+# Respuestas del chat ya formateadas, por celda, tipo de consulta e idioma
+ANSWER_CACHE_MAX_ENTRIES = 2048
+
 # Patrones de lenguaje natural
 LANGUAGE_PATTERNS = {
     'preguntas_generales': [
@@ -41,4 +217,27 @@ LANGUAGE_PATTERNS = {
         'parques en', 'jardines en', 'espacios verdes en',
         'naturaleza en', 'aire libre en', 'zonas verdes de'
     ]
-} 
\ No newline at end of file
+}
+
+# Saludos y preguntas sobre el asistente (sin consulta de lugar)
+GREETING_PATTERNS = [
+    'hola', 'buenos días', 'buenas tardes', 'buenas noches',
+    'hey', 'saludos', 'que tal', 'como estás'
+]
+BOT_QUESTION_PATTERNS = [
+    'quien eres', 'que eres', 'como funcionas', 'que haces',
+    'como puedes ayudar', 'que me puedes decir'
+]
+
+# Frases que piden solo lugares abiertos en este momento
+OPEN_NOW_PATTERNS = [
+    'abierto ahora', 'abiertos ahora', 'abierta ahora', 'abiertas ahora',
+    'estan abiertos', 'estan abiertas', 'esta abierto', 'esta abierta',
+    'que esten abiertos', 'que este abierto'
+]
+# Adjetivos sueltos: solo cuentan justo después de una frase de categoría
+# ("restaurantes abiertos en ..."), nunca dentro del nombre del lugar
+OPEN_NOW_ADJECTIVES = ['abiertos', 'abierto', 'abiertas', 'abierta']
+
+# Preposiciones tras las que suele venir el lugar si no hay un patrón conocido
+LOCATION_PREPOSITIONS = ['en', 'de', 'sobre', 'cerca de', 'alrededor de']
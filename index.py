@@ -1,28 +1,160 @@
+import json
 import logging
-from flask import Flask, request, jsonify, render_template
-from geopy.geocoders import Nominatim
+import math
+import time
+from datetime import datetime
+from flask import Flask, Response, request, jsonify, render_template, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from geopy.exc import GeocoderTimedOut
+from utils.gazetteer import get_gazetteer
+from utils.geocoding import get_geocoding_service
 from utils.llama_handler import LlamaHandler
+from utils.log_utils import configure_logging, fields
+from utils.metrics import REQUEST_SECONDS, get_metrics, observe_bytes, timed
+from utils.opening_hours import filter_open, minute_of_week
 from utils.overpass_api import OverpassAPI
-from utils.geo_utils import calculate_distance, get_nearby_places
+from utils.place import Place, payload_to_json, places_to_json
+from utils.poi_store import get_poi_store
+from utils.prefetch import Prefetcher
+from utils.ranking import rank_places
+from utils.responses import (
+    compress_response, decode_cursor, paginate, parse_fields, parse_limit
+)
+from utils.session_store import SessionStore
+from utils.upstream import Overloaded, UpstreamError
+from utils.geo_utils import calculate_distance, densify_polyline, get_nearby_places
 from config import *
 import os
 from dotenv import load_dotenv
 
 # Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+class PlaceJSONProvider(DefaultJSONProvider):
+    """Permite usar jsonify con objetos Place"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Place):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = PlaceJSONProvider(app)
 load_dotenv()
 
 # Inicializar servicios
-llama_handler = LlamaHandler()
-geolocator = Nominatim(user_agent=NOMINATIM_USER_AGENT)
-overpass_api = OverpassAPI()
+overpass_api = OverpassAPI(local_store=get_poi_store())
+gazetteer = get_gazetteer()
+geocoder = get_geocoding_service()
+session_store = SessionStore()
+prefetcher = Prefetcher(geocoder, overpass_api) if PREFETCH_ENABLED else None
+
+
+def get_handler():
+    """Retorna un LlamaHandler ligado al estado de la sesión del usuario"""
+    if 'llama_handler' not in g:
+        g.session_id, g.session_state, g.new_session = session_store.open(
+            request.cookies.get(SESSION_COOKIE_NAME)
+        )
+        g.llama_handler = LlamaHandler(overpass_api, geocoder, g.session_state, gazetteer)
+    return g.llama_handler
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def start_prefetcher():
+    # Se inicia con la primera solicitud para no hacerlo en el proceso vigilante del recargador
+    if prefetcher is not None:
+        prefetcher.start()
+
+
+@app.after_request
+def record_request(response):
+    """Registra duración y tamaño de la respuesta por endpoint"""
+    if METRICS_ENABLED and request.endpoint not in (None, 'metrics', 'static'):
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - g.request_started,
+            endpoint=request.endpoint,
+            status=response.status_code
+        )
+        if response.content_length is not None:
+            observe_bytes(f'response:{request.endpoint}', response.content_length)
+    return response
+
+
+@app.after_request
+def compress(response):
+    return compress_response(response, request)
+
+
+@app.after_request
+def save_session(response):
+    """Persiste el estado de la sesión y emite la cookie si es nueva"""
+    if 'llama_handler' in g:
+        session_store.save(g.session_id, g.session_state)
+        if g.new_session:
+            response.set_cookie(
+                SESSION_COOKIE_NAME,
+                g.session_id,
+                max_age=SESSION_IDLE_TIMEOUT,
+                httponly=True,
+                samesite='Lax'
+            )
+            # Una respuesta con cookie de sesión nunca debe quedar en una caché compartida
+            response.cache_control.public = False
+            response.cache_control.private = True
+    return response
+
+
+def request_params():
+    """Parámetros de la solicitud: query string en GET, cuerpo JSON en POST"""
+    if request.method == 'GET':
+        return request.args
+    return request.get_json(silent=True) or {}
+
+
+def unavailable(error, message):
+    """503 con Retry-After para que el cliente no reintente de inmediato"""
+    response = jsonify({'error': message})
+    response.status_code = 503
+    retry_after = error.retry_after if isinstance(error, Overloaded) else OVERLOAD_RETRY_AFTER
+    response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
+def cacheable(response, max_age=PLACES_HTTP_MAX_AGE):
+    """Agrega ETag y Cache-Control; responde 304 si el cliente ya tiene esa versión
+
+    Solo a GET: las respuestas a POST nunca se marcan reutilizables. La
+    caché HTTP es para clientes de la API; las páginas usan POST porque
+    necesitan que la ubicación quede en la sesión.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return response
+    response.add_etag()
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+def area_places(latitude, longitude, radius):
+    """Lugares del área; solo un POST la guarda como ubicación de la sesión
+
+    Una respuesta a GET puede servirse desde una caché HTTP compartida sin
+    llegar aquí, así que no debe cambiar el estado de la sesión.
+    """
+    if request.method != 'POST':
+        return overpass_api.get_places(latitude, longitude, radius)
+    llama_handler = get_handler()
+    llama_handler.set_current_location(latitude, longitude, radius)
+    return llama_handler.current_places
+
 
 @app.route('/')
 def principal():
@@ -36,82 +168,238 @@ def visit():
 def discover():
     return render_template('visit.html')
 
-@app.route('/get-places', methods=['POST'])
+@app.route('/get-places', methods=['GET', 'POST'])
 def get_places():
+    """Lugares cercanos ordenados por distancia, paginados con limit y cursor
+
+    fields= limita los campos de cada lugar; los campos vacíos se omiten.
+    sort=relevance ordena con utils.ranking, favoreciendo la categoría de
+    category= si se indica. open_now=1 deja solo los lugares que su horario
+    indica abiertos ahora; open_at= (fecha ISO 8601) los abiertos en ese
+    momento. El cursor de la página siguiente va en la cabecera X-Next-Cursor.
+    Con POST el área queda además como ubicación actual de la sesión.
+    """
     try:
-        data = request.json
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
-        radius = data.get('radius', SEARCH_RADIUS)
-        
-        if not all([latitude, longitude]):
+        data = request_params()
+        try:
+            latitude = float(data['latitude'])
+            longitude = float(data['longitude'])
+            radius = float(data.get('radius', SEARCH_RADIUS))
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("Coordenadas inválidas")
+            if not 0 < radius <= PLACES_MAX_RADIUS:
+                raise ValueError(f"El radio debe ser mayor que 0 y de a lo sumo {PLACES_MAX_RADIUS} metros")
+            limit = parse_limit(data.get('limit'))
+            offset = decode_cursor(data.get('cursor'))
+            only = parse_fields(data.get('fields'))
+            sort = data.get('sort') or 'distance'
+            category = data.get('category') or None
+            if sort not in ('distance', 'relevance'):
+                raise ValueError("sort debe ser 'distance' o 'relevance'")
+            if category is not None and category not in PLACE_CATEGORIES:
+                raise ValueError(f"Categorías válidas: {', '.join(PLACE_CATEGORIES)}")
+            open_now = str(data.get('open_now', '')).lower() in ('1', 'true')
+            open_at = None
+            if data.get('open_at'):
+                try:
+                    open_at = minute_of_week(datetime.fromisoformat(data['open_at']))
+                except ValueError:
+                    raise ValueError("open_at debe ser una fecha ISO 8601 (2025-01-31T18:30)")
+            elif open_now:
+                open_at = minute_of_week()
+        except KeyError:
             return jsonify({"error": "Se requieren latitud y longitud"}), 400
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e) or "Parámetros inválidos"}), 400
         
-        logger.info(f"Buscando lugares en ({latitude}, {longitude}) con radio {radius}m")
+        logger.info("Buscando lugares", extra=fields(latitude=latitude, longitude=longitude, radius=radius))
         
-        # Obtener lugares usando Overpass API
-        places = overpass_api.get_places(latitude, longitude, radius)
+        places = area_places(latitude, longitude, radius)
         
         if places:
-            # Actualizar ubicación actual y lugares en el handler
-            llama_handler.set_current_location(latitude, longitude)
-            llama_handler.current_places = places
-            
             # Filtrar lugares cercanos
-            nearby_places = get_nearby_places(
-                latitude, longitude, 
-                radius, places
-            )
-            return jsonify(nearby_places)
+            if sort == 'relevance':
+                with timed('rank'):
+                    ranked, total = rank_places(
+                        places, latitude, longitude, offset + limit,
+                        category=category, max_distance=radius, open_at=open_at
+                    )
+                    page, next_cursor = paginate(ranked, limit, offset, total)
+            else:
+                with timed('filter'):
+                    if open_at is not None:
+                        places = filter_open(places, open_at)
+                    nearby_places = get_nearby_places(
+                        latitude, longitude, 
+                        radius, places
+                    )
+                    page, next_cursor = paginate(nearby_places, limit, offset)
+            with timed('serialize'):
+                body = places_to_json(page, compact=True, only=only)
+            response = Response(body, mimetype='application/json')
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            # "Abierto ahora" cambia con la hora: no reutilizar la respuesta por mucho tiempo
+            return cacheable(response, PLACES_OPEN_NOW_MAX_AGE if open_now else PLACES_HTTP_MAX_AGE)
         
         return jsonify({"message": "No se encontraron lugares cercanos."}), 200
             
+    except UpstreamError as e:
+        logger.error("Overpass no disponible", extra=fields(endpoint='get_places', error=str(e)))
+        return unavailable(e, "El servicio de lugares no está disponible")
     except Exception as e:
-        logger.error(f"Error en get_places: {str(e)}", exc_info=True)
+        logger.error("Error en get_places", exc_info=True)
         return jsonify({"error": "Error al buscar lugares"}), 500
 
-@app.route('/geocode', methods=['POST'])
+def _coordinates(lat, lon):
+    """(lat, lon) como floats; lanza ValueError si no son coordenadas válidas"""
+    lat, lon = float(lat), float(lon)
+    # Las comparaciones con NaN son falsas, así que también descarta NaN e infinitos
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Coordenadas inválidas")
+    return lat, lon
+
+def _batch_points(data):
+    """Puntos (lat, lon, radio) de una consulta por lotes; lanza ValueError si no son válidos"""
+    if data.get('polyline'):
+        corridor = float(data.get('corridor', BATCH_DEFAULT_CORRIDOR))
+        if not 0 < corridor <= BATCH_MAX_RADIUS:
+            raise ValueError("Ancho de corredor inválido")
+        samples = densify_polyline([_coordinates(lat, lon) for lat, lon in data['polyline']], corridor)
+        if len(samples) > BATCH_MAX_POLYLINE_SAMPLES:
+            raise ValueError("La ruta es demasiado larga para el ancho de corredor indicado")
+        return [(lat, lon, corridor) for lat, lon in samples]
+    
+    points = [
+        (*_coordinates(point['latitude'], point['longitude']), float(point.get('radius', SEARCH_RADIUS)))
+        for point in data.get('points', [])
+    ]
+    if not points:
+        raise ValueError("Se requieren puntos o una polilínea")
+    if len(points) > BATCH_MAX_POINTS:
+        raise ValueError(f"Máximo {BATCH_MAX_POINTS} puntos por consulta")
+    if any(not 0 < radius <= BATCH_MAX_RADIUS for _, _, radius in points):
+        raise ValueError("Radio inválido")
+    return points
+
+@app.route('/get-places/batch', methods=['POST'])
+def get_places_batch():
+    """Lugares para varios puntos o a lo largo de una ruta en una sola solicitud"""
+    try:
+        data = request.json or {}
+        try:
+            points = _batch_points(data)
+            limit = min(parse_limit(data.get('limit'), BATCH_MAX_PLACES_PER_POINT), BATCH_MAX_PLACES_PER_POINT)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": str(e) or "Consulta inválida"}), 400
+        
+        logger.info("Buscando lugares por lotes", extra=fields(points=len(points)))
+        results = overpass_api.get_places_batch(points, limit=limit)
+        
+        with timed('serialize'):
+            body = '{"results":[' + ','.join(
+                payload_to_json({'latitude': lat, 'longitude': lon, 'radius': radius}, places)
+                for (lat, lon, radius), places in zip(points, results)
+            ) + ']}'
+        return Response(body, mimetype='application/json')
+    
+    except UpstreamError as e:
+        logger.error("Overpass no disponible", extra=fields(endpoint='get_places_batch', error=str(e)))
+        return unavailable(e, "El servicio de lugares no está disponible")
+    except Exception as e:
+        logger.error("Error en get_places_batch", exc_info=True)
+        return jsonify({"error": "Error al buscar lugares"}), 500
+
+@app.route('/geocode', methods=['GET', 'POST'])
 def geocode_location():
+    """Geocodifica un lugar y retorna la primera página de lugares cercanos
+
+    Con POST el lugar queda además como ubicación actual de la sesión.
+    """
     try:
-        data = request.json
+        data = request_params()
         place_name = data.get('place_name')
         
         if not place_name:
             return jsonify({'error': 'Nombre del lugar no proporcionado'}), 400
+        
+        try:
+            limit = parse_limit(data.get('limit'))
+            offset = decode_cursor(data.get('cursor'))
+            only = parse_fields(data.get('fields'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e) or 'Parámetros inválidos'}), 400
             
-        logger.info(f"Geocodificando: {place_name}")
+        logger.info("Geocodificando", extra=fields(place_name=place_name))
         
         try:
-            location = geolocator.geocode(place_name, timeout=NOMINATIM_TIMEOUT)
+            location = geocoder.geocode(place_name, timeout=NOMINATIM_TIMEOUT)
         except GeocoderTimedOut:
             return jsonify({'error': 'Tiempo de espera agotado'}), 408
+        except Overloaded as e:
+            return unavailable(e, 'El servicio de geocodificación está saturado')
             
         if location:
-            logger.info(f"Ubicación encontrada: {location.address}")
+            logger.info("Ubicación encontrada", extra=fields(address=location.address))
             
-            # Actualizar ubicación y buscar lugares
-            llama_handler.set_current_location(location.latitude, location.longitude)
-            places = overpass_api.get_places(
-                location.latitude, 
-                location.longitude, 
-                SEARCH_RADIUS
-            )
+            places = area_places(location.latitude, location.longitude, SEARCH_RADIUS)
             
-            return jsonify({
+            with timed('filter'):
+                nearby_places = get_nearby_places(
+                    location.latitude, location.longitude,
+                    SEARCH_RADIUS, places
+                )
+                page, next_cursor = paginate(nearby_places, limit, offset)
+            
+            payload = {
                 'latitude': location.latitude,
                 'longitude': location.longitude,
                 'address': location.address,
-                'places': places
-            })
+                'total': len(nearby_places)
+            }
+            if next_cursor:
+                payload['next_cursor'] = next_cursor
+            with timed('serialize'):
+                body = payload_to_json(payload, page, compact=True, only=only)
+            return cacheable(Response(body, mimetype='application/json'))
             
         return jsonify({'error': 'No se encontró el lugar'}), 404
             
+    except UpstreamError as e:
+        logger.error("Overpass no disponible", extra=fields(endpoint='geocode', error=str(e)))
+        return unavailable(e, 'El servicio de lugares no está disponible')
     except Exception as e:
-        logger.error(f"Error en geocode: {str(e)}", exc_info=True)
+        logger.error("Error en geocode", exc_info=True)
         return jsonify({'error': 'Error al geocodificar ubicación'}), 500
 
+@app.route('/autocomplete')
+def autocomplete():
+    """Sugerencias del nomenclátor local para lo que se lleva escrito"""
+    query = request.args.get('q', '')[:GAZETTEER_MAX_QUERY_LENGTH]
+    try:
+        limit = min(parse_limit(request.args.get('limit'), GAZETTEER_SUGGESTIONS), GAZETTEER_SUGGESTIONS)
+    except ValueError as e:
+        return jsonify({'error': str(e) or 'Parámetros inválidos'}), 400
+    
+    with timed('autocomplete'):
+        suggestions = [
+            {
+                'name': gazetteer.label(entry),
+                'latitude': entry.latitude,
+                'longitude': entry.longitude,
+                'kind': entry.kind
+            }
+            for entry in gazetteer.complete(query, limit)
+        ]
+    body = json.dumps({'query': query, 'results': suggestions}, ensure_ascii=False)
+    return cacheable(Response(body, mimetype='application/json'))
+
 @app.route('/chat', methods=['POST'])
-def chat():
+async def chat():
+    # Flask corre esta vista en un bucle de eventos dentro del worker WSGI: el hilo
+    # queda ocupado toda la solicitud. Lo asíncrono aporta el límite de tiempo por
+    # etapa; para que los chats en espera no ocupen workers hace falta un servidor
+    # ASGI con un framework asíncrono (por ejemplo Quart, con la misma API)
     try:
         data = request.json
         user_message = data.get('message')
@@ -119,27 +407,64 @@ def chat():
         if not user_message:
             return jsonify({"error": "Mensaje vacío"}), 400
         
-        logger.info(f"Mensaje recibido: {user_message}")
-        logger.debug(f"Estado actual - Ubicación: {llama_handler.current_location}, "
-                    f"Lugares: {len(llama_handler.current_places)}")
+        logger.info("Mensaje recibido", extra=fields(message=user_message))
+        llama_handler = get_handler()
+        logger.debug("Estado actual", extra=fields(
+            location=llama_handler.current_location, places=len(llama_handler.current_places)
+        ))
         
-        response = llama_handler.query_places(user_message)
-        logger.info(f"Respuesta generada: {response[:100]}...")
+        response = await llama_handler.query_places_async(user_message)
+        logger.debug("Respuesta generada", extra=fields(response=response[:100]))
         
         return jsonify({"response": response})
         
     except Exception as e:
-        logger.error(f"Error en chat: {str(e)}", exc_info=True)
+        logger.error("Error en chat", exc_info=True)
         return jsonify({"error": "Error al procesar mensaje"}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chat con la respuesta en partes (NDJSON): ubicación, lugares y respuesta final"""
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message')
+    
+    if not user_message:
+        return jsonify({"error": "Mensaje vacío"}), 400
+    
+    logger.info("Mensaje recibido", extra=fields(message=user_message, stream=True))
+    llama_handler = get_handler()
+    
+    def generate():
+        try:
+            for event in llama_handler.iter_query_events(user_message):
+                yield json.dumps(event, ensure_ascii=False) + '\n'
+        finally:
+            # after_request ya guardó la sesión antes de generar el cuerpo
+            session_store.save(g.session_id, g.session_state)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/places-summary')
 def places_summary():
     try:
-        summary = llama_handler.get_places_summary()
+        llama_handler = get_handler()
+        with timed('format'):
+            summary = llama_handler.get_places_summary()
         return jsonify({"summary": summary})
     except Exception as e:
-        logger.error(f"Error en places_summary: {str(e)}", exc_info=True)
+        logger.error("Error en places_summary", exc_info=True)
         return jsonify({"error": "Error al generar resumen"}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Métricas desactivadas"}), 404
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
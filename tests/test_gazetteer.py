@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from utils.gazetteer import Gazetteer, normalize_query
+
+
+@pytest.fixture
+def gazetteer():
+    gazetteer = Gazetteer(suggestions=5)
+    gazetteer.add('Costa Rica', 9.93, -84.08, 'country')
+    gazetteer.add('Guanacaste', 10.6, -85.4, 'state')
+    gazetteer.add('San José', 9.9333, -84.0833, 'city', context='San José')
+    gazetteer.add('Liberia', 10.6346, -85.4407, 'city', context='Guanacaste')
+    gazetteer.add('San Isidro', 9.37, -83.70, 'town', context='San José')
+    gazetteer.add('Sabana Norte', 9.94, -84.10, 'suburb', context='San José')
+    # Un POI con nombre de ciudad no entra en lookup()
+    gazetteer.add('Liberia', 9.93, -84.05, 'restaurant')
+    gazetteer.finalize()
+    return gazetteer
+
+
+def test_normalize_query():
+    assert normalize_query('  ¿San   José?! ') == 'san jose'
+
+
+def test_lookup_exact_name_ignores_accents(gazetteer):
+    assert gazetteer.lookup('san jose').name == 'San José'
+    assert gazetteer.lookup('Cartago') is None
+
+
+def test_lookup_skips_points_of_interest(gazetteer):
+    assert gazetteer.lookup('Liberia').kind == 'city'
+
+
+def test_lookup_with_context(gazetteer):
+    assert gazetteer.lookup('Liberia, Costa Rica').name == 'Liberia'
+    # Con require_context un nombre suelto puede ser de cualquier país
+    assert gazetteer.lookup('Liberia', require_context=True) is None
+    assert gazetteer.lookup('Liberia, Guanacaste', require_context=True).name == 'Liberia'
+    assert gazetteer.lookup('Liberia, Costa Rica', require_context=True).name == 'Liberia'
+    # Un asentamiento de otra provincia no sirve de contexto
+    assert gazetteer.lookup('Liberia, San Isidro', require_context=True) is None
+    assert gazetteer.lookup('Liberia, Narnia') is None
+
+
+def test_complete_by_prefix_and_inner_word(gazetteer):
+    assert [entry.name for entry in gazetteer.complete('san')][:2] == ['San José', 'San Isidro']
+    assert gazetteer.complete('jose')[0].name == 'San José'
+    assert gazetteer.complete('') == []
+
+
+def test_complete_tolerates_typos(gazetteer):
+    assert gazetteer.complete('Guanacsate')[0].name == 'Guanacaste'
+    assert gazetteer.complete('xyzw') == []
+
+
+def test_reverse_returns_nearest_settlement(gazetteer):
+    assert gazetteer.reverse(9.935, -84.085).name == 'San José'
+    # Países y provincias no nombran una coordenada
+    assert gazetteer.reverse(10.6, -85.4, max_distance=1000) is None
+
+
+def test_label_adds_context(gazetteer):
+    assert Gazetteer.label(gazetteer.lookup('Liberia')) == 'Liberia, Guanacaste'
+    assert Gazetteer.label(gazetteer.lookup('San José')) == 'San José'
+
+
+def test_load_overpass_extract(tmp_path):
+    path = tmp_path / 'extract.json'
+    path.write_text(json.dumps({'elements': [
+        {'type': 'node', 'lat': 10.0, 'lon': -84.2, 'tags': {'name': 'Alajuela', 'place': 'city', 'population': '50000'}},
+        {'type': 'relation', 'center': {'lat': 10.3, 'lon': -84.4},
+         'tags': {'name': 'Alajuela', 'admin_level': '4', 'boundary': 'administrative'}},
+        {'type': 'node', 'lat': 10.0, 'lon': -84.2, 'tags': {'name': 'Sin tipo'}},
+    ]}), encoding='utf-8')
+    gazetteer = Gazetteer()
+    assert gazetteer.load_file(str(path)) == 2
+    # La ciudad le gana a la provincia del mismo nombre
+    assert gazetteer.lookup('Alajuela').kind == 'city'
@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from utils.ingest import ingest, main
+from utils.poi_store import MANIFEST_NAME, ShardedPOIStore
+
+CELL_DEG = 0.01
+SHARD_DEG = 0.1
+
+
+def element(i, lat, lon, name=None, timestamp='2024-01-01T00:00:00Z'):
+    return {
+        'type': 'node', 'id': i, 'lat': lat, 'lon': lon, 'timestamp': timestamp,
+        'tags': {'amenity': 'restaurant', 'name': name or f'Soda {i}'}
+    }
+
+
+def write_extract(path, elements):
+    path.write_text(json.dumps({'elements': elements}), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def extract(tmp_path):
+    # Dos grupos en fragmentos distintos de 0.1 grados
+    elements = [element(i, 9.93 + i * 0.001, -84.08) for i in range(10)]
+    elements += [element(100 + i, 10.63 + i * 0.001, -85.44) for i in range(5)]
+    return write_extract(tmp_path / 'cr.json', elements)
+
+
+def run(extract, output_dir, **kwargs):
+    return ingest([extract], str(output_dir), workers=1, shard_deg=SHARD_DEG, cell_deg=CELL_DEG, **kwargs)
+
+
+def manifest(output_dir):
+    with open(os.path.join(output_dir, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_import_writes_shards_and_manifest(extract, tmp_path):
+    output_dir = tmp_path / 'poi'
+    summary = run(extract, output_dir)
+    assert (summary['places'], summary['shards'], summary['rebuilt']) == (15, 2, 2)
+
+    store = ShardedPOIStore(str(output_dir))
+    assert len(store) == 15
+    assert len(store.nearby(9.935, -84.08, 2000)) == 10
+    # Sin bounds los fragmentos solo complementan a Overpass
+    assert not store.covers(9.935, -84.08, 100)
+
+
+def test_unchanged_extract_is_not_read_again(extract, tmp_path, monkeypatch):
+    output_dir = tmp_path / 'poi'
+    run(extract, output_dir)
+    before = manifest(output_dir)
+
+    def fail(path):
+        raise AssertionError("el extracto no debía leerse")
+
+    monkeypatch.setattr('utils.ingest.iter_extract', fail)
+    summary = run(extract, output_dir)
+    assert (summary['places'], summary['shards'], summary['rebuilt']) == (15, 2, 0)
+    assert manifest(output_dir) == before
+
+
+def test_changed_extract_rebuilds_only_changed_shards(extract, tmp_path):
+    output_dir = tmp_path / 'poi'
+    run(extract, output_dir)
+    data = json.loads(open(extract, encoding='utf-8').read())
+    data['elements'][0] = element(0, 9.93, -84.08, name='Soda Renovada', timestamp='2025-01-01T00:00:00Z')
+    write_extract(tmp_path / 'cr.json', data['elements'])
+
+    summary = run(extract, output_dir)
+    assert summary['rebuilt'] == 1
+    store = ShardedPOIStore(str(output_dir))
+    assert 'Soda Renovada' in {place.name for place in store.nearby(9.93, -84.08, 100)}
+
+    # --force lee el extracto y recompila todo aunque nada cambie
+    assert run(extract, output_dir, force=True)['rebuilt'] == 2
+
+
+def test_bounds_declare_coverage(extract, tmp_path):
+    output_dir = tmp_path / 'poi'
+    summary = run(extract, output_dir, bounds=(9.9, -84.1, 10.0, -84.0))
+    assert summary['covered'] == 100
+    store = ShardedPOIStore(str(output_dir))
+    assert store.covers(9.95, -84.05, 500)
+    assert not store.covers(10.63, -85.44, 500)
+    # Cambiar el rectángulo cubierto obliga a leer de nuevo
+    assert run(extract, output_dir)['covered'] == 0
+
+
+def test_main_rejects_invalid_bounds(extract, tmp_path):
+    with pytest.raises(SystemExit):
+        main([extract, '-o', str(tmp_path / 'poi'), '--bounds', '10,-84,9,-83'])
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+from utils.opening_hours import (
+    MINUTES_PER_DAY, MINUTES_PER_WEEK, WEEK_BYTES, OpeningHoursIndex, compile_opening_hours,
+    filter_open, is_open, minute_of_week
+)
+from utils.place import Place
+
+
+def at(day, hour, minute=0):
+    """Minuto de la semana; day 0 es lunes"""
+    return day * MINUTES_PER_DAY + hour * 60 + minute
+
+
+def test_week_bitmap_has_one_bit_per_minute():
+    assert MINUTES_PER_WEEK == 10080
+    compiled = compile_opening_hours('24/7')
+    assert len(compiled) == WEEK_BYTES == 10080 // 8
+    assert all(is_open('24/7', minute) for minute in (0, at(3, 12), MINUTES_PER_WEEK - 1))
+
+
+@pytest.mark.parametrize('text, minute, expected', [
+    ('Mo-Fr 08:00-17:00', at(0, 8), True),
+    ('Mo-Fr 08:00-17:00', at(0, 17), False),  # el cierre no cuenta como abierto
+    ('Mo-Fr 08:00-17:00', at(0, 7, 59), False),
+    ('Mo-Fr 08:00-17:00', at(5, 12), False),
+    ('Mo-Fr 08:00-12:00, Sa 09:00-12:00', at(5, 10), True),
+    ('Mo-Su 08:00-20:00; Su off', at(6, 10), False),
+    ('Mo-Su 08:00-20:00; Su off', at(5, 10), True),
+    ('Fr-Mo 10:00-14:00', at(6, 11), True),
+    ('Fr-Mo 10:00-14:00', at(2, 11), False),
+    ('Mo-Sa 18:00+', at(1, 23, 59), True),
+])
+def test_is_open(text, minute, expected):
+    assert is_open(text, minute) is expected
+
+
+def test_span_wraps_past_midnight():
+    text = 'Fr-Sa 20:00-02:00'
+    assert is_open(text, at(4, 23))
+    assert is_open(text, at(5, 1, 59))  # sábado de madrugada, por el viernes
+    assert not is_open(text, at(5, 2))
+    assert not is_open(text, at(4, 1))  # el jueves no abre
+
+
+def test_sunday_night_wraps_to_monday_morning():
+    text = 'Su 22:00-03:00'
+    assert is_open(text, at(6, 23))
+    assert is_open(text, at(0, 2, 59))
+    assert not is_open(text, at(0, 3))
+
+
+@pytest.mark.parametrize('text', [
+    '', 'No disponible', 'Jan-Mar 08:00-12:00', 'sunrise-sunset', 'Mo-Fr 08:00-17:00 "con cita"', 'unknown'
+])
+def test_unsupported_syntax_is_unknown(text):
+    assert compile_opening_hours(text) is None
+    assert is_open(text, at(0, 12)) is None
+
+
+def test_index_filters_in_one_pass():
+    places = [
+        Place('A', 0, 0, opening_hours='Mo-Fr 08:00-17:00'),
+        Place('B', 0, 0, opening_hours='Mo-Fr 08:00-17:00'),
+        Place('C', 0, 0, opening_hours='Sa-Su 10:00-14:00'),
+        Place('D', 0, 0, opening_hours='sunrise-sunset'),
+    ]
+    index = OpeningHoursIndex(places)
+    # Las cadenas repetidas comparten fila
+    assert len(index.table) == 2
+    assert index.known().tolist() == [True, True, True, False]
+    assert index.open_mask(at(0, 9)).tolist() == [True, True, False, False]
+    assert [p.name for p in filter_open(places, at(6, 11))] == ['C']
+    assert filter_open([], at(0, 9)) == []
+
+
+def test_minute_of_week_for_naive_datetime():
+    # 2025-01-27 es lunes
+    assert minute_of_week(datetime(2025, 1, 27, 0, 0)) == 0
+    assert minute_of_week(datetime(2025, 1, 31, 18, 30)) == at(4, 18, 30)
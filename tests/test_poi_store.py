@@ -0,0 +1,101 @@
+import struct
+
+import pytest
+
+from utils.place import Place
+from utils.poi_store import (
+    COLUMNS_MAGIC, COLUMNS_VERSION, ColumnarPOIStore, POIStore, is_current_columnar_file
+)
+
+CELL_DEG = 0.01
+LAT, LON = 9.9333, -84.0833
+
+
+def sample_places():
+    return [
+        Place('Soda Tala', LAT, LON, type='restaurant', opening_hours='Mo-Su 08:00-20:00', website='https://tala.cr'),
+        Place('Museo de Jade', LAT + 0.004, LON, type='museum', phone='2222-2222'),
+        Place('Café Lejano', LAT + 0.05, LON + 0.05, type='cafe'),
+        Place('Ferretería', LAT, LON + 0.001, type='hardware'),
+    ]
+
+
+@pytest.fixture
+def memory_store():
+    store = POIStore(CELL_DEG)
+    store.add_places(sample_places())
+    return store
+
+
+@pytest.fixture
+def columnar(memory_store, tmp_path):
+    path = tmp_path / 'places.poi'
+    assert memory_store.save(str(path)) == 4
+    return ColumnarPOIStore(str(path))
+
+
+def names(places):
+    return sorted(place.name for place in places)
+
+
+def test_header_is_format_v2(columnar):
+    with open(columnar.path, 'rb') as f:
+        header = f.read(len(COLUMNS_MAGIC) + 4)
+    assert header[:len(COLUMNS_MAGIC)] == COLUMNS_MAGIC
+    assert struct.unpack_from('<I', header, len(COLUMNS_MAGIC))[0] == COLUMNS_VERSION == 2
+    assert is_current_columnar_file(columnar.path)
+    assert len(columnar) == 4
+
+
+def test_round_trip_keeps_fields(columnar):
+    place = next(p for p in columnar.nearby(LAT, LON, 100) if p.name == 'Soda Tala')
+    assert place == sample_places()[0]
+    assert place.description == ''
+
+
+def test_nearby_matches_memory_store(memory_store, columnar):
+    for radius in (50, 600, 10000):
+        assert names(columnar.nearby(LAT, LON, radius)) == names(memory_store.nearby(LAT, LON, radius))
+    # Los tipos que la aplicación no muestra se ignoran
+    assert 'Ferretería' not in names(columnar.nearby(LAT, LON, 1000))
+    assert names(columnar.nearby(LAT, LON, 1000, types=None)) == ['Ferretería', 'Museo de Jade', 'Soda Tala']
+
+
+def test_nearest_sets_distance(memory_store, columnar):
+    nearest = columnar.nearest(LAT, LON, 2)
+    assert [p.name for p in nearest] == ['Soda Tala', 'Museo de Jade']
+    assert nearest[0].distance == 0
+    assert [p.name for p in memory_store.nearest(LAT, LON, 2)] == ['Soda Tala', 'Museo de Jade']
+    assert columnar.nearest(LAT, LON, 5, max_radius=1000)[-1].name == 'Museo de Jade'
+
+
+def test_places_alone_do_not_declare_coverage(memory_store, columnar):
+    # Formato 2: una celda con algún POI no significa que estén todos
+    assert not memory_store.covers(LAT, LON, 100)
+    assert not columnar.covers(LAT, LON, 100)
+
+
+def test_declared_cells_and_rectangles_are_covered(tmp_path):
+    store = POIStore(CELL_DEG)
+    row, col = store._cell(LAT, LON)
+    store.add_places(sample_places(), covered_cells={(row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)})
+    path = tmp_path / 'covered.poi'
+    store.save(str(path))
+    for candidate in (store, ColumnarPOIStore(str(path))):
+        assert candidate.covers(LAT, LON, 100)
+        assert not candidate.covers(LAT, LON, 5000)
+
+    store = POIStore(CELL_DEG)
+    store.add_places(sample_places(), coverage=[(9.0, -85.0, 11.0, -83.0)])
+    assert store.covers(LAT, LON, 5000)
+
+
+def test_older_format_is_rejected(memory_store, tmp_path):
+    path = tmp_path / 'old.poi'
+    memory_store.save(str(path))
+    data = bytearray(path.read_bytes())
+    struct.pack_into('<I', data, len(COLUMNS_MAGIC), 1)
+    path.write_bytes(bytes(data))
+    assert not is_current_columnar_file(str(path))
+    with pytest.raises(ValueError):
+        ColumnarPOIStore(str(path))
@@ -0,0 +1,46 @@
+from utils.query_parser import QueryParser, fold
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def parser():
+    return QueryParser()
+
+
+def test_fold_keeps_length():
+    assert fold('Qué Ñandú') == 'que nandu'
+    assert len(fold('İstanbul')) == len('İstanbul')
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Con acentos la frase se reconoce (antes quedaba como 'general' por la preposición)
+    ('Qué hay en Cartago', ('places', 'preguntas_generales', 'Cartago', False)),
+    ('¿qué hay en Cartago?', ('places', 'preguntas_generales', 'Cartago', False)),
+    # Nombre propio sin frase ni preposición conocida (antes no había ubicación)
+    ('Quiero ir a Paris', ('places', 'general', 'Paris', False)),
+    ('donde comer en San José', ('places', 'restaurantes', 'San José', False)),
+    ('restaurantes abiertos en Liberia', ('places', 'restaurantes', 'Liberia', True)),
+    ('museos en Heredia abiertos ahora', ('places', 'cultura', 'Heredia', True)),
+    ('Cielo Abierto en Heredia', ('places', 'general', 'Heredia', False)),
+    ('hola', ('greeting', None, None, False)),
+    ('quien eres', ('bot', None, None, False)),
+    ('gracias por todo', (None, 'general', None, False)),
+])
+def test_parse(parser, text, expected):
+    parsed = parser.parse(text)
+    assert (parsed.intent, parsed.category, parsed.location, parsed.open_now) == expected
+
+
+def test_phrases_match_whole_words(parser):
+    # 'arte en' no debe reconocerse dentro de 'parte en'
+    parsed = parser.parse('la parte en Limón')
+    assert parsed.category == 'general'
+    assert parsed.phrase == 'en'
+    assert parsed.location == 'Limón'
+
+
+def test_greeting_with_question_is_not_only_greeting(parser):
+    parsed = parser.parse('hola, que hay en Cartago')
+    assert parsed.intent == 'places'
+    assert parsed.location == 'Cartago'
@@ -0,0 +1,79 @@
+from utils.place import Place, PlaceSet
+from utils.ranking import features_for, name_quality, rank_places
+
+LAT, LON = 9.9333, -84.0833
+
+
+def place(name, dlat=0.0, type='restaurant', **fields):
+    return Place(name, LAT + dlat, LON, type=type, **fields)
+
+
+def test_name_quality_penalizes_generic_names():
+    assert name_quality('Restaurante') == 0.2
+    assert name_quality('Soda Tala') == 1.0
+    assert name_quality('') == 0.0
+    assert name_quality('SODA TALA') < name_quality('Soda Tala')
+
+
+def test_closer_place_wins_with_equal_data():
+    places = [place('Lejos Café', dlat=0.02), place('Cerca Café', dlat=0.001)]
+    ranked, total = rank_places(places, LAT, LON, k=2)
+    assert [p.name for p in ranked] == ['Cerca Café', 'Lejos Café']
+    assert total == 2
+
+
+def test_richer_place_wins_at_same_distance():
+    places = [
+        place('Soda Pobre', dlat=0.001),
+        place('Soda Rica', dlat=0.001, website='https://example.com', phone='2222-2222',
+              opening_hours='Mo-Su 08:00-20:00', description='Casados'),
+    ]
+    ranked, _ = rank_places(places, LAT, LON, k=1)
+    assert [p.name for p in ranked] == ['Soda Rica']
+
+
+def test_category_boosts_and_strict_filters():
+    places = [place('Museo de Jade', dlat=0.001, type='museum'), place('Soda Tala', dlat=0.001)]
+    ranked, _ = rank_places(places, LAT, LON, k=2, category='cultura')
+    assert ranked[0].name == 'Museo de Jade'
+    ranked, total = rank_places(places, LAT, LON, k=2, category='restaurantes', strict=True)
+    assert [p.name for p in ranked] == ['Soda Tala']
+    assert total == 1
+
+
+def test_max_distance_filters_and_sets_distance():
+    places = [place('Cerca Café', dlat=0.001), place('Lejos Café', dlat=0.05)]
+    ranked, total = rank_places(places, LAT, LON, k=10, max_distance=1000)
+    assert [p.name for p in ranked] == ['Cerca Café']
+    assert total == 1
+    assert 100 <= ranked[0].distance <= 120
+
+
+def test_open_at_keeps_only_open_places():
+    places = [
+        place('Abierto Café', opening_hours='Mo-Su 08:00-20:00'),
+        place('Cerrado Café', opening_hours='Mo-Su 21:00-23:00'),
+        place('Sin Horario Café'),
+    ]
+    monday_noon = 12 * 60
+    ranked, total = rank_places(places, LAT, LON, k=10, open_at=monday_noon)
+    assert [p.name for p in ranked] == ['Abierto Café']
+    assert total == 1
+
+
+def test_ties_keep_original_order():
+    places = [place(f'Soda Número {i}', dlat=0.001) for i in range(5)]
+    ranked, _ = rank_places(places, LAT, LON, k=3)
+    assert [p.name for p in ranked] == ['Soda Número 0', 'Soda Número 1', 'Soda Número 2']
+
+
+def test_empty_and_zero_k():
+    assert rank_places([], LAT, LON, k=5) == ([], 0)
+    assert rank_places([place('Soda Tala')], LAT, LON, k=0) == ([], 1)
+
+
+def test_features_are_reused_per_place_set():
+    places = PlaceSet([place('Soda Tala'), place('Museo de Jade', type='museum')])
+    assert features_for(places) is features_for(places)
+    same = PlaceSet([place('Soda Tala'), place('Museo de Jade', type='museum')])
+    assert features_for(same) is features_for(places)
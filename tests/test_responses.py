@@ -0,0 +1,95 @@
+import base64
+import gzip
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+from config import COMPRESS_MIN_BYTES, PLACES_MAX_PAGE_SIZE, PLACES_PAGE_SIZE
+from utils.responses import (
+    compress_response, decode_cursor, encode_cursor, paginate, parse_fields, parse_limit
+)
+
+
+def test_cursor_round_trip_is_opaque_and_url_safe():
+    for offset in (0, 1, 100, 123456):
+        cursor = encode_cursor(offset)
+        assert '=' not in cursor and '/' not in cursor and '+' not in cursor
+        assert decode_cursor(cursor) == offset
+
+
+def test_empty_cursor_is_first_page():
+    assert decode_cursor(None) == 0
+    assert decode_cursor('') == 0
+
+
+@pytest.mark.parametrize('cursor', [
+    'no es base64!',
+    base64.urlsafe_b64encode(b'x:10').decode(),
+    base64.urlsafe_b64encode(b'o:-1').decode(),
+    base64.urlsafe_b64encode(b'o:diez').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        decode_cursor(cursor)
+
+
+def test_paginate_walks_every_item_once():
+    items = list(range(25))
+    seen, cursor = [], None
+    while True:
+        page, cursor = paginate(items, 10, decode_cursor(cursor))
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == items
+
+
+def test_paginate_with_partial_list_uses_total():
+    # El ranking solo ordena hasta esta página pero informa cuántos hay
+    page, cursor = paginate([1, 2, 3], 3, 0, total=10)
+    assert page == [1, 2, 3]
+    assert decode_cursor(cursor) == 3
+    assert paginate([1, 2, 3], 3, 0, total=3)[1] is None
+
+
+def test_parse_limit():
+    assert parse_limit(None) == PLACES_PAGE_SIZE
+    assert parse_limit('') == PLACES_PAGE_SIZE
+    assert parse_limit('7') == 7
+    assert parse_limit(10 ** 6) == PLACES_MAX_PAGE_SIZE
+    for value in ('0', '-5', 'diez'):
+        with pytest.raises(ValueError):
+            parse_limit(value)
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields('name, distance,') == ('name', 'distance')
+    with pytest.raises(ValueError, match='secreto'):
+        parse_fields('name,secreto')
+
+
+def request_with(accept_encoding):
+    return Request(EnvironBuilder(headers={'Accept-Encoding': accept_encoding}).get_environ())
+
+
+def test_compresses_large_json_with_gzip():
+    body = '[' + ','.join('{"name":"Soda Tala"}' for _ in range(200)) + ']'
+    response = Response(body, mimetype='application/json')
+    response.set_etag('abc')
+    response = compress_response(response, request_with('gzip'))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()).decode() == body
+    assert 'Accept-Encoding' in response.vary
+    assert response.get_etag() == ('abc', True)
+
+
+def test_small_or_binary_responses_are_not_compressed():
+    small = compress_response(Response('x' * (COMPRESS_MIN_BYTES - 1), mimetype='application/json'), request_with('gzip'))
+    assert 'Content-Encoding' not in small.headers
+    binary = compress_response(Response(b'\0' * 5000, mimetype='image/png'), request_with('gzip'))
+    assert 'Content-Encoding' not in binary.headers
+    plain = compress_response(Response('x' * 5000, mimetype='text/plain'), request_with('identity'))
+    assert 'Content-Encoding' not in plain.headers
@@ -0,0 +1,78 @@
+import pytest
+
+from utils.place import Place
+from utils.session_store import MemorySessionBackend, SessionState, SessionStore, SQLiteSessionBackend
+
+
+def state_at(lat=9.93, lon=-84.08, places=1):
+    return SessionState((lat, lon), [Place(f'Soda {i}', lat, lon, type='restaurant') for i in range(places)])
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return SessionStore(MemorySessionBackend())
+    return SessionStore(SQLiteSessionBackend(str(tmp_path / 'sessions.db')))
+
+
+def test_unknown_or_forged_ids_get_a_new_session(store):
+    for session_id in (None, '', 'corto', 'x' * 30, '../../etc/passwd' + 'a' * 20):
+        new_id, state, is_new = store.open(session_id)
+        assert is_new
+        assert new_id != session_id and store.is_valid_id(new_id)
+        assert state.current_location is None and len(state.current_places) == 0
+
+
+def test_saved_session_is_reopened(store):
+    session_id, _, _ = store.open(None)
+    store.save(session_id, state_at(places=3))
+    reopened_id, state, is_new = store.open(session_id)
+    assert (reopened_id, is_new) == (session_id, False)
+    assert state.current_location == (9.93, -84.08)
+    assert [place.name for place in state.current_places] == ['Soda 0', 'Soda 1', 'Soda 2']
+
+
+def test_expired_sessions_are_not_reopened(tmp_path):
+    for backend in (MemorySessionBackend(idle_timeout=-1), SQLiteSessionBackend(str(tmp_path / 's.db'), idle_timeout=-1)):
+        store = SessionStore(backend)
+        session_id = store.new_id()
+        store.save(session_id, state_at())
+        assert store.open(session_id)[2]
+
+
+def test_memory_backend_evicts_least_recent_by_count():
+    backend = MemorySessionBackend(max_entries=2)
+    store = SessionStore(backend)
+    ids = [store.new_id() for _ in range(3)]
+    store.save(ids[0], state_at())
+    store.save(ids[1], state_at())
+    store.open(ids[0])  # el acceso lo vuelve el más reciente
+    store.save(ids[2], state_at())
+    assert not store.open(ids[0])[2]
+    assert store.open(ids[1])[2]
+    assert backend.stats()['evictions'] == 1
+
+
+def test_memory_backend_bounds_bytes():
+    backend = MemorySessionBackend(max_bytes=20000)
+    store = SessionStore(backend)
+    for _ in range(20):
+        store.save(store.new_id(), state_at(places=50))
+    stats = backend.stats()
+    assert 0 < stats['bytes'] <= 20000
+    assert stats['evictions'] > 0
+
+
+def test_backend_errors_do_not_break_requests(caplog):
+    class Broken:
+        def get(self, session_id):
+            raise OSError('disco lleno')
+
+        def put(self, session_id, state):
+            raise OSError('disco lleno')
+
+    store = SessionStore(Broken())
+    session_id = store.new_id()
+    assert store.open(session_id)[2]
+    store.save(session_id, state_at())
+    assert 'Error al guardar la sesión' in caplog.text
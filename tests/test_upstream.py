@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from utils.upstream import (
+    AdmissionGate, CircuitBreaker, Overloaded, UpstreamClient, UpstreamError, parse_retry_after
+)
+
+PRIMARY = 'http://primary.test/api'
+REPLICA = 'http://replica.test/api'
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Responde con lo programado para cada URL, en orden, y registra las llamadas"""
+
+    def __init__(self, script):
+        self.script = {url: list(replies) for url, replies in script.items()}
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        self.calls.append(url)
+        reply = self.script[url].pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def client_with(script, endpoints=(PRIMARY, REPLICA), **kwargs):
+    client = UpstreamClient(list(endpoints), name='test', backoff_base=0, backoff_max=0, **kwargs)
+    client.session = FakeSession(script)
+    return client
+
+
+def test_retries_transient_errors_then_succeeds():
+    client = client_with({PRIMARY: [FakeResponse(503), requests.ConnectionError('caída'), FakeResponse(200)]})
+    assert client.get({}).status_code == 200
+    assert client.session.calls == [PRIMARY] * 3
+    assert client.retries == 2
+    assert client.breakers[PRIMARY].state == 'closed'
+
+
+def test_fails_over_to_replica_after_retries():
+    client = client_with({PRIMARY: [FakeResponse(502)] * 3, REPLICA: [FakeResponse(200)]}, max_retries=2)
+    assert client.get({}).status_code == 200
+    assert client.session.calls == [PRIMARY] * 3 + [REPLICA]
+    assert client.failovers == 1
+
+
+@pytest.mark.parametrize('status', [400, 404])
+def test_client_errors_are_not_retried_nor_counted_against_the_endpoint(status):
+    rejected = FakeResponse(status)
+    client = client_with({PRIMARY: [rejected], REPLICA: [FakeResponse(200)]})
+    with pytest.raises(UpstreamError, match='solicitud rechazada'):
+        client.get({})
+    # Otra réplica respondería lo mismo: ni reintento ni respaldo
+    assert client.session.calls == [PRIMARY]
+    assert rejected.closed
+    assert client.breakers[PRIMARY].failures == 0
+
+
+def test_rate_limit_is_retried_with_retry_after():
+    client = client_with({PRIMARY: [FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)]})
+    assert client.get({}).status_code == 200
+    assert client.session.calls == [PRIMARY, PRIMARY]
+
+
+def test_other_server_errors_go_straight_to_replica():
+    client = client_with({PRIMARY: [FakeResponse(500)], REPLICA: [FakeResponse(200)]})
+    assert client.get({}).status_code == 200
+    assert client.session.calls == [PRIMARY, REPLICA]
+    assert client.breakers[PRIMARY].failures == 1
+
+
+def test_open_breaker_skips_endpoint():
+    client = client_with({PRIMARY: [], REPLICA: [FakeResponse(200)]})
+    breaker = client.breakers[PRIMARY]
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert client.get({}).status_code == 200
+    assert client.session.calls == [REPLICA]
+
+
+def test_all_endpoints_failing_raises():
+    client = client_with({PRIMARY: [FakeResponse(504)] * 3, REPLICA: [FakeResponse(504)] * 3}, max_retries=2)
+    with pytest.raises(UpstreamError, match='todos los endpoints fallaron'):
+        client.get({})
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == 'half-open' and breaker.allow()
+    # Una prueba fallida en estado semiabierto vuelve a abrir
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert parse_retry_after('pronto') is None
+
+
+def test_admission_gate_sheds_when_queue_is_full():
+    gate = AdmissionGate('test', max_concurrent=1, max_queue=0, queue_timeout=1)
+    with gate.admit():
+        with pytest.raises(Overloaded) as excinfo:
+            with gate.admit():
+                pass
+    assert excinfo.value.retry_after == gate.retry_after
+    assert gate.stats() == {'in_flight': 0, 'queued': 0, 'admitted': 1, 'shed': 1}
+
+
+def test_admission_gate_queue_waits_for_a_turn():
+    gate = AdmissionGate('test', max_concurrent=1, max_queue=1, queue_timeout=2)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with gate.admit():
+            entered.set()
+            release.wait(1)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    entered.wait(1)
+    with pytest.raises(Overloaded):
+        with gate.admit(timeout=0.05):
+            pass
+    threading.Timer(0.05, release.set).start()
+    with gate.admit():
+        assert gate.stats()['in_flight'] == 1
+    thread.join()
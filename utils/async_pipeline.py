@@ -0,0 +1,48 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import CHAT_STAGE_BUDGET, UPSTREAM_POOL_SIZE
+
+# Hilos compartidos para las llamadas bloqueantes a servicios externos
+_executor = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix='upstream')
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el presupuesto de tiempo de la solicitud"""
+
+
+class Deadline:
+    """Presupuesto de tiempo total de una solicitud, repartido entre etapas"""
+
+    def __init__(self, budget, stage_budget=None):
+        self.budget = budget
+        self.stage_budget = stage_budget or CHAT_STAGE_BUDGET
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def stage_timeout(self, stage):
+        """Tiempo disponible para una etapa: su porción del total, sin pasar lo restante"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Sin tiempo para la etapa '{stage}'")
+        share = self.stage_budget.get(stage, 1.0)
+        return min(remaining, self.budget * share)
+
+
+async def run_stage(func, *args, stage_timeout=None, **kwargs):
+    """Ejecuta una función bloqueante en el pool de hilos con un límite de tiempo
+
+    Si la tarea que espera se cancela (límite agotado o cliente desconectado)
+    el resultado se descarta; la función recibe su propio timeout para que
+    el hilo también se libere pronto.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout=stage_timeout)
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    PLACES_CACHE_TTL, PLACES_CACHE_MAX_ENTRIES, PLACES_CACHE_PATH, TILE_CACHE_MAX_ENTRIES,
+    CACHE_STALE_TTL, CACHE_DISK_MAX_ENTRIES, CACHE_DISK_PURGE_EVERY
+)
+from utils.log_utils import fields
+from utils.metrics import count_cache, count_stale
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCacheBackend:
+    """Almacenamiento en disco para TTLCache, compartible entre reinicios
+
+    Cada purge_every escrituras se borran las entradas vencidas hace más de
+    stale_ttl y, si aún sobran, las que vencen primero hasta quedar en
+    max_entries por espacio de nombres.
+    """
+
+    def __init__(self, path, namespace='default', max_entries=CACHE_DISK_MAX_ENTRIES,
+                 stale_ttl=CACHE_STALE_TTL, purge_every=CACHE_DISK_PURGE_EVERY):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT, key TEXT, value BLOB, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (namespace, expires_at)")
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key):
+        """Retorna (valor, expira_en) o None si la clave no existe"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (self.namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at)
+            )
+            self._conn.commit()
+            self._writes += 1
+            purge = self._writes % self.purge_every == 0
+        if purge:
+            self.purge_expired()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            )
+            self._conn.commit()
+
+    def purge_expired(self, now=None):
+        """Elimina del disco las entradas que ya no sirven ni como respaldo y el exceso sobre max_entries"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND expires_at < ?",
+                (self.namespace, (now or time.time()) - self.stale_ttl)
+            )
+            if self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                    "SELECT key FROM cache WHERE namespace = ? "
+                    "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.namespace, self.namespace, self.max_entries)
+                )
+            self._conn.commit()
+
+
+class TTLCache:
+    """Caché LRU en memoria con expiración por tiempo y respaldo opcional en disco
+
+    Las entradas vencidas se conservan stale_ttl segundos más (mientras el LRU
+    no las desaloje) para get_stale(), que se usa cuando el servicio externo
+    no responde.
+    """
+
+    def __init__(self, max_entries=512, ttl=900, backend=None, name='cache', stale_ttl=CACHE_STALE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.backend = backend
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Retorna el valor guardado si existe y no ha vencido"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    count_cache(self.name, True)
+                    return value
+                if expires_at + self.stale_ttl < now:
+                    del self._data[key]
+
+        if self.backend is not None:
+            try:
+                stored = self.backend.get(key)
+            except Exception as e:
+                logger.warning("Error leyendo caché en disco", extra=fields(cache=self.name, error=str(e)))
+                stored = None
+            if stored is not None and stored[1] >= now:
+                with self._lock:
+                    self._store(key, stored[0], stored[1])
+                    self.hits += 1
+                count_cache(self.name, True)
+                return stored[0]
+
+        with self._lock:
+            self.misses += 1
+        count_cache(self.name, False)
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Guarda un valor con el TTL indicado (o el de la caché)"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expires_at)
+            except Exception as e:
+                logger.warning("Error escribiendo caché en disco", extra=fields(cache=self.name, error=str(e)))
+
+    def get_stale(self, key, default=None):
+        """Retorna el valor aunque haya vencido, si no pasó más de stale_ttl"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.backend is not None:
+            try:
+                entry = self.backend.get(key)
+            except Exception as e:
+                logger.warning("Error leyendo caché en disco", extra=fields(cache=self.name, error=str(e)))
+        if entry is None or entry[1] + self.stale_ttl < now:
+            return default
+        if entry[1] < now:
+            count_stale(self.name)
+        return entry[0]
+
+    def ttl_remaining(self, key):
+        """Segundos que le quedan a la entrada; None si no existe o ya venció"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.backend is not None:
+            try:
+                entry = self.backend.get(key)
+            except Exception as e:
+                logger.warning("Error leyendo caché en disco", extra=fields(cache=self.name, error=str(e)))
+        if entry is None or entry[1] < now:
+            return None
+        return entry[1] - now
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _store(self, key, value, expires_at):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] >= time.time()
+
+    def stats(self):
+        """Retorna contadores de aciertos y fallos"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+def quantize(value, precision):
+    """Ajusta una coordenada a la celda de la cuadrícula"""
+    return round(float(value), precision)
+
+
+def place_types_fingerprint(place_types):
+    """Huella corta del filtro PLACE_TYPES para invalidar la caché si cambia"""
+    encoded = json.dumps(place_types, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:8]
+
+
+def places_cache_key(lat, lon, radius, place_types, precision):
+    """Construye la clave de caché para una búsqueda de lugares"""
+    return (
+        f"{quantize(lat, precision):.{precision}f},"
+        f"{quantize(lon, precision):.{precision}f}:"
+        f"{int(radius)}:{place_types_fingerprint(place_types)}"
+    )
+
+
+_places_cache = None
+_places_cache_lock = threading.Lock()
+
+
+def get_places_cache():
+    """Retorna la caché compartida de resultados de Overpass"""
+    global _places_cache
+    if _places_cache is None:
+        with _places_cache_lock:
+            if _places_cache is None:
+                backend = None
+                if PLACES_CACHE_PATH:
+                    backend = SQLiteCacheBackend(PLACES_CACHE_PATH, namespace='places')
+                _places_cache = TTLCache(
+                    max_entries=PLACES_CACHE_MAX_ENTRIES,
+                    ttl=PLACES_CACHE_TTL,
+                    backend=backend,
+                    name='places'
+                )
+    return _places_cache
+
+
+def tile_cache_key(tile, place_types):
+    """Clave de caché de los lugares de una tesela"""
+    return f"{tile.z}/{tile.x}/{tile.y}:{place_types_fingerprint(place_types)}"
+
+
+_tile_cache = None
+_tile_cache_lock = threading.Lock()
+
+
+def get_tile_cache():
+    """Retorna la caché compartida de lugares por tesela"""
+    global _tile_cache
+    if _tile_cache is None:
+        with _tile_cache_lock:
+            if _tile_cache is None:
+                backend = None
+                if PLACES_CACHE_PATH:
+                    backend = SQLiteCacheBackend(PLACES_CACHE_PATH, namespace='tiles')
+                _tile_cache = TTLCache(
+                    max_entries=TILE_CACHE_MAX_ENTRIES,
+                    ttl=PLACES_CACHE_TTL,
+                    backend=backend,
+                    name='tiles'
+                )
+    return _tile_cache
@@ -0,0 +1,320 @@
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import unicodedata
+from collections import namedtuple
+import numpy as np
+from config import (
+    GAZETTEER_PATHS, GAZETTEER_SUGGESTIONS, GAZETTEER_REVERSE_MAX_DISTANCE, OVERPASS_TIMEOUT
+)
+from utils.geo_utils import nearby_indices
+from utils.upstream import get_overpass_client
+
+logger = logging.getLogger(__name__)
+
+GazetteerEntry = namedtuple('GazetteerEntry', ['name', 'latitude', 'longitude', 'kind', 'importance', 'context'])
+
+# Importancia por tipo de lugar: desempata nombres repetidos y ordena sugerencias
+PLACE_IMPORTANCE = {
+    'country': 100, 'city': 90, 'state': 80, 'town': 75, 'county': 70, 'village': 60,
+    'district': 55, 'suburb': 50, 'neighbourhood': 40, 'hamlet': 35, 'locality': 30,
+}
+# Nivel administrativo de OSM -> tipo de área
+ADMIN_LEVELS = {'2': 'country', '4': 'state', '6': 'county', '8': 'district'}
+# Tipos que sirven para nombrar una coordenada (geocodificación inversa)
+SETTLEMENT_KINDS = frozenset(PLACE_IMPORTANCE) - {'country', 'state', 'county'}
+POI_IMPORTANCE = 10
+# Coincidencias con una palabra interior del nombre ("jose" en "San José") van después
+_WORD_MATCH_PENALTY = 5
+
+_PUNCTUATION = re.compile(r"[¿?¡!.,;:\"']+")
+_WHITESPACE = re.compile(r'\s+')
+
+# Consulta de Overpass para generar el extracto que usa main()
+EXTRACT_QUERY = """
+[out:json][timeout:{timeout}];
+area["name"="{area}"]["boundary"="administrative"]->.searchArea;
+(
+  node["place"~"^(city|town|village|suburb|neighbourhood|hamlet|locality)$"]["name"](area.searchArea);
+  relation["boundary"="administrative"]["admin_level"~"^(2|4|6|8)$"]["name"](area.searchArea);
+);
+out center tags;
+"""
+
+
+def normalize_query(text):
+    """Normaliza una consulta: minúsculas, sin acentos ni puntuación"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION.sub(' ', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []  # (puntaje, id) de los nombres que terminan aquí
+        self.top = ()  # (puntaje, id) de las mejores entradas del subárbol
+
+
+class Gazetteer:
+    """Nomenclátor local: autocompletado con trie, búsqueda exacta e inversa
+
+    Los nombres se indexan sin acentos ni mayúsculas (normalize_query), completos
+    y desde cada palabra interior. Cada nodo del trie guarda las mejores
+    GAZETTEER_SUGGESTIONS entradas de su subárbol, así que completar un prefijo
+    cuesta lo que mide el prefijo. Las búsquedas con errores de tipeo recorren
+    el trie con una fila de distancia de Levenshtein por nodo.
+    """
+
+    def __init__(self, suggestions=GAZETTEER_SUGGESTIONS):
+        self.suggestions = suggestions
+        self.entries = []
+        self._root = _Node()
+        self._by_name = {}
+        self._settlements = None
+        self._finalized = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, name, latitude, longitude, kind, importance=None, context=''):
+        """Agrega un nombre; solo asentamientos y áreas administrativas entran en lookup()"""
+        if importance is None:
+            importance = PLACE_IMPORTANCE.get(kind, POI_IMPORTANCE)
+        key = normalize_query(name)
+        if not key or latitude is None or longitude is None:
+            return None
+        entry_id = len(self.entries)
+        self.entries.append(GazetteerEntry(name, latitude, longitude, kind, importance, context))
+        # Un POI llamado como un pueblo no debe ganarle al pueblo al geocodificar
+        if kind in PLACE_IMPORTANCE:
+            self._by_name.setdefault(key, []).append(entry_id)
+
+        words = key.split(' ')
+        for start in range(len(words)):
+            score = importance if start == 0 else importance - _WORD_MATCH_PENALTY
+            self._insert(' '.join(words[start:]), score, entry_id)
+        self._finalized = False
+        return entry_id
+
+    def _insert(self, key, score, entry_id):
+        node = self._root
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+        node.entries.append((score, entry_id))
+
+    def load_file(self, path):
+        """Carga un extracto JSON de Overpass o un archivo con el esquema de places_data.json"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        added = 0
+        if 'elements' in data:
+            for element in data['elements']:
+                added += self._add_element(element) is not None
+        else:
+            for place in data.get('places', []):
+                if place.get('name'):
+                    added += self.add(
+                        place['name'], place.get('latitude'), place.get('longitude'),
+                        place.get('type') or 'other'
+                    ) is not None
+        logger.info(f"Nomenclátor: {added} nombres cargados desde {path}")
+        return added
+
+    def _add_element(self, element):
+        tags = element.get('tags', {})
+        name = tags.get('name')
+        if not name:
+            return None
+        kind = tags.get('place') or ADMIN_LEVELS.get(tags.get('admin_level'))
+        if kind is None:
+            return None
+        center = element.get('center', element)
+        importance = PLACE_IMPORTANCE.get(kind, POI_IMPORTANCE)
+        population = tags.get('population', '')
+        if population.isdigit():
+            # Entre dos pueblos del mismo tipo se prefiere el más poblado
+            importance += min(9, int(math.log10(int(population) + 1)))
+        context = tags.get('is_in:province') or tags.get('is_in:state') or tags.get('is_in') or ''
+        return self.add(name, center.get('lat'), center.get('lon'), kind, importance, context)
+
+    def finalize(self):
+        """Calcula las sugerencias de cada nodo y el índice de asentamientos"""
+        if self._finalized:
+            return
+        self._collect_top(self._root)
+        ids = [i for i, entry in enumerate(self.entries) if entry.kind in SETTLEMENT_KINDS]
+        self._settlements = (
+            np.array(ids, dtype=np.int64),
+            np.array([self.entries[i].latitude for i in ids], dtype=np.float64),
+            np.array([self.entries[i].longitude for i in ids], dtype=np.float64),
+        )
+        self._finalized = True
+
+    def _collect_top(self, node):
+        candidates = list(node.entries)
+        for child in node.children.values():
+            self._collect_top(child)
+            candidates.extend(child.top)
+        candidates.sort(key=lambda item: (-item[0], len(self.entries[item[1]].name)))
+        top = {}
+        for score, entry_id in candidates:
+            if entry_id not in top:
+                top[entry_id] = score
+                if len(top) == self.suggestions:
+                    break
+        node.top = tuple((score, entry_id) for entry_id, score in top.items())
+
+    def lookup(self, query, require_context=False):
+        """Asentamiento o área con el nombre exacto de la consulta (sin acentos), o None
+
+        "San José, Costa Rica" se resuelve con la primera parte si las demás
+        también son nombres conocidos. Con require_context un nombre suelto no
+        basta, porque puede ser de cualquier lugar del mundo ("Liberia"): cada
+        parte tras la coma debe ser la provincia de la entrada o un área
+        administrativa del nomenclátor.
+        """
+        key = normalize_query(query)
+        ids = None if require_context else self._by_name.get(key)
+        if ids is None and ',' in query:
+            first, *rest = query.split(',')
+            rest = [normalize_query(part) for part in rest if part.strip()]
+            if rest and all(part in self._by_name for part in rest):
+                ids = self._by_name.get(normalize_query(first))
+                if ids and require_context:
+                    ids = [i for i in ids if all(self._in_context(self.entries[i], part) for part in rest)]
+        if not ids:
+            return None
+        return max((self.entries[i] for i in ids), key=lambda entry: entry.importance)
+
+    def _in_context(self, entry, part):
+        """Indica si la parte de la consulta nombra la provincia de la entrada o un área"""
+        if entry.context and normalize_query(entry.context) == part:
+            return True
+        return any(self.entries[i].kind in ADMIN_LEVELS.values() for i in self._by_name[part])
+
+    def complete(self, prefix, limit=GAZETTEER_SUGGESTIONS):
+        """Sugerencias para un prefijo; si no hay ninguna, tolera errores de tipeo"""
+        self.finalize()
+        key = normalize_query(prefix)
+        if not key:
+            return []
+
+        # id -> (ediciones, -puntaje): primero lo exacto y luego lo más importante
+        ranks = {}
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                break
+        else:
+            ranks = {entry_id: (0, -score) for score, entry_id in node.top}
+
+        # Sin coincidencias exactas se asume un error de tipeo
+        if not ranks and len(key) >= 3:
+            max_edits = 1 if len(key) < 8 else 2
+            for entry_id, rank in self._fuzzy_prefix(key, max_edits).items():
+                if entry_id not in ranks or rank < ranks[entry_id]:
+                    ranks[entry_id] = rank
+
+        ranked = sorted(ranks, key=lambda i: (ranks[i], len(self.entries[i].name)))
+        return [self.entries[i] for i in ranked[:limit]]
+
+    def _fuzzy_prefix(self, key, max_edits):
+        """Entradas cuyo nombre empieza con algo a max_edits ediciones o menos de la clave"""
+        found = {}
+        too_far = max_edits + 1
+        first_row = list(range(len(key) + 1))
+        stack = [(child, char, first_row) for char, child in self._root.children.items()]
+        while stack:
+            node, char, previous = stack.pop()
+            depth = previous[0] + 1
+            # Fuera de la banda |columna - profundidad| <= max_edits el costo ya excede el máximo
+            row = [depth] + [too_far] * len(key)
+            for column in range(max(1, depth - max_edits), min(len(key), depth + max_edits) + 1):
+                row[column] = min(
+                    row[column - 1] + 1,
+                    previous[column] + 1,
+                    previous[column - 1] + (key[column - 1] != char)
+                )
+            if row[-1] <= max_edits:
+                for score, entry_id in node.top:
+                    rank = (row[-1], -score)
+                    if entry_id not in found or rank < found[entry_id]:
+                        found[entry_id] = rank
+            if min(row) <= max_edits:
+                stack.extend((child, next_char, row) for next_char, child in node.children.items())
+        return found
+
+    def reverse(self, latitude, longitude, max_distance=GAZETTEER_REVERSE_MAX_DISTANCE):
+        """Asentamiento más cercano a la coordenada dentro de max_distance metros, o None"""
+        self.finalize()
+        ids, lats, lons = self._settlements
+        if not len(ids):
+            return None
+        indices, _ = nearby_indices(latitude, longitude, max_distance, lats, lons, k=1)
+        if not len(indices):
+            return None
+        return self.entries[ids[indices[0]]]
+
+    @staticmethod
+    def label(entry):
+        """Nombre para mostrar, con la provincia o región cuando se conoce"""
+        if entry.context and normalize_query(entry.context) != normalize_query(entry.name):
+            return f"{entry.name}, {entry.context}"
+        return entry.name
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Retorna el nomenclátor compartido, cargado desde GAZETTEER_PATHS"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                gazetteer = Gazetteer()
+                for path in GAZETTEER_PATHS:
+                    if not os.path.exists(path):
+                        logger.warning(f"Archivo del nomenclátor no encontrado: {path}")
+                        continue
+                    try:
+                        gazetteer.load_file(path)
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Error al cargar el nomenclátor de {path}: {str(e)}")
+                gazetteer.finalize()
+                _gazetteer = gazetteer
+    return _gazetteer
+
+
+def main(argv=None):
+    """Descarga de Overpass un extracto de asentamientos y áreas administrativas"""
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument('--area', default='Costa Rica', help='nombre del área administrativa en OSM')
+    arg_parser.add_argument('--output', '-o', default=GAZETTEER_PATHS[0] if GAZETTEER_PATHS else 'gazetteer.json')
+    args = arg_parser.parse_args(argv)
+
+    query = EXTRACT_QUERY.format(timeout=OVERPASS_TIMEOUT, area=args.area.replace('"', ''))
+    response = get_overpass_client().get({'data': query}, timeout=OVERPASS_TIMEOUT)
+    data = response.json()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'elements': data.get('elements', [])}, f, ensure_ascii=False)
+    print(f"{len(data.get('elements', []))} elementos escritos en {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,32 +1,130 @@
-from math import radians, sin, cos, sqrt, atan2
+from math import radians, sin, cos, sqrt, atan2, degrees, ceil
+import numpy as np
+
+EARTH_RADIUS = 6371000  # Radio de la Tierra en metros
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calcula la distancia entre dos puntos usando la fórmula haversine"""
-    R = 6371000  # Radio de la Tierra en metros
-    
+    R = EARTH_RADIUS
+
     lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    
+
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     c = 2 * atan2(sqrt(a), sqrt(1-a))
-    
+
     return R * c
 
-def get_nearby_places(lat, lon, radius_meters, places):
-    """Filtra lugares dentro del radio especificado"""
-    nearby_places = []
-    
-    for place in places:
-        distance = calculate_distance(
-            lat, lon,
-            place['latitude'],
-            place['longitude']
-        )
-        if distance <= radius_meters:
-            place['distance'] = round(distance)
-            nearby_places.append(place)
-    
-    # Ordenar por distancia
-    nearby_places.sort(key=lambda x: x.get('distance', float('inf')))
-    return nearby_places 
\ No newline at end of file
+def haversine_many(lat, lon, lats, lons):
+    """Distancias en metros desde un origen a N puntos (arreglos NumPy)"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons, dtype=np.float64)) - np.radians(lon)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def distance_matrix(lats1, lons1, lats2, lons2):
+    """Matriz N×M de distancias en metros entre dos conjuntos de puntos"""
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def bbox_mask(lat, lon, radius_meters, lats, lons):
+    """Prefiltro barato: puntos dentro del rectángulo que contiene el círculo"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    # Margen pequeño para no descartar puntos en el borde por redondeo
+    dlat = degrees(radius_meters / EARTH_RADIUS) * 1.001
+    mask = np.abs(lats - lat) <= dlat
+
+    cos_lat = cos(radians(min(abs(lat) + dlat, 90.0)))
+    if cos_lat > 1e-6:
+        dlon = dlat / cos_lat
+        if abs(lon) + dlon < 180:
+            # Cerca del antimeridiano no se filtra por longitud
+            mask &= np.abs(lons - lon) <= dlon
+    return mask
+
+def nearby_indices(lat, lon, radius_meters, lats, lons, k=None):
+    """Índices y distancias de los puntos dentro del radio, ordenados por distancia
+
+    Con k, solo se ordenan los k más cercanos (selección parcial con argpartition).
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    candidates = np.flatnonzero(bbox_mask(lat, lon, radius_meters, lats, lons))
+    distances = haversine_many(lat, lon, lats[candidates], lons[candidates])
+
+    inside = distances <= radius_meters
+    candidates = candidates[inside]
+    distances = distances[inside]
+
+    if k is not None and k < len(candidates):
+        top = np.argpartition(distances, k)[:k]
+        candidates = candidates[top]
+        distances = distances[top]
+
+    order = np.argsort(np.round(distances), kind='stable')
+    return candidates[order], distances[order]
+
+def get_nearby_places(lat, lon, radius_meters, places, limit=None):
+    """Filtra lugares dentro del radio especificado
+
+    Retorna copias de los lugares (Place o diccionarios) con su 'distance',
+    ordenadas por distancia; los lugares recibidos no se modifican.
+    """
+    if not places:
+        return []
+
+    lats = np.fromiter((place['latitude'] for place in places), dtype=np.float64, count=len(places))
+    lons = np.fromiter((place['longitude'] for place in places), dtype=np.float64, count=len(places))
+    indices, distances = nearby_indices(lat, lon, radius_meters, lats, lons, k=limit)
+
+    return [
+        _with_distance(places[index], int(round(distance)))
+        for index, distance in zip(indices.tolist(), distances.tolist())
+    ]
+
+def _with_distance(place, distance):
+    if hasattr(place, 'with_distance'):
+        return place.with_distance(distance)
+    return dict(place, distance=distance)
+
+def assign_nearest(lats, lons, point_lats, point_lons, radii, block=4096):
+    """Asigna cada lugar al punto de consulta más cercano cuyo radio lo contiene
+
+    Retorna (índice del punto o -1, distancia) por lugar. La matriz de
+    distancias se calcula por bloques para acotar la memoria.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64)[None, :]
+    owners = np.full(len(lats), -1, dtype=np.int64)
+    distances = np.full(len(lats), np.inf)
+
+    for start in range(0, len(lats), block):
+        end = start + block
+        matrix = distance_matrix(lats[start:end], lons[start:end], point_lats, point_lons)
+        matrix = np.where(matrix <= radii, matrix, np.inf)
+        nearest = np.argmin(matrix, axis=1)
+        best = matrix[np.arange(len(nearest)), nearest]
+        owners[start:end] = np.where(np.isfinite(best), nearest, -1)
+        distances[start:end] = best
+    return owners, distances
+
+def densify_polyline(points, spacing_meters):
+    """Puntos a lo largo de una polilínea, separados como máximo spacing_meters"""
+    samples = [tuple(points[0])]
+    for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+        steps = max(1, ceil(calculate_distance(lat1, lon1, lat2, lon2) / spacing_meters))
+        for step in range(1, steps + 1):
+            t = step / steps
+            samples.append((lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t))
+    return samples
@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderTimedOut
+from config import (
+    NOMINATIM_USER_AGENT, NOMINATIM_DOMAIN, NOMINATIM_SCHEME, NOMINATIM_TIMEOUT,
+    NOMINATIM_RATE_LIMIT, NOMINATIM_MAX_QUEUE_WAIT, GEOCODE_CACHE_TTL,
+    GEOCODE_NEGATIVE_TTL, GEOCODE_CACHE_MAX_ENTRIES, GEOCODE_CACHE_PATH, NOMINATIM_MAX_CONCURRENT,
+    NOMINATIM_MAX_QUEUE, NOMINATIM_QUEUE_TIMEOUT
+)
+from utils.cache import TTLCache, SQLiteCacheBackend
+from utils.gazetteer import get_gazetteer, normalize_query
+from utils.log_utils import fields
+from utils.metrics import count_cache, count_upstream, timed
+from utils.rate_limiter import TokenBucket
+from utils.upstream import AdmissionGate
+
+logger = logging.getLogger(__name__)
+
+GeocodeResult = namedtuple('GeocodeResult', ['latitude', 'longitude', 'address'])
+
+# Marca guardada en caché cuando Nominatim no encuentra el lugar
+_NOT_FOUND = False
+
+
+class _InFlight:
+    """Búsqueda en curso compartida por solicitudes idénticas"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GeocodingService:
+    """Geocodificador compartido con caché, coalescencia y límite de tasa
+
+    Los nombres que están en el nomenclátor local se resuelven sin consultar
+    Nominatim. Las consultas a Nominatim pasan por un control de admisión;
+    si está saturado o falla, se responde con la caché vencida cuando existe.
+    """
+
+    def __init__(self, geolocator=None, cache=None, limiter=None, gazetteer=None):
+        self.geolocator = geolocator or Nominatim(
+            user_agent=NOMINATIM_USER_AGENT, domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME
+        )
+        if cache is None:
+            backend = None
+            if GEOCODE_CACHE_PATH:
+                backend = SQLiteCacheBackend(GEOCODE_CACHE_PATH, namespace='geocode')
+            cache = TTLCache(
+                max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+                ttl=GEOCODE_CACHE_TTL,
+                backend=backend,
+                name='geocode'
+            )
+        self.cache = cache
+        self.limiter = limiter or TokenBucket(NOMINATIM_RATE_LIMIT, capacity=1)
+        self.admission = AdmissionGate(
+            'nominatim', NOMINATIM_MAX_CONCURRENT, NOMINATIM_MAX_QUEUE, NOMINATIM_QUEUE_TIMEOUT
+        )
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        # Rastreador opcional de consultas frecuentes (ver utils.prefetch)
+        self.tracker = None
+
+        self.requests = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_latency_total = 0.0
+        self.upstream_latency_max = 0.0
+
+    def geocode(self, query, timeout=NOMINATIM_TIMEOUT):
+        """Geocodifica una consulta; retorna GeocodeResult o None si no existe"""
+        with timed('geocode'):
+            return self._geocode(query, timeout)
+
+    def _geocode(self, query, timeout):
+        key = normalize_query(query)
+        if not key:
+            return None
+
+        with self._lock:
+            self.requests += 1
+
+        local = self.local(query)
+        count_cache('gazetteer', local is not None)
+        if local is not None:
+            return local
+        if self.tracker is not None:
+            self.tracker.record(key, query)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached or None
+
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = _InFlight()
+                self._in_flight[key] = in_flight
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Esperar el resultado de la búsqueda idéntica que ya está en curso
+            if not in_flight.event.wait(timeout):
+                raise GeocoderTimedOut('Tiempo de espera agotado')
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            in_flight.result = self._geocode_upstream(key, query, timeout)
+            return in_flight.result
+        except Exception as e:
+            stale = self.cache.get_stale(key)
+            if stale is None:
+                in_flight.error = e
+                raise
+            logger.warning("Nominatim no disponible: se responde con caché vencida", extra=fields(
+                query=query, error=str(e)
+            ))
+            in_flight.result = stale or None
+            return in_flight.result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.event.set()
+
+    def local(self, query):
+        """Resultado del nomenclátor local, o None si el nombre no está
+
+        Solo se usa si la consulta trae contexto ("Liberia, Costa Rica"); un
+        nombre suelto va a Nominatim, que conoce los homónimos del mundo.
+        """
+        entry = self.gazetteer.lookup(query, require_context=True)
+        if entry is None:
+            return None
+        return GeocodeResult(entry.latitude, entry.longitude, self.gazetteer.label(entry))
+
+    def refresh(self, query, timeout=NOMINATIM_TIMEOUT):
+        """Consulta Nominatim y renueva la caché aunque la entrada siga vigente"""
+        key = normalize_query(query)
+        if not key:
+            return None
+        return self._geocode_upstream(key, query, timeout)
+
+    def expires_in(self, query):
+        """Segundos de vigencia que le quedan a la consulta en caché, o None"""
+        return self.cache.ttl_remaining(normalize_query(query))
+
+    def _geocode_upstream(self, key, query, timeout):
+        """Consulta Nominatim respetando el límite de solicitudes por segundo
+
+        Lanza Overloaded si ya hay demasiadas consultas en curso o en cola. Las
+        esperas por turno y por el límite descuentan del plazo de la consulta.
+        """
+        requested = time.monotonic()
+        with self.admission.admit(min(timeout, NOMINATIM_MAX_QUEUE_WAIT)):
+            queue_wait = min(timeout, NOMINATIM_MAX_QUEUE_WAIT) - (time.monotonic() - requested)
+            if queue_wait <= 0 or not self.limiter.acquire(timeout=queue_wait):
+                raise GeocoderTimedOut('Cola de geocodificación saturada')
+
+            started = time.monotonic()
+            remaining = timeout - (started - requested)
+            if remaining <= 0:
+                raise GeocoderTimedOut('Tiempo de espera agotado')
+            try:
+                location = self.geolocator.geocode(query, timeout=remaining)
+            except Exception:
+                count_upstream('nominatim', 'error')
+                raise
+            else:
+                count_upstream('nominatim', 'ok' if location is not None else 'not_found')
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self.upstream_calls += 1
+                    self.upstream_latency_total += elapsed
+                    self.upstream_latency_max = max(self.upstream_latency_max, elapsed)
+
+        if location is None:
+            self.cache.set(key, _NOT_FOUND, ttl=GEOCODE_NEGATIVE_TTL)
+            return None
+
+        result = GeocodeResult(location.latitude, location.longitude, location.address)
+        self.cache.set(key, result)
+        logger.debug("Geocodificado", extra=fields(query=query, seconds=round(elapsed, 3)))
+        return result
+
+    def stats(self):
+        """Retorna estadísticas de latencia y tasa de aciertos"""
+        with self._lock:
+            calls = self.upstream_calls
+            stats = {
+                'requests': self.requests,
+                'coalesced': self.coalesced,
+                'upstream_calls': calls,
+                'upstream_latency_avg': round(self.upstream_latency_total / calls, 4) if calls else 0.0,
+                'upstream_latency_max': round(self.upstream_latency_max, 4)
+            }
+        stats['cache'] = self.cache.stats()
+        stats['limiter'] = self.limiter.stats()
+        stats['admission'] = self.admission.stats()
+        return stats
+
+
+_geocoding_service = None
+_geocoding_service_lock = threading.Lock()
+
+
+def get_geocoding_service():
+    """Retorna el servicio de geocodificación compartido por el proceso"""
+    global _geocoding_service
+    if _geocoding_service is None:
+        with _geocoding_service_lock:
+            if _geocoding_service is None:
+                _geocoding_service = GeocodingService()
+    return _geocoding_service
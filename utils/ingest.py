@@ -0,0 +1,390 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from config import (
+    INGEST_OUTPUT_DIR, INGEST_SHARD_DEG, INGEST_CHUNK_ELEMENTS, INGEST_WORKERS,
+    LOCAL_POI_CELL_DEG, OVERPASS_STREAM_CHUNK_SIZE, PLACE_TYPES
+)
+from utils.overpass_api import element_to_place, get_place_category, iter_elements
+from utils.place import Place
+from utils.poi_store import COLUMNS_EXT, MANIFEST_NAME, POIStore, shard_for, shard_name
+
+try:
+    import osmium
+except ImportError:  # sin pyosmium solo se leen extractos JSON de Overpass
+    osmium = None
+
+logger = logging.getLogger(__name__)
+
+# Lotes en vuelo por proceso: si la lectura va más rápido que el pool, espera
+PENDING_PER_WORKER = 2
+_DIGEST_MASK = 2 ** 64 - 1
+
+
+def iter_json_elements(path):
+    """Elementos de un volcado JSON de Overpass, decodificados por partes"""
+    with open(path, 'rb') as f:
+        yield from iter_elements(iter(lambda: f.read(OVERPASS_STREAM_CHUNK_SIZE), b''))
+
+
+def _centroid(node_refs):
+    """(lat, lon) promedio de las referencias a nodos con ubicación, o None"""
+    lats, lons = [], []
+    for ref in node_refs:
+        if ref.location.valid():
+            lats.append(ref.location.lat)
+            lons.append(ref.location.lon)
+    if not lats:
+        return None
+    return sum(lats) / len(lats), sum(lons) / len(lons)
+
+
+def iter_pbf_elements(path):
+    """Objetos de un extracto PBF con alguna etiqueta de PLACE_TYPES, con el esquema de Overpass
+
+    Los nodos llevan su ubicación; las vías y los multipolígonos de
+    relaciones llevan 'center' con el promedio de sus nodos (los anillos
+    exteriores en el caso de las relaciones), como "out center" de Overpass.
+    """
+    if osmium is None:
+        raise ValueError("Leer extractos PBF requiere pyosmium (pip install osmium)")
+    # Sin with_filter: las vías sin etiquetas hacen falta para armar los multipolígonos
+    for obj in osmium.FileProcessor(path).with_locations().with_areas():
+        if not any(key in obj.tags for key in PLACE_TYPES):
+            continue
+        if obj.is_node():
+            if not obj.location.valid():
+                continue
+            element = {'type': 'node', 'id': obj.id, 'lat': obj.location.lat, 'lon': obj.location.lon}
+        elif obj.is_way():
+            center = _centroid(obj.nodes)
+            if center is None:
+                continue
+            element = {'type': 'way', 'id': obj.id, 'center': {'lat': center[0], 'lon': center[1]}}
+        elif obj.is_area() and not obj.from_way():
+            center = _centroid(ref for ring in obj.outer_rings() for ref in ring)
+            if center is None:
+                continue
+            element = {'type': 'relation', 'id': obj.orig_id(), 'center': {'lat': center[0], 'lon': center[1]}}
+        else:
+            # Las vías cerradas ya salen como vías; las demás relaciones no tienen superficie
+            continue
+        element['timestamp'] = obj.timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+        element['tags'] = {tag.k: tag.v for tag in obj.tags}
+        yield element
+
+
+def iter_extract(path):
+    if path.endswith('.pbf'):
+        return iter_pbf_elements(path)
+    return iter_json_elements(path)
+
+
+def _chunks(elements, size):
+    chunk = []
+    for element in elements:
+        # Los nodos sin etiquetas (geometría de vías) no llegan a los procesos
+        if not element.get('tags'):
+            continue
+        chunk.append(element)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _element_place(element):
+    """Lugar normalizado de un elemento de Overpass o None si no es de PLACE_TYPES"""
+    if get_place_category(element['tags']) is None:
+        return None
+    if element.get('lat') is None and 'center' in element:
+        # Vías y relaciones de Overpass con "out center"
+        element = dict(element, lat=element['center'].get('lat'), lon=element['center'].get('lon'))
+    place = element_to_place(element)
+    if place is None or place.latitude is None or place.longitude is None:
+        return None
+    return place
+
+
+def _process_chunk(elements, spill_dir, cell_deg, cells_per_shard):
+    """Normaliza un lote y agrega sus lugares al archivo temporal de cada fragmento
+
+    Cada proceso escribe en sus propios archivos (uno por fragmento y pid).
+    Retorna, por fragmento, [lugares, huella, timestamp más reciente]; la
+    huella es una suma de hashes, así que no depende del orden de los lotes.
+    """
+    lines = {}
+    stats = {}
+    for element in elements:
+        place = _element_place(element)
+        if place is None:
+            continue
+        row = math.floor(place.latitude / cell_deg)
+        col = math.floor(place.longitude / cell_deg)
+        shard = shard_name(shard_for(row, col, cells_per_shard))
+        line = place.to_json()
+        lines.setdefault(shard, []).append(line)
+
+        digest = int.from_bytes(hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest(), 'little')
+        timestamp = element.get('timestamp') or ''
+        entry = stats.get(shard)
+        if entry is None:
+            stats[shard] = [1, digest, timestamp]
+        else:
+            entry[0] += 1
+            entry[1] = (entry[1] + digest) & _DIGEST_MASK
+            entry[2] = max(entry[2], timestamp)
+
+    pid = os.getpid()
+    for shard, shard_lines in lines.items():
+        with open(os.path.join(spill_dir, f'{shard}.{pid}.jsonl'), 'a', encoding='utf-8') as f:
+            f.write('\n'.join(shard_lines))
+            f.write('\n')
+    return stats
+
+
+def _merge_stats(totals, stats):
+    for shard, (count, digest, timestamp) in stats.items():
+        entry = totals.get(shard)
+        if entry is None:
+            totals[shard] = [count, digest, timestamp]
+        else:
+            entry[0] += count
+            entry[1] = (entry[1] + digest) & _DIGEST_MASK
+            entry[2] = max(entry[2], timestamp)
+
+
+def _read_spills(spill_paths):
+    for path in spill_paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                yield Place.from_dict(json.loads(line))
+
+
+def _build_shard(spill_paths, output_path, cell_deg, covered_cells=()):
+    """Compila los lugares temporales de un fragmento a su archivo columnar"""
+    store = POIStore(cell_deg)
+    store.add_places(_read_spills(spill_paths), covered_cells=covered_cells)
+    return store.save(output_path)
+
+
+def covered_cells_by_shard(bounds, cell_deg, cells_per_shard):
+    """Celdas que quedan completas dentro de bounds (sur, oeste, norte, este), por fragmento"""
+    south, west, north, east = bounds
+    # La tolerancia evita perder una celda por el redondeo de la división
+    min_row = math.ceil(south / cell_deg - 1e-9)
+    min_col = math.ceil(west / cell_deg - 1e-9)
+    max_row = math.floor(north / cell_deg + 1e-9) - 1
+    max_col = math.floor(east / cell_deg + 1e-9) - 1
+    by_shard = {}
+    for row in range(min_row, max_row + 1):
+        for col in range(min_col, max_col + 1):
+            by_shard.setdefault(shard_name(shard_for(row, col, cells_per_shard)), []).append((row, col))
+    return by_shard
+
+
+def _read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _input_signature(inputs, bounds):
+    """Nombre, tamaño y fecha de modificación de cada extracto, más el rectángulo cubierto"""
+    files = []
+    for path in sorted(inputs, key=os.path.basename):
+        stat = os.stat(path)
+        files.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return {'files': files, 'bounds': list(bounds) if bounds else None}
+
+
+def ingest(inputs, output_dir=INGEST_OUTPUT_DIR, workers=INGEST_WORKERS, shard_deg=INGEST_SHARD_DEG,
+           chunk_size=INGEST_CHUNK_ELEMENTS, cell_deg=LOCAL_POI_CELL_DEG, force=False, bounds=None):
+    """Importa extractos de OSM a fragmentos columnares para ShardedPOIStore
+
+    Primera pasada: el proceso principal lee los extractos por partes y los
+    reparte en lotes a un pool de procesos que normaliza, clasifica y separa
+    los lugares por fragmento en archivos temporales. Como mucho hay
+    PENDING_PER_WORKER lotes por proceso en vuelo, así que la memoria no
+    depende del tamaño del extracto. Segunda pasada: solo se recompilan los
+    fragmentos cuyo timestamp más reciente, cantidad de lugares o huella
+    cambió respecto al manifiesto; los demás archivos quedan intactos.
+    Extractos vecinos que comparten fragmentos deben importarse juntos.
+    Si los extractos tienen el mismo tamaño y fecha de modificación que en
+    la importación anterior no se leen: no hay nada que recompilar.
+
+    bounds (sur, oeste, norte, este) declara que los extractos tienen todos
+    los lugares de ese rectángulo: sus celdas completas quedan como cubiertas
+    (las búsquedas ahí no consultan Overpass), con fragmentos vacíos donde
+    no hay lugares. Sin bounds no se declara cobertura y los fragmentos
+    solo complementan lo que responde Overpass.
+    """
+    started = time.perf_counter()
+    cells_per_shard = max(1, round(shard_deg / cell_deg))
+    source = ','.join(sorted(os.path.basename(path) for path in inputs))
+    os.makedirs(output_dir, exist_ok=True)
+
+    previous = _read_manifest(output_dir) or {}
+    same_layout = (
+        previous.get('cell_deg') == cell_deg and previous.get('cells_per_shard') == cells_per_shard
+    )
+    old_shards = previous.get('shards', {})
+    covered = covered_cells_by_shard(bounds, cell_deg, cells_per_shard) if bounds else {}
+    signature = _input_signature(inputs, bounds)
+    known_inputs = previous.get('inputs', {}) if same_layout else {}
+
+    if not force and known_inputs.get(source) == signature:
+        own = [entry for entry in old_shards.values() if entry.get('source') == source]
+        if all(os.path.exists(os.path.join(output_dir, entry['file'])) for entry in own):
+            summary = {
+                'places': sum(entry['places'] for entry in own),
+                'shards': len(own),
+                'rebuilt': 0,
+                'covered': sum(entry.get('covered', 0) for entry in own),
+                'removed': 0,
+                'seconds': round(time.perf_counter() - started, 2)
+            }
+            logger.info(f"Importación de {source}: los extractos no cambiaron desde la última importación")
+            return summary
+
+    totals = {}
+    spill_dir = tempfile.mkdtemp(prefix='.ingest-', dir=output_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for path in inputs:
+                for chunk in _chunks(iter_extract(path), chunk_size):
+                    if len(pending) >= workers * PENDING_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _merge_stats(totals, future.result())
+                    pending.add(pool.submit(_process_chunk, chunk, spill_dir, cell_deg, cells_per_shard))
+            for future in pending:
+                _merge_stats(totals, future.result())
+            for shard in covered:
+                totals.setdefault(shard, [0, 0, ''])
+
+            spills = {}
+            for name in os.listdir(spill_dir):
+                spills.setdefault(name.split('.', 1)[0], []).append(os.path.join(spill_dir, name))
+
+            now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            shards = {}
+            builds = {}
+            for shard, (count, digest, timestamp) in totals.items():
+                entry = {
+                    'file': shard + COLUMNS_EXT, 'places': count, 'digest': f'{digest:016x}',
+                    'newest': timestamp, 'covered': len(covered.get(shard, ())), 'source': source, 'built': now
+                }
+                old = old_shards.get(shard) if same_layout else None
+                unchanged = (
+                    not force and old is not None
+                    and all(old.get(key, 0) == entry[key] for key in ('file', 'places', 'digest', 'newest', 'covered'))
+                    and os.path.exists(os.path.join(output_dir, entry['file']))
+                )
+                if unchanged:
+                    entry['built'] = old.get('built', now)
+                else:
+                    builds[shard] = pool.submit(
+                        _build_shard, sorted(spills.get(shard, ())), os.path.join(output_dir, entry['file']),
+                        cell_deg, covered.get(shard, ())
+                    )
+                shards[shard] = entry
+            for future in builds.values():
+                future.result()
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    # Fragmentos de otros extractos se conservan; los de este que ya no tienen lugares se borran
+    removed = 0
+    for shard, old in old_shards.items():
+        if shard in shards:
+            continue
+        if same_layout and old.get('source') != source:
+            shards[shard] = old
+            continue
+        try:
+            os.remove(os.path.join(output_dir, old['file']))
+        except FileNotFoundError:
+            pass
+        removed += 1
+
+    _write_manifest(output_dir, {
+        'cell_deg': cell_deg, 'cells_per_shard': cells_per_shard, 'updated': now, 'shards': shards,
+        'inputs': {**known_inputs, source: signature}
+    })
+    summary = {
+        'places': sum(entry[0] for entry in totals.values()),
+        'shards': len(totals),
+        'rebuilt': len(builds),
+        'covered': sum(len(cells) for cells in covered.values()),
+        'removed': removed,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+    logger.info(
+        f"Importación de {source}: {summary['places']} lugares en {summary['shards']} fragmentos, "
+        f"{summary['rebuilt']} recompilados, {summary['removed']} eliminados, "
+        f"{summary['covered']} celdas cubiertas"
+    )
+    return summary
+
+
+def _parse_bounds(text):
+    try:
+        south, west, north, east = (float(value) for value in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError("se esperan cuatro números: sur,oeste,norte,este")
+    if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+        raise argparse.ArgumentTypeError("rectángulo inválido")
+    return south, west, north, east
+
+
+def main(argv=None):
+    """Importa extractos de OSM (PBF o JSON de Overpass) a fragmentos de POI locales"""
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument('inputs', nargs='+', help='extractos .osm.pbf (requiere pyosmium) o volcados JSON de Overpass')
+    arg_parser.add_argument('--output-dir', '-o', default=INGEST_OUTPUT_DIR)
+    arg_parser.add_argument('--workers', '-j', type=int, default=INGEST_WORKERS)
+    arg_parser.add_argument('--shard-deg', type=float, default=INGEST_SHARD_DEG,
+                            help='lado de cada fragmento en grados')
+    arg_parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_ELEMENTS,
+                            help='elementos por lote del pool de procesos')
+    arg_parser.add_argument('--force', action='store_true',
+                            help='lee los extractos aunque no hayan cambiado y recompila todos los fragmentos')
+    arg_parser.add_argument('--bounds', type=_parse_bounds, metavar='SUR,OESTE,NORTE,ESTE',
+                            help='rectángulo que los extractos cubren por completo; sus búsquedas no consultan Overpass')
+    args = arg_parser.parse_args(argv)
+
+    summary = ingest(
+        args.inputs, args.output_dir, workers=max(1, args.workers), shard_deg=args.shard_deg,
+        chunk_size=max(1, args.chunk_size), force=args.force, bounds=args.bounds
+    )
+    print(
+        f"{summary['places']} lugares en {summary['shards']} fragmentos de {args.output_dir}: "
+        f"{summary['rebuilt']} recompilados, {summary['removed']} eliminados, "
+        f"{summary['covered']} celdas cubiertas ({summary['seconds']} s)"
+    )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
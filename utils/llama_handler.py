@@ -1,338 +1,429 @@
-import requests
-from datetime import datetime
-import os
-import json
-from geopy.geocoders import Nominatim
+import asyncio
+import logging
 from geopy.exc import GeocoderTimedOut
+from config import (
+    SEARCH_RADIUS, NOMINATIM_TIMEOUT, CHAT_DEADLINE, PLACES_CACHE_GRID_PRECISION,
+    PLACES_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+)
+from utils.cache import TTLCache, quantize
+from utils.gazetteer import get_gazetteer
+from utils.async_pipeline import Deadline, DeadlineExceeded, run_stage
+from utils.geocoding import get_geocoding_service
+from utils.log_utils import fields
+from utils.metrics import timed
+from utils.opening_hours import hours_index_for, minute_of_week
+from utils.overpass_api import OverpassAPI
+from utils.place import PlaceSet
+from utils.query_parser import get_query_parser
+from utils.ranking import rank_places
+from utils.session_store import SessionState
+from utils.upstream import Overloaded, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+ANSWER_LANGUAGE = 'es'
+OVERLOADED_RESPONSE = ("Lo siento, el servicio de mapas está saturado en este momento. "
+                       "¿Podrías intentarlo de nuevo en unos segundos?")
+
+# Texto de las respuestas ya formateado, compartido entre sesiones
+_answer_cache = TTLCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=PLACES_CACHE_TTL, name='answers'
+)
 
 class LlamaHandler:
-    def __init__(self):
-        self.current_places = []
-        self.current_location = None
-        self.geolocator = Nominatim(user_agent="my_travel_app")
-        
-        # Patrones de lenguaje natural
-        self.location_patterns = {
-            'preguntas_generales': [
-                'que hay en', 'que puedo ver en', 'que visitar en', 'lugares para ver en',
-                'que hacer en', 'que me recomiendas en', 'lugares de interés en',
-                'sitios para visitar en', 'atracciones en', 'puntos de interés en'
-            ],
-            'restaurantes': [
-                'donde comer en', 'restaurantes en', 'lugares para comer en',
-                'sitios para cenar en', 'cafeterías en', 'bares en',
-                'donde cenar en', 'comida en', 'gastronomía de'
-            ],
-            'cultura': [
-                'museos en', 'lugares históricos en', 'sitios culturales en',
-                'monumentos en', 'arte en', 'historia de', 'teatros en',
-                'arquitectura de', 'patrimonio de'
-            ],
-            'naturaleza': [
-                'parques en', 'jardines en', 'espacios verdes en',
-                'naturaleza en', 'aire libre en', 'zonas verdes de'
-            ]
-        }
+    def __init__(self, overpass_api=None, geocoder=None, state=None, gazetteer=None):
+        self.state = state if state is not None else SessionState()
+        self.geocoder = geocoder or get_geocoding_service()
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        self.overpass_api = overpass_api or OverpassAPI()
+        self.query_parser = get_query_parser()
+        # Minuto de la semana si la consulta pidió solo lugares abiertos (ver utils.opening_hours)
+        self.open_at = None
+
+    @property
+    def current_location(self):
+        return self.state.current_location
+
+    @current_location.setter
+    def current_location(self, value):
+        self.state.current_location = value
+
+    @property
+    def current_places(self):
+        return self.state.current_places
+
+    @current_places.setter
+    def current_places(self, value):
+        self.state.current_places = value if isinstance(value, PlaceSet) else PlaceSet(value)
 
     def query_places(self, query_text):
         """Procesa consultas en lenguaje natural"""
         try:
-            query_text = query_text.lower().strip()
-            print(f"Procesando consulta: '{query_text}'")
-            
-            # Si es solo un saludo sin pregunta adicional
-            if self._is_only_greeting(query_text):
-                print("Detectado saludo simple")
-                return self._get_greeting_response()
-            
-            # Si es una pregunta sobre el bot sin consulta de lugar
-            if self._is_only_bot_question(query_text):
-                print("Detectada pregunta sobre el bot")
-                return self._get_bot_info_response()
-            
-            # Extraer ubicación y tipo de consulta
-            location, query_type = self._parse_natural_query(query_text)
-            print(f"Ubicación extraída: '{location}'")
-            print(f"Tipo de consulta: '{query_type}'")
-            
-            if not location:
-                return ("No he podido identificar el lugar del que me hablas. "
-                       "¿Podrías decirme específicamente qué ciudad o lugar te interesa?")
+            early_response, location, query_type = self._prepare_query(query_text)
+            if early_response:
+                return early_response
             
             # Obtener coordenadas
             try:
-                geo_location = self.geolocator.geocode(location, timeout=10)
+                geo_location = self.geocoder.geocode(location, timeout=NOMINATIM_TIMEOUT)
                 if not geo_location:
                     return f"No pude encontrar la ubicación de '{location}'. ¿Podrías ser más específico?"
                 
-                print(f"Coordenadas encontradas: {geo_location.latitude}, {geo_location.longitude}")
+                logger.debug("Coordenadas encontradas", extra=fields(
+                    latitude=geo_location.latitude, longitude=geo_location.longitude
+                ))
                 
                 # Actualizar ubicación y buscar lugares
                 self.set_current_location(geo_location.latitude, geo_location.longitude)
+                return self._build_answer(location, query_type)
                 
-                if not self.current_places:
-                    return f"No encontré lugares de interés en {location}. ¿Quizás podrías probar con una zona más céntrica o turística?"
+            except Overloaded:
+                return OVERLOADED_RESPONSE
+            except Exception as e:
+                logger.warning("Error al procesar ubicación", extra=fields(location=location, error=str(e)))
+                return "Lo siento, tuve un problema buscando ese lugar. ¿Podrías intentarlo de nuevo?"
                 
-                # Generar respuesta según el tipo de consulta
-                response = None
-                if query_type == 'restaurantes':
-                    response = self._get_restaurants_info(self.current_places)
-                elif query_type == 'cultura':
-                    response = self._get_cultural_places(self.current_places)
-                elif query_type == 'naturaleza':
-                    response = self._get_parks_info(self.current_places)
-                else:
-                    response = self._get_general_places_info(self.current_places)
+        except Exception as e:
+            logger.error("Error general en query_places", exc_info=True)
+            return "Hubo un error procesando tu consulta. ¿Podrías reformularla?"
+
+    async def query_places_async(self, query_text, deadline=None):
+        """Versión asíncrona de query_places con un presupuesto de tiempo por etapa"""
+        deadline = deadline or Deadline(CHAT_DEADLINE)
+        try:
+            early_response, location, query_type = self._prepare_query(query_text)
+            if early_response:
+                return early_response
+            
+            try:
+                timeout = deadline.stage_timeout('geocode')
+                geo_location = await run_stage(
+                    self.geocoder.geocode, location, timeout=timeout, stage_timeout=timeout
+                )
+                if not geo_location:
+                    return f"No pude encontrar la ubicación de '{location}'. ¿Podrías ser más específico?"
                 
-                if not response or response.strip() == "":
-                    return f"Encontré {len(self.current_places)} lugares en {location}, pero no del tipo específico que buscas. ¿Te gustaría ver otros tipos de lugares?"
+                logger.debug("Coordenadas encontradas", extra=fields(
+                    latitude=geo_location.latitude, longitude=geo_location.longitude
+                ))
                 
-                return response
+                # La etapa solo busca; la sesión se actualiza aquí, así un resultado
+                # que llega después del límite se descarta sin tocar el estado
+                timeout = deadline.stage_timeout('places')
+                try:
+                    places = await run_stage(
+                        self._get_nearby_places,
+                        geo_location.latitude,
+                        geo_location.longitude,
+                        SEARCH_RADIUS,
+                        timeout,
+                        stage_timeout=timeout
+                    )
+                except UpstreamError:
+                    self._apply_location(geo_location.latitude, geo_location.longitude, [])
+                    raise
+                self._apply_location(geo_location.latitude, geo_location.longitude, places)
+                return self._build_answer(location, query_type)
                 
+            except (DeadlineExceeded, asyncio.TimeoutError, GeocoderTimedOut):
+                logger.warning("Tiempo agotado procesando ubicación", extra=fields(location=location))
+                return "Lo siento, la búsqueda está tardando demasiado. ¿Podrías intentarlo de nuevo en un momento?"
+            except Overloaded:
+                return OVERLOADED_RESPONSE
             except Exception as e:
-                print(f"Error al procesar ubicación: {str(e)}")
+                logger.warning("Error al procesar ubicación", extra=fields(location=location, error=str(e)))
                 return "Lo siento, tuve un problema buscando ese lugar. ¿Podrías intentarlo de nuevo?"
                 
         except Exception as e:
-            print(f"Error general en query_places: {str(e)}")
+            logger.error("Error general en query_places_async", exc_info=True)
             return "Hubo un error procesando tu consulta. ¿Podrías reformularla?"
 
-    def _is_only_greeting(self, text):
-        """Detecta si el mensaje es únicamente un saludo sin consulta adicional"""
-        greetings = ['hola', 'buenos días', 'buenas tardes', 'buenas noches', 
-                    'hey', 'saludos', 'que tal', 'como estás']
-        
-        # Si el texto es solo un saludo (considerando algunas palabras adicionales comunes)
-        words = text.split()
-        if len(words) <= 3:  # Solo saludo o saludo con cortesía
-            return any(greeting in text for greeting in greetings)
-        return False
+    def iter_query_events(self, query_text, deadline=None):
+        """Versión por partes de query_places para enviar la respuesta a medida que avanza
 
-    def _is_only_bot_question(self, text):
-        """Detecta si es únicamente una pregunta sobre el bot sin consulta adicional"""
-        bot_questions = ['quien eres', 'que eres', 'como funcionas', 'que haces',
-                        'como puedes ayudar', 'que me puedes decir']
+        Emite diccionarios con 'event': 'location' apenas se geocodifica,
+        'places' con los lugares de cada grupo de teselas a medida que llegan,
+        'text' con el encabezado, un 'place' por cada lugar formateado y al
+        final 'done' con la respuesta completa (igual a la de query_places).
+        """
+        deadline = deadline or Deadline(CHAT_DEADLINE)
+        try:
+            early_response, location, query_type = self._prepare_query(query_text)
+            if early_response:
+                yield {'event': 'done', 'response': early_response}
+                return
+            
+            try:
+                geo_location = self.geocoder.geocode(location, timeout=deadline.stage_timeout('geocode'))
+                if not geo_location:
+                    yield {'event': 'done', 'response': f"No pude encontrar la ubicación de '{location}'. ¿Podrías ser más específico?"}
+                    return
+                
+                yield {
+                    'event': 'location',
+                    'query': location,
+                    'latitude': geo_location.latitude,
+                    'longitude': geo_location.longitude,
+                    'address': geo_location.address
+                }
+                
+                try:
+                    places = yield from self._stream_nearby_places(
+                        geo_location.latitude,
+                        geo_location.longitude,
+                        SEARCH_RADIUS,
+                        deadline.stage_timeout('places')
+                    )
+                except Exception:
+                    self._apply_location(geo_location.latitude, geo_location.longitude, [])
+                    raise
+                self._apply_location(geo_location.latitude, geo_location.longitude, places)
+                with timed('format'):
+                    header, entries = self._answer_parts(location, query_type)
+                
+                yield {'event': 'text', 'text': header}
+                for entry in entries:
+                    yield {'event': 'place', 'text': entry}
+                yield {'event': 'done', 'response': header + "".join(entries)}
+                
+            except (DeadlineExceeded, GeocoderTimedOut):
+                logger.warning("Tiempo agotado procesando ubicación", extra=fields(location=location))
+                yield {'event': 'done', 'response': "Lo siento, la búsqueda está tardando demasiado. ¿Podrías intentarlo de nuevo en un momento?"}
+            except Overloaded:
+                yield {'event': 'done', 'response': OVERLOADED_RESPONSE}
+            except Exception as e:
+                logger.warning("Error al procesar ubicación", extra=fields(location=location, error=str(e)))
+                yield {'event': 'done', 'response': "Lo siento, tuve un problema buscando ese lugar. ¿Podrías intentarlo de nuevo?"}
+                
+        except Exception:
+            logger.error("Error general en iter_query_events", exc_info=True)
+            yield {'event': 'done', 'response': "Hubo un error procesando tu consulta. ¿Podrías reformularla?"}
+
+    def _prepare_query(self, query_text):
+        """Retorna (respuesta_inmediata, ubicación, tipo_de_consulta)"""
+        logger.debug("Procesando consulta", extra=fields(query=query_text.strip()))
+        parsed = self.query_parser.parse(query_text)
         
-        # Verificar si es solo una pregunta sobre el bot
-        return any(question in text and len(text.split()) <= len(question.split()) + 2 
-                  for question in bot_questions)
+        # Si es solo un saludo sin pregunta adicional
+        if parsed.intent == 'greeting':
+            logger.debug("Detectado saludo simple")
+            return self._get_greeting_response(), None, None
+        
+        # Si es una pregunta sobre el bot sin consulta de lugar
+        if parsed.intent == 'bot':
+            logger.debug("Detectada pregunta sobre el bot")
+            return self._get_bot_info_response(), None, None
+        
+        location, query_type = parsed.location, parsed.category
+        self.open_at = minute_of_week() if parsed.open_now else None
+        logger.debug("Consulta analizada", extra=fields(
+            location=location, query_type=query_type, open_now=parsed.open_now
+        ))
+        
+        if not location:
+            return ("No he podido identificar el lugar del que me hablas. "
+                   "¿Podrías decirme específicamente qué ciudad o lugar te interesa?"), None, None
+        
+        return None, location, query_type
 
-    def _parse_natural_query(self, query):
-        """Analiza la consulta en lenguaje natural de manera más robusta"""
-        print(f"Analizando consulta: '{query}'")
+    def _build_answer(self, location, query_type):
+        """Genera la respuesta según el tipo de consulta con los lugares actuales"""
+        with timed('format'):
+            header, entries = self._answer_parts(location, query_type)
+            return header + "".join(entries)
+
+    def _answer_parts(self, location, query_type):
+        """Retorna (encabezado, entradas) de la respuesta; sin entradas es un mensaje"""
+        if not self.current_places:
+            return f"No encontré lugares de interés en {location}. ¿Quizás podrías probar con una zona más céntrica o turística?", ()
         
-        # Primero buscar patrones conocidos
-        for category, patterns in self.location_patterns.items():
-            for pattern in patterns:
-                if pattern in query:
-                    # Extraer la ubicación que viene después del patrón
-                    location = query.split(pattern)[-1].strip()
-                    print(f"Patrón encontrado: '{pattern}' -> Ubicación: '{location}'")
-                    return location, category
+        if query_type == 'restaurantes':
+            header, entries = self._restaurants_answer(self.current_places)
+        elif query_type == 'cultura':
+            header, entries = self._cultural_answer(self.current_places)
+        elif query_type == 'naturaleza':
+            header, entries = self._parks_answer(self.current_places)
+        else:
+            header, entries = self._general_answer(self.current_places)
         
-        # Si no encuentra patrones, buscar preposiciones comunes
-        prepositions = ['en', 'de', 'sobre', 'cerca de', 'alrededor de']
-        words = query.split()
-        for i, word in enumerate(words):
-            if word in prepositions and i + 1 < len(words):
-                location = ' '.join(words[i+1:])
-                print(f"Ubicación encontrada después de '{word}': '{location}'")
-                return location, 'general'
+        # Sin lugares de la categoría se mantiene el mensaje de arriba
+        if self.open_at is not None and self._places_in(self.current_places, query_type):
+            if not entries:
+                return (f"Ninguno de los lugares que encontré en {location} está abierto ahora "
+                        "según su horario publicado. ¿Quieres ver todos los lugares?"), ()
+            header = "⏰ Solo lugares abiertos ahora según su horario publicado.\n" + header
         
-        # Si aún no encuentra, buscar nombres propios o palabras capitalizadas en la consulta original
-        original_words = query.split()
-        for i, word in enumerate(original_words):
-            if word[0].isupper():
-                location = ' '.join(original_words[i:])
-                print(f"Ubicación encontrada por mayúscula: '{location}'")
-                return location, 'general'
+        if not entries and not header.strip():
+            return f"Encontré {len(self.current_places)} lugares en {location}, pero no del tipo específico que buscas. ¿Te gustaría ver otros tipos de lugares?", ()
         
-        print("No se encontró ubicación")
-        return None, 'general'
+        return header, entries
+
+    def _is_only_greeting(self, text):
+        """Detecta si el mensaje es únicamente un saludo sin consulta adicional"""
+        return self.query_parser.parse(text).intent == 'greeting'
+
+    def _is_only_bot_question(self, text):
+        """Detecta si es únicamente una pregunta sobre el bot sin consulta adicional"""
+        return self.query_parser.parse(text).intent == 'bot'
+
+    def _parse_natural_query(self, query):
+        """Analiza la consulta en lenguaje natural y retorna (ubicación, categoría)"""
+        parsed = self.query_parser.parse(query)
+        return parsed.location, parsed.category
+
+    def _get_greeting_response(self):
+        return ("¡Hola! Soy tu asistente de viaje. Puedo recomendarte lugares turísticos, "
+                "restaurantes, museos y parques. ¿Qué ciudad o lugar te interesa?")
+
+    def _get_bot_info_response(self):
+        return ("Soy Backpacker, un asistente que busca lugares de interés en OpenStreetMap. "
+                "Pregúntame por ejemplo: \"Restaurantes en San José\" o \"Museos en Madrid\".")
 
     def _format_place_info(self, place):
         """Formatea la información de un lugar de manera amigable"""
-        info = [f"📍 {place['name']}"]
+        info = [f"📍 {place.name}"]
         
-        if place.get('type'):
-            info.append(f"   Tipo: {place['type']}")
+        if place.type:
+            info.append(f"   Tipo: {place.type}")
         
-        if place.get('description'):
-            info.append(f"   📝 {place['description']}")
+        if place.description:
+            info.append(f"   📝 {place.description}")
         
-        if place.get('rating'):
-            info.append(f"   ⭐ Calificación: {place['rating']}")
+        if place.rating:
+            info.append(f"   ⭐ Calificación: {place.rating}")
         
-        if place.get('opening_hours'):
-            info.append(f"   ⏰ Horario: {place['opening_hours']}")
+        if place.opening_hours:
+            info.append(f"   ⏰ Horario: {place.opening_hours}")
         
-        if place.get('website'):
-            info.append(f"   🌐 Web: {place['website']}")
+        if place.website:
+            info.append(f"   🌐 Web: {place.website}")
             
-        if place.get('phone'):
-            info.append(f"   📞 Tel: {place['phone']}")
+        if place.phone:
+            info.append(f"   📞 Tel: {place.phone}")
             
-        if place.get('address'):
-            info.append(f"   📮 Dirección: {place['address']}")
+        if place.address:
+            info.append(f"   📮 Dirección: {place.address}")
             
         return "\n".join(info)
 
-    def _get_nearby_places(self, lat, lon, radius=2000):
-        """Obtiene lugares cercanos usando Overpass API"""
-        query = f"""
-        [out:json][timeout:25];
-        (
-            node["tourism"](around:{radius},{lat},{lon});
-            node["historic"](around:{radius},{lat},{lon});
-            node["amenity"~"restaurant|cafe|bar|museum|theatre"](around:{radius},{lat},{lon});
-            node["leisure"~"park|garden"](around:{radius},{lat},{lon});
-        );
-        out body;
-        """
-        
-        try:
-            response = requests.get(
-                "https://overpass-api.de/api/interpreter",
-                params={'data': query},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                results = response.json()
-                places = []
-                
-                for element in results.get('elements', []):
-                    if 'tags' in element:
-                        place = {
-                            "name": element['tags'].get('name', 'Sin nombre'),
-                            "type": (
-                                element['tags'].get('tourism') or 
-                                element['tags'].get('historic') or 
-                                element['tags'].get('amenity') or
-                                element['tags'].get('leisure')
-                            ),
-                            "latitude": element.get('lat'),
-                            "longitude": element.get('lon'),
-                            "rating": element['tags'].get('stars', 'No disponible'),
-                            "description": element['tags'].get('description', ''),
-                            "address": element['tags'].get('addr:street', ''),
-                            "opening_hours": element['tags'].get('opening_hours', ''),
-                            "website": element['tags'].get('website', ''),
-                            "phone": element['tags'].get('phone', '')
-                        }
-                        if place['name'] != 'Sin nombre':
-                            places.append(place)
-                
-                return places
-            return []
-        except Exception as e:
-            print(f"Error al obtener lugares cercanos: {str(e)}")
-            return []
+    def _get_nearby_places(self, lat, lon, radius=SEARCH_RADIUS, timeout=None):
+        """Obtiene lugares cercanos usando el servicio compartido de Overpass"""
+        return self.overpass_api.get_places(lat, lon, radius, timeout=timeout)
 
-    def _extract_place_name(self, query):
-        """Extrae el nombre del lugar de la consulta"""
-        location_indicators = ['en', 'de', 'sobre', 'acerca de', 'para', 'cerca de']
-        
-        query = query.lower()
-        for indicator in location_indicators:
-            if indicator in query:
-                parts = query.split(indicator)
-                if len(parts) > 1:
-                    return parts[1].strip()
-        
-        return query.strip()
+    def _stream_nearby_places(self, lat, lon, radius=SEARCH_RADIUS, timeout=None):
+        """Como _get_nearby_places, pero emite un evento 'places' por cada grupo de teselas
 
-    def _generate_response(self, query, places):
-        """Genera una respuesta basada en el tipo de consulta"""
-        query = query.lower()
-        
-        if any(word in query for word in ['restaurante', 'comer', 'comida', 'café', 'bar']):
-            return self._get_restaurants_info(places)
-        elif any(word in query for word in ['museo', 'cultural', 'histórico', 'historia']):
-            return self._get_cultural_places(places)
-        elif any(word in query for word in ['parque', 'jardín', 'aire libre', 'naturaleza']):
-            return self._get_parks_info(places)
-        else:
-            return self._get_general_places_info(places)
+        Generador: retorna la lista completa de lugares.
+        """
+        search = self.overpass_api.iter_places(lat, lon, radius, timeout=timeout)
+        while True:
+            try:
+                batch = next(search)
+            except StopIteration as stop:
+                return stop.value
+            yield {'event': 'places', 'places': [place.to_dict() for place in batch]}
 
-    def _get_restaurants_info(self, places):
-        restaurants = [p for p in places if p['type'] in ['restaurant', 'cafe', 'bar']]
+    def _restaurants_answer(self, places):
+        restaurants = self._places_in(places, 'restaurantes')
         if not restaurants:
-            return "No encontré restaurantes en esta ubicación."
+            return "No encontré restaurantes en esta ubicación.", ()
         
-        response = [f"🍽️ Restaurantes y cafés en {self.current_location}:"]
-        
-        for rest in restaurants[:5]:
-            info = [f"\n\n• {rest['name']}"]
-            if rest['type']:
-                info.append(f"Tipo: {rest['type']}")
-            if rest.get('rating'):
-                info.append(f"⭐ {rest['rating']}")
-            if rest.get('opening_hours'):
-                info.append(f"Horario: {rest['opening_hours']}")
-            if rest.get('website'):
-                info.append(f"Web: {rest['website']}")
-            response.append(" | ".join(info))
-        
-        return "".join(response)
+        response = f"🍽️ Restaurantes y cafés en {self.location_name()}:"
+        return response, self._memoized_entries(places, 'restaurantes', lambda: tuple(
+            self._format_restaurant_entry(rest) for rest in self._top_places(places, 'restaurantes', 5)
+        ))
+
+    def _format_restaurant_entry(self, rest):
+        info = [f"\n\n• {rest.name}"]
+        if rest.type:
+            info.append(f"Tipo: {rest.type}")
+        if rest.rating:
+            info.append(f"⭐ {rest.rating}")
+        if rest.opening_hours:
+            info.append(f"Horario: {rest.opening_hours}")
+        if rest.website:
+            info.append(f"Web: {rest.website}")
+        return " | ".join(info)
 
-    def _get_cultural_places(self, places):
-        cultural = [p for p in places if p['type'] in ['museum', 'historic', 'theatre']]
+    def _cultural_answer(self, places):
+        cultural = self._places_in(places, 'cultura')
         if not cultural:
-            return "No encontré lugares culturales en esta ubicación."
+            return "No encontré lugares culturales en esta ubicación.", ()
         
-        response = [f"🏛️ Lugares culturales en {self.current_location}:\n"]
-        
-        for place in cultural[:5]:
-            info = [f"• {place['name']}"]
-            if place['type']:
-                info.append(f"Tipo: {place['type']}")
-            if place.get('rating'):
-                info.append(f"⭐ {place['rating']}")
-            if place.get('description'):
-                info.append(f"{place['description']}")
-            response.append(" | ".join(info))
-        
-        return "\n\n".join(response)
+        response = f"🏛️ Lugares culturales en {self.location_name()}:\n"
+        return response, self._memoized_entries(places, 'cultura', lambda: tuple(
+            "\n\n" + self._format_entry(place) for place in self._top_places(places, 'cultura', 5)
+        ))
 
-    def _get_parks_info(self, places):
-        parks = [p for p in places if p['type'] in ['park', 'garden']]
+    def _parks_answer(self, places):
+        parks = self._places_in(places, 'naturaleza')
         if not parks:
-            return "No encontré parques en esta ubicación."
-        
-        response = [f"🌳 Parques y jardines en {self.current_location}:\n"]
+            return "No encontré parques en esta ubicación.", ()
         
-        for park in parks[:5]:
-            info = [f"• {park['name']}"]
-            if park['type']:
-                info.append(f"Tipo: {park['type']}")
-            if park.get('rating'):
-                info.append(f"⭐ {park['rating']}")
-            if park.get('description'):
-                info.append(f"{park['description']}")
-            response.append(" | ".join(info))
-        
-        return "\n\n".join(response)
+        response = f"🌳 Parques y jardines en {self.location_name()}:\n"
+        return response, self._memoized_entries(places, 'naturaleza', lambda: tuple(
+            "\n\n" + self._format_entry(park) for park in self._top_places(places, 'naturaleza', 5)
+        ))
 
-    def _get_general_places_info(self, places):
+    def _general_answer(self, places):
         if not places:
-            return "No encontré lugares de interés en esta ubicación."
-        
-        response = [f"📍 Lugares de interés en {self.current_location}:\n"]
+            return "No encontré lugares de interés en esta ubicación.", ()
         
-        for place in places[:8]:
-            info = [f"• {place['name']}"]
-            if place['type']:
-                info.append(f"Tipo: {place['type']}")
-            if place.get('rating'):
-                info.append(f"⭐ {place['rating']}")
-            if place.get('description'):
-                info.append(f"{place['description']}")
-            if place.get('website'):
-                info.append(f"Web: {place['website']}")
-            response.append(" | ".join(info))
+        response = f"📍 Lugares de interés en {self.location_name()}:\n"
+        return response, self._memoized_entries(places, 'general', lambda: tuple(
+            "\n\n" + self._format_entry(place, with_website=True) for place in self._top_places(places, None, 8)
+        ))
+
+    def _format_entry(self, place, with_website=False):
+        info = [f"• {place.name}"]
+        if place.type:
+            info.append(f"Tipo: {place.type}")
+        if place.rating:
+            info.append(f"⭐ {place.rating}")
+        if place.description:
+            info.append(f"{place.description}")
+        if with_website and place.website:
+            info.append(f"Web: {place.website}")
+        return " | ".join(info)
+
+    def _places_in(self, places, category):
+        """Lugares de la categoría usando el índice del PlaceSet"""
+        if isinstance(places, PlaceSet):
+            return places.category(category)
+        return PlaceSet(places).category(category)
+
+    def _top_places(self, places, category, k):
+        """Los k lugares más relevantes de la categoría (o de todos) cerca de la ubicación actual"""
+        latitude, longitude = self.current_location or (None, None)
+        return rank_places(
+            places, latitude, longitude, k, category=category, strict=category is not None,
+            open_at=self.open_at
+        )[0]
+
+    def _memoized_entries(self, places, query_type, render):
+        """Reutiliza las entradas ya formateadas para el mismo conjunto de lugares"""
+        if not isinstance(places, PlaceSet) or self.current_location is None:
+            return render()
         
-        return "\n\n".join(response)
+        latitude, longitude = self.current_location
+        open_key = None
+        if self.open_at is not None:
+            # La respuesta depende de qué lugares están abiertos, no del minuto exacto:
+            # la clave cambia solo cuando alguno abre o cierra
+            open_key = hours_index_for(places).open_mask(self.open_at).tobytes()
+        key = (
+            quantize(latitude, PLACES_CACHE_GRID_PRECISION),
+            quantize(longitude, PLACES_CACHE_GRID_PRECISION),
+            query_type,
+            ANSWER_LANGUAGE,
+            places.fingerprint,
+            open_key
+        )
+        entries = _answer_cache.get(key)
+        if entries is None:
+            entries = render()
+            _answer_cache.set(key, entries)
+        return entries
 
     def get_places_summary(self):
         """Retorna un resumen de los lugares actuales"""
@@ -340,15 +431,12 @@ class LlamaHandler:
             return "No hay lugares almacenados para la ubicación actual."
         
         try:
-            # Contar lugares por tipo
-            place_types = {}
-            for place in self.current_places:
-                place_type = place.get('type', 'Sin clasificar')
-                place_types[place_type] = place_types.get(place_type, 0) + 1
+            # Conteo por tipo calculado al cargar los lugares
+            place_types = self.current_places.type_counts
             
             # Crear resumen
             summary = [
-                f"📊 Resumen de lugares en {self.current_location or 'ubicación actual'}:",
+                f"📊 Resumen de lugares en {self.location_name() or 'ubicación actual'}:",
                 f"\n📍 Total de lugares: {len(self.current_places)}",
                 "\n🏷️ Lugares por tipo:"
             ]
@@ -360,36 +448,53 @@ class LlamaHandler:
             if self.current_places:
                 summary.append("\n✨ Algunos lugares destacados:")
                 for place in self.current_places[:3]:
-                    summary.append(f"  • {place['name']}")
-                    if place.get('type'):
-                        summary.append(f"    Tipo: {place['type']}")
-                    if place.get('opening_hours'):
-                        summary.append(f"    Horario: {place['opening_hours']}")
+                    summary.append(f"  • {place.name}")
+                    if place.type:
+                        summary.append(f"    Tipo: {place.type}")
+                    if place.opening_hours:
+                        summary.append(f"    Horario: {place.opening_hours}")
             
             return "\n".join(summary)
         except Exception as e:
-            print(f"Error al generar resumen: {str(e)}")
+            logger.error("Error al generar resumen", exc_info=True)
             return "Error al generar el resumen de lugares."
 
-    def set_current_location(self, latitude, longitude, radius=2000):
+    def location_name(self):
+        """Nombre de la ubicación actual según el nomenclátor, o sus coordenadas"""
+        if self.current_location is None:
+            return None
+        latitude, longitude = self.current_location
+        entry = self.gazetteer.reverse(latitude, longitude)
+        if entry is None:
+            return f"({latitude:.4f}, {longitude:.4f})"
+        return self.gazetteer.label(entry)
+
+    def set_current_location(self, latitude, longitude, radius=SEARCH_RADIUS, timeout=None):
         """Actualiza los lugares actuales basados en la ubicación"""
         try:
-            print(f"Actualizando ubicación a: {latitude}, {longitude}")
+            logger.debug("Actualizando ubicación", extra=fields(latitude=latitude, longitude=longitude))
             self.current_location = (latitude, longitude)
             
             # Buscar lugares cercanos usando Overpass API
-            places = self._get_nearby_places(latitude, longitude, radius)
-            
-            if places:
-                self.current_places = places
-                print(f"Se encontraron {len(places)} lugares en la nueva ubicación")
-            else:
-                self.current_places = []
-                print("No se encontraron lugares en la nueva ubicación")
-            
-            return len(self.current_places)
+            places = self._get_nearby_places(latitude, longitude, radius, timeout)
+            return self._apply_location(latitude, longitude, places)
         
+        except UpstreamError:
+            # El llamador decide cómo informar que el servicio no está disponible
+            self.current_places = []
+            raise
         except Exception as e:
-            print(f"Error al actualizar ubicación: {str(e)}")
+            logger.error("Error al actualizar ubicación", exc_info=True)
+            self.current_places = []
+            return 0
+
+    def _apply_location(self, latitude, longitude, places):
+        """Guarda en la sesión la ubicación y los lugares ya obtenidos"""
+        self.current_location = (latitude, longitude)
+        if places:
+            self.current_places = places
+            logger.debug("Lugares encontrados en la nueva ubicación", extra=fields(count=len(places)))
+        else:
             self.current_places = []
-            return 0
\ No newline at end of file
+            logger.debug("No se encontraron lugares en la nueva ubicación")
+        return len(self.current_places)
\ No newline at end of file
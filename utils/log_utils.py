@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from config import LOG_LEVEL, LOG_RATE_LIMIT, LOG_RATE_INTERVAL
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def fields(**values):
+    """Campos estructurados para `extra`: logger.info("mensaje", extra=fields(a=1))"""
+    return {'fields': values}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Agrega los campos estructurados al final del mensaje como clave=valor"""
+
+    def format(self, record):
+        message = super().format(record)
+        values = getattr(record, 'fields', None)
+        if values:
+            message += ' ' + ' '.join(f'{key}={value!r}' for key, value in values.items())
+        return message
+
+
+class RateLimitFilter(logging.Filter):
+    """Deja pasar como máximo `limit` registros por línea de código en cada intervalo
+
+    El límite se aplica por lugar de la llamada (archivo y línea), que es el
+    tipo de evento aunque el texto se arme con f-strings. Al abrir un nuevo
+    intervalo se informa cuántos se descartaron; los intervalos viejos se
+    eliminan para que el registro no crezca sin límite.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at >= self.interval:
+                self._sweep(now)
+            started, count, dropped = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                if dropped:
+                    record.msg = f"{record.msg} ({dropped} similares descartados)"
+                started, count, dropped = now, 0, 0
+            if count >= self.limit:
+                self._windows[key] = (started, count, dropped + 1)
+                return False
+            self._windows[key] = (started, count + 1, dropped)
+        return True
+
+    def _sweep(self, now):
+        # Sin descartes pendientes basta un intervalo; con descartes se espera uno más para informarlos
+        for key, (started, _, dropped) in list(self._windows.items()):
+            if now - started >= self.interval * (2 if dropped else 1):
+                del self._windows[key]
+        self._swept_at = now
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Configura el logging raíz con formato estructurado y límite de frecuencia"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(LOG_FORMAT))
+    handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
@@ -0,0 +1,245 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from config import METRICS_ENABLED, METRICS_LATENCY_BUCKETS, METRICS_BYTES_BUCKETS
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador acumulado por combinación de etiquetas"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Gauge:
+    """Valor instantáneo por combinación de etiquetas (colas, solicitudes en curso)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Histogram:
+    """Histograma con cubetas fijas por combinación de etiquetas"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Conteos por cubeta (la última es +Inf), suma y total
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class MetricsRegistry:
+    """Métricas del proceso publicadas en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """Retorna el registro de métricas compartido por el proceso"""
+    return _registry
+
+
+STAGE_SECONDS = _registry.histogram(
+    'backpacker_stage_seconds', 'Duración de cada etapa de una solicitud', ['stage']
+)
+REQUEST_SECONDS = _registry.histogram(
+    'backpacker_request_seconds', 'Duración total de las solicitudes HTTP', ['endpoint', 'status']
+)
+UPSTREAM_REQUESTS = _registry.counter(
+    'backpacker_upstream_requests_total', 'Llamadas a servicios externos', ['service', 'outcome']
+)
+CACHE_LOOKUPS = _registry.counter(
+    'backpacker_cache_lookups_total', 'Consultas a las cachés', ['cache', 'result']
+)
+PAYLOAD_BYTES = _registry.histogram(
+    'backpacker_payload_bytes', 'Tamaño de las respuestas recibidas y enviadas',
+    ['source'], buckets=METRICS_BYTES_BUCKETS
+)
+
+ADMISSION_IN_FLIGHT = _registry.gauge(
+    'backpacker_admission_in_flight', 'Llamadas en curso a cada servicio externo', ['upstream']
+)
+ADMISSION_QUEUE_DEPTH = _registry.gauge(
+    'backpacker_admission_queue_depth', 'Solicitudes esperando turno para un servicio externo', ['upstream']
+)
+ADMISSION_WAIT_SECONDS = _registry.histogram(
+    'backpacker_admission_wait_seconds', 'Tiempo de espera en cola antes de llamar al servicio', ['upstream']
+)
+ADMISSION_SHED = _registry.counter(
+    'backpacker_admission_shed_total', 'Solicitudes rechazadas por sobrecarga', ['upstream', 'reason']
+)
+
+
+@contextmanager
+def timed(stage):
+    """Mide la duración del bloque como una etapa de la solicitud"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def count_upstream(service, outcome):
+    if METRICS_ENABLED:
+        UPSTREAM_REQUESTS.inc(service=service, outcome=outcome)
+
+
+def count_cache(cache, hit):
+    if METRICS_ENABLED:
+        CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def count_stale(cache):
+    """Entrada vencida servida porque el servicio externo no respondió"""
+    if METRICS_ENABLED:
+        CACHE_LOOKUPS.inc(cache=cache, result='stale')
+
+
+def record_admission(upstream, in_flight, queued):
+    if METRICS_ENABLED:
+        ADMISSION_IN_FLIGHT.set(in_flight, upstream=upstream)
+        ADMISSION_QUEUE_DEPTH.set(queued, upstream=upstream)
+
+
+def observe_admission_wait(upstream, seconds):
+    if METRICS_ENABLED:
+        ADMISSION_WAIT_SECONDS.observe(seconds, upstream=upstream)
+
+
+def count_shed(upstream, reason):
+    if METRICS_ENABLED:
+        ADMISSION_SHED.inc(upstream=upstream, reason=reason)
+
+
+def observe_bytes(source, size):
+    if METRICS_ENABLED:
+        PAYLOAD_BYTES.observe(size, source=source)
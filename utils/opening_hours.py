@@ -0,0 +1,247 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from config import (
+    OPENING_HOURS_TIMEZONE, OPENING_HOURS_CACHE_ENTRIES, PLACES_CACHE_TTL, RANKING_FEATURES_CACHE_ENTRIES
+)
+from utils.cache import TTLCache
+from utils.place import PlaceSet, NOT_AVAILABLE
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9: se usa la hora local del servidor
+    ZoneInfo = None
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# Bytes de un horario compilado: un bit por minuto de la semana, desde el lunes 00:00
+WEEK_BYTES = MINUTES_PER_WEEK // 8
+
+WEEKDAYS = {'mo': 0, 'tu': 1, 'we': 2, 'th': 3, 'fr': 4, 'sa': 5, 'su': 6}
+
+# Subconjunto de la sintaxis de OSM: días, feriados, rangos horarios y off/open.
+# Meses, semanas, amanecer/atardecer o comentarios no se reconocen y el horario
+# queda como desconocido.
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<always>24/7)
+      | (?P<start>\d{1,2}:\d{2})(?:\s*-\s*(?P<end>\d{1,2}:\d{2}))?(?P<open_end>\+)?
+      | (?P<day>Mo|Tu|We|Th|Fr|Sa|Su)(?:\s*-\s*(?P<last_day>Mo|Tu|We|Th|Fr|Sa|Su))?
+      | (?P<holiday>PH|SH)
+      | (?P<state>off|closed|open|unknown)
+      | (?P<comma>,)
+    )\s*
+''', re.VERBOSE | re.IGNORECASE)
+
+# Horarios de la consulta "abierto ahora" de cada conjunto de lugares, por huella
+_index_cache = TTLCache(
+    max_entries=RANKING_FEATURES_CACHE_ENTRIES, ttl=PLACES_CACHE_TTL, name='opening_hours'
+)
+
+
+def _minutes(text):
+    hours, minutes = map(int, text.split(':'))
+    if minutes > 59 or hours > 48:
+        raise ValueError(text)
+    return hours * 60 + minutes
+
+
+def _days(match):
+    first = WEEKDAYS[match.group('day').lower()]
+    last = match.group('last_day')
+    if last is None:
+        return [first]
+    last = WEEKDAYS[last.lower()]
+    return [(first + i) % 7 for i in range((last - first) % 7 + 1)]
+
+
+class _Rule:
+    __slots__ = ('days', 'holiday', 'spans', 'state', 'additional')
+
+    def __init__(self, additional=False):
+        self.days = []
+        self.holiday = False
+        self.spans = []
+        self.state = None
+        self.additional = additional
+
+    def started(self):
+        return bool(self.spans) or self.state is not None
+
+
+def _parse_rules(text):
+    """Reglas de una cadena opening_hours; lanza ValueError si algo no se reconoce"""
+    rules = []
+    for part in text.split(';'):
+        if not part.strip():
+            continue
+        rule = _Rule()
+        rules.append(rule)
+        pos = 0
+        while pos < len(part):
+            match = _TOKEN.match(part, pos)
+            if match is None or match.end() == pos:
+                raise ValueError(part[pos:])
+            pos = match.end()
+            if match.group('always'):
+                rule.spans.append((0, MINUTES_PER_DAY))
+            elif match.group('start'):
+                start = _minutes(match.group('start'))
+                if match.group('end'):
+                    end = _minutes(match.group('end'))
+                    if end <= start:
+                        end += MINUTES_PER_DAY  # pasa la medianoche
+                elif match.group('open_end'):
+                    end = max(start, MINUTES_PER_DAY)  # sin hora de cierre: hasta el fin del día
+                else:
+                    raise ValueError(match.group())
+                rule.spans.append((start, end))
+            elif match.group('day') or match.group('holiday'):
+                if rule.started():
+                    # "Mo-Fr 08:00-12:00, Sa 09:00-12:00": la coma inicia una regla adicional
+                    rule = _Rule(additional=True)
+                    rules.append(rule)
+                if match.group('holiday'):
+                    rule.holiday = True
+                else:
+                    rule.days.extend(_days(match))
+            elif match.group('state'):
+                rule.state = match.group('state').lower()
+    return rules
+
+
+@lru_cache(maxsize=OPENING_HOURS_CACHE_ENTRIES)
+def compile_opening_hours(text):
+    """Compila una cadena opening_hours de OSM a un mapa de bits semanal
+
+    Retorna WEEK_BYTES bytes (un bit por minuto, desde el lunes 00:00) o None
+    si la cadena está vacía o usa sintaxis que no se reconoce. Muchos lugares
+    comparten la misma cadena, así que el resultado se guarda por texto.
+    """
+    if not text or text == NOT_AVAILABLE:
+        return None
+    try:
+        rules = _parse_rules(text)
+    except ValueError:
+        return None
+    if not rules:
+        return None
+
+    week = np.zeros(MINUTES_PER_WEEK, dtype=bool)
+    for rule in rules:
+        if rule.state == 'unknown':
+            return None
+        if rule.holiday and not rule.days:
+            # Los feriados no se conocen: rige el horario de la semana normal
+            continue
+        days = rule.days or range(7)
+        if not rule.additional or rule.state in ('off', 'closed'):
+            # Una regla tras ';' reemplaza el horario de sus días
+            for day in days:
+                week[day * MINUTES_PER_DAY:(day + 1) * MINUTES_PER_DAY] = False
+        if rule.state in ('off', 'closed'):
+            continue
+        for day in days:
+            for start, end in rule.spans or [(0, MINUTES_PER_DAY)]:
+                first = day * MINUTES_PER_DAY + start
+                last = day * MINUTES_PER_DAY + end
+                if last <= MINUTES_PER_WEEK:
+                    week[first:last] = True
+                else:
+                    # Domingo por la noche que sigue el lunes de madrugada
+                    week[first:] = True
+                    week[:last - MINUTES_PER_WEEK] = True
+    return np.packbits(week).tobytes()
+
+
+@lru_cache(maxsize=1)
+def _zone():
+    if ZoneInfo is None or not OPENING_HOURS_TIMEZONE:
+        return None
+    try:
+        return ZoneInfo(OPENING_HOURS_TIMEZONE)
+    except (KeyError, ValueError):  # sin base de datos de zonas horarias
+        return None
+
+
+def minute_of_week(when=None):
+    """Minuto de la semana (lunes 00:00 = 0) en la zona horaria de los lugares
+
+    Sin `when` se usa la hora actual; una fecha sin zona horaria se toma como
+    hora local de los lugares.
+    """
+    zone = _zone()
+    if when is None:
+        when = datetime.now(zone)
+    elif when.tzinfo is not None and zone is not None:
+        when = when.astimezone(zone)
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+def is_open(text, minute):
+    """True/False si el horario indica abierto en ese minuto de la semana; None si se desconoce"""
+    compiled = compile_opening_hours(text)
+    if compiled is None:
+        return None
+    return bool(compiled[minute >> 3] >> (7 - (minute & 7)) & 1)
+
+
+class OpeningHoursIndex:
+    """Horarios compilados de un conjunto de lugares para filtrarlos en una sola pasada
+
+    `codes` indica la fila de `table` de cada lugar (-1 si el horario se
+    desconoce); las cadenas repetidas comparten fila.
+    """
+
+    __slots__ = ('codes', 'table')
+
+    def __init__(self, places):
+        rows, row_of, codes = [], {}, []
+        for place in places:
+            text = place.opening_hours
+            code = row_of.get(text)
+            if code is None:
+                compiled = compile_opening_hours(text)
+                if compiled is None:
+                    code = -1
+                else:
+                    code = len(rows)
+                    rows.append(compiled)
+                row_of[text] = code
+            codes.append(code)
+        self.codes = np.array(codes, dtype=np.int32)
+        self.table = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), WEEK_BYTES)
+
+    def known(self):
+        """Lugares con un horario que se pudo interpretar"""
+        return self.codes >= 0
+
+    def open_mask(self, minute):
+        """Lugares abiertos en ese minuto de la semana; los de horario desconocido no cuentan"""
+        if not len(self.table):
+            return np.zeros(len(self.codes), dtype=bool)
+        open_rows = (self.table[:, minute >> 3] >> (7 - (minute & 7))) & 1
+        return (open_rows[np.maximum(self.codes, 0)] == 1) & (self.codes >= 0)
+
+
+def hours_index_for(places):
+    """Índice de horarios; en un PlaceSet se guarda para las siguientes consultas"""
+    if not isinstance(places, PlaceSet):
+        return OpeningHoursIndex(places)
+    if places.hours is None:
+        key = (places.fingerprint, len(places))
+        index = _index_cache.get(key)
+        if index is None:
+            index = OpeningHoursIndex(places)
+            _index_cache.set(key, index)
+        places.hours = index
+    return places.hours
+
+
+def filter_open(places, minute):
+    """Lugares abiertos en ese minuto de la semana, en el mismo orden"""
+    if not places:
+        return []
+    mask = hours_index_for(places).open_mask(minute)
+    return [places[index] for index in np.flatnonzero(mask).tolist()]
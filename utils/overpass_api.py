@@ -1,48 +1,488 @@
-import requests
+import codecs
+import json
 import logging
-from config import OVERPASS_API_URL, OVERPASS_TIMEOUT, PLACE_TYPES
+import math
+import re
+import threading
+import time
+import numpy as np
+import requests
+from config import (
+    OVERPASS_TIMEOUT, OVERPASS_MAX_ELEMENTS, OVERPASS_STREAM_CHUNK_SIZE, PLACE_TYPES,
+    PLACES_CACHE_GRID_PRECISION, OVERPASS_TILE_ZOOM, OVERPASS_TILE_MAX_ELEMENTS,
+    OVERPASS_MAX_TILES_PER_QUERY, OVERPASS_MAX_TILES_PER_SEARCH
+)
+from utils.cache import get_places_cache, get_tile_cache, places_cache_key, quantize, tile_cache_key
+from utils.geo_utils import EARTH_RADIUS, assign_nearest, nearby_indices
+from utils.log_utils import fields
+from utils.metrics import count_cache, observe_bytes, timed
+from utils.place import Place, NOT_AVAILABLE
+from utils.tiles import merge_tiles, tile_for, tiles_for_circle
+from utils.upstream import UpstreamError, get_overpass_client
 
 logger = logging.getLogger(__name__)
 
-class OverpassAPI:
+_ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+# Overpass informa errores de ejecución (tiempo o memoria agotados) con "remark"
+_REMARK = re.compile(r'"remark"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# Caracteres que se leen buscando "elements" (o tras el arreglo buscando "remark")
+_ENVELOPE_MAX_CHARS = 1 << 16
+# Distancia máxima entre un punto y el centro de su celda de caché (media diagonal)
+_CELL_MARGIN = math.ceil(
+    math.radians(10 ** -PLACES_CACHE_GRID_PRECISION) * EARTH_RADIUS * math.sqrt(2) / 2
+)
+
+
+class _TileFetch:
+    """Descarga de una tesela en curso, compartida por búsquedas que la necesitan"""
+
     def __init__(self):
-        self.api_url = OVERPASS_API_URL
+        self.event = threading.Event()
+        self.places = ()
+        self.error = None
+
+
+class OverpassAPI:
+    def __init__(self, cache=None, client=None, local_store=None, tile_cache=None):
         self.timeout = OVERPASS_TIMEOUT
+        self.cache = cache if cache is not None else get_places_cache()
+        self.tile_cache = tile_cache if tile_cache is not None else get_tile_cache()
+        self.tile_zoom = OVERPASS_TILE_ZOOM
+        self.client = client or get_overpass_client()
+        self.local_store = local_store
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        # Rastreador opcional de áreas consultadas con frecuencia (ver utils.prefetch)
+        self.tracker = None
+
+    def get_places(self, latitude, longitude, radius, timeout=None):
+        """Obtiene lugares cercanos usando Overpass API
+
+        El área se divide en teselas y solo se descargan las que no están en
+        caché; la respuesta se arma con los lugares de las teselas dentro del
+        radio, ordenados por distancia. Si Overpass no responde o está saturado se
+        usan los datos vencidos en caché; sin ellos se lanza UpstreamError.
+        """
+        return _drain(self._search_places(latitude, longitude, radius, timeout))
+
+    def iter_places(self, latitude, longitude, radius, timeout=None):
+        """Como get_places, pero emite los lugares a medida que llegan las teselas
+
+        Generador: emite una lista con los lugares dentro del radio de cada
+        grupo de teselas listo (primero las que estaban en caché y luego una
+        por consulta combinada) y retorna la misma lista completa que
+        get_places. Lo que no pasa por teselas llega solo en el retorno.
+        """
+        search = self._search_places(latitude, longitude, radius, timeout)
+        while True:
+            try:
+                by_tile = next(search)
+            except StopIteration as stop:
+                return stop.value
+            batch = self._within_radius(latitude, longitude, radius, list(by_tile), by_tile)
+            if batch:
+                yield batch
+
+    def _search_places(self, latitude, longitude, radius, timeout=None):
+        """Generador de get_places: emite {tesela: lugares} por grupo y retorna la respuesta"""
+        # Áreas que los POI locales declaran cubiertas se responden sin red
+        if self.local_store is not None:
+            covered = self.local_store.covers(latitude, longitude, radius)
+            count_cache('local_poi', covered)
+            if covered:
+                return self.local_store.nearby(latitude, longitude, radius)
+
+        # La caché guarda los lugares de toda la celda; cada búsqueda recorta y
+        # ordena según su propio punto y radio
+        cache_key, area = self._cell_area(latitude, longitude, radius)
+        if self.tracker is not None:
+            self.tracker.record(cache_key, (latitude, longitude, radius))
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Caché de lugares: acierto", extra=fields(key=cache_key))
+            return self._nearest(latitude, longitude, radius, cached)
+
+        try:
+            places = yield from self._iter_places_from_tiles(*area, timeout)
+        except UpstreamError as e:
+            # Lo vencido no se vuelve a guardar: la próxima búsqueda intenta renovarlo
+            stale = self.cache.get_stale(cache_key)
+            if stale is not None:
+                stale = self._nearest(latitude, longitude, radius, stale)
+            else:
+                tiles = self._circle_tiles(latitude, longitude, radius)
+                by_tile = self._stale_tiles(tiles) if tiles is not None else None
+                if by_tile is not None:
+                    stale = self._within_radius(latitude, longitude, radius, tiles, by_tile)
+            if stale is None:
+                raise
+            logger.warning("Overpass no disponible: se responde con caché vencida", extra=fields(
+                key=cache_key, error=str(e)
+            ))
+            return list(stale)
+        
+        places = self._add_local(*area, places)
+        self.cache.set(cache_key, places)
+        return self._nearest(latitude, longitude, radius, places)
+
+    @staticmethod
+    def _cell_area(lat, lon, radius):
+        """(clave de caché, (lat, lon, radio)) del área que se guarda para la celda del punto
+
+        El área está centrada en la celda y su radio alcanza para cualquier
+        punto de la celda, así la entrada sirve a todas las búsquedas que caen
+        en ella.
+        """
+        center_lat = quantize(lat, PLACES_CACHE_GRID_PRECISION)
+        center_lon = quantize(lon, PLACES_CACHE_GRID_PRECISION)
+        cache_key = places_cache_key(center_lat, center_lon, radius, PLACE_TYPES, PLACES_CACHE_GRID_PRECISION)
+        return cache_key, (center_lat, center_lon, radius + _CELL_MARGIN)
+
+    @staticmethod
+    def _nearest(lat, lon, radius, places):
+        """Lugares dentro del radio, ordenados por distancia al punto"""
+        if not places:
+            return []
+        indices, _ = nearby_indices(
+            lat, lon, radius,
+            [place.latitude for place in places], [place.longitude for place in places]
+        )
+        return [places[index] for index in indices.tolist()]
+
+    def _add_local(self, lat, lon, radius, places):
+        """Agrega los POI locales del área que Overpass no trajo, en orden de distancia"""
+        if self.local_store is None:
+            return places
+        seen = {_place_key(place) for place in places}
+        extra = [place for place in self.local_store.nearby(lat, lon, radius) if _place_key(place) not in seen]
+        if not extra:
+            return places
+        return self._nearest(lat, lon, radius, list(places) + extra)
+
+    def get_places_batch(self, points, timeout=None, limit=None):
+        """Obtiene lugares para varios puntos (lat, lon, radio) con una sola ronda de descargas
+
+        Las teselas de todos los puntos se piden juntas. Cada lugar se asigna
+        al punto más cercano cuyo radio lo contiene. Retorna, por punto, sus
+        lugares con 'distance', ordenados por distancia.
+        """
+        candidates = {}
+        remote = []
+        local = []
+        for lat, lon, radius in points:
+            if self.local_store is not None:
+                covered = self.local_store.covers(lat, lon, radius)
+                count_cache('local_poi', covered)
+                places = self.local_store.nearby(lat, lon, radius)
+                if covered:
+                    for place in places:
+                        candidates.setdefault(_place_key(place), place)
+                    continue
+                # Sin cobertura declarada solo complementan lo que responda Overpass
+                local.extend(places)
+            remote.append((lat, lon, radius))
+        
+        if remote:
+            tiles = list(dict.fromkeys(
+                tile for lat, lon, radius in remote
+                for tile in tiles_for_circle(lat, lon, radius, self.tile_zoom)
+            ))
+            try:
+                by_tile = self._get_tiles(tiles, timeout)
+            except UpstreamError as e:
+                by_tile = self._stale_tiles(tiles)
+                if by_tile is None:
+                    raise
+                logger.warning("Overpass no disponible: se responde con teselas vencidas", extra=fields(
+                    tiles=len(tiles), error=str(e)
+                ))
+            for tile in tiles:
+                for place in by_tile[tile]:
+                    candidates.setdefault(_place_key(place), place)
+            for place in local:
+                candidates.setdefault(_place_key(place), place)
+        
+        results = [[] for _ in points]
+        places = list(candidates.values())
+        if not places:
+            return results
+        
+        owners, distances = assign_nearest(
+            [place.latitude for place in places],
+            [place.longitude for place in places],
+            [lat for lat, _, _ in points],
+            [lon for _, lon, _ in points],
+            [radius for _, _, radius in points]
+        )
+        for index in np.flatnonzero(owners >= 0).tolist():
+            results[owners[index]].append(places[index].with_distance(int(round(distances[index]))))
+        
+        for i, found in enumerate(results):
+            found.sort(key=lambda place: place.distance)
+            if limit is not None:
+                results[i] = found[:limit]
+        return results
+
+    def stale_tiles(self, lat, lon, radius, margin):
+        """Teselas del área de caché del punto que faltan o vencen dentro de `margin` segundos
+
+        Un área cubierta por los POI locales o demasiado grande para dividirla
+        en teselas no tiene teselas que renovar.
+        """
+        if self.local_store is not None and self.local_store.covers(lat, lon, radius):
+            return []
+        tiles = self._circle_tiles(*self._cell_area(lat, lon, radius)[1])
+        if tiles is None:
+            return []
+        stale = []
+        for tile in tiles:
+            remaining = self.tile_cache.ttl_remaining(tile_cache_key(tile, PLACE_TYPES))
+            if remaining is None or remaining < margin:
+                stale.append(tile)
+        return stale
+
+    def refresh_places(self, lat, lon, radius, tiles, timeout=None):
+        """Vuelve a descargar las teselas indicadas y renueva el área de caché del punto"""
+        if tiles:
+            self._fetch_tiles(tiles, timeout)
+        cache_key, area = self._cell_area(lat, lon, radius)
+        places = self._places_from_tiles(*area, timeout)
+        self.cache.set(cache_key, self._add_local(*area, places))
+
+    def _circle_tiles(self, lat, lon, radius):
+        """Teselas del círculo o None si son más de OVERPASS_MAX_TILES_PER_SEARCH"""
+        return tiles_for_circle(lat, lon, radius, self.tile_zoom, OVERPASS_MAX_TILES_PER_SEARCH)
+
+    def _places_from_tiles(self, lat, lon, radius, timeout=None):
+        """Lugares dentro del radio armados con las teselas que cubren el círculo"""
+        return _drain(self._iter_places_from_tiles(lat, lon, radius, timeout))
+
+    def _iter_places_from_tiles(self, lat, lon, radius, timeout=None):
+        """Generador de _places_from_tiles: emite {tesela: lugares} por grupo listo
+
+        Un área con demasiadas teselas se pide con una sola consulta around:
+        que no pasa por la caché de teselas, para no desplazar las de
+        búsquedas normales.
+        """
+        tiles = self._circle_tiles(lat, lon, radius)
+        if tiles is None:
+            places = list(self._stream_places(self._build_query(lat, lon, radius), timeout))
+            return self._nearest(lat, lon, radius, places)
+        by_tile = {}
+        for found in self._iter_tiles(tiles, timeout):
+            by_tile.update(found)
+            yield found
+        return self._within_radius(lat, lon, radius, tiles, by_tile)
+
+    def _within_radius(self, lat, lon, radius, tiles, by_tile):
+        """Lugares de las teselas dentro del radio, ordenados por distancia"""
+        candidates = [place for tile in tiles for place in by_tile[tile]]
+        if not candidates:
+            return []
+        
+        lats = np.fromiter((place.latitude for place in candidates), dtype=np.float64, count=len(candidates))
+        lons = np.fromiter((place.longitude for place in candidates), dtype=np.float64, count=len(candidates))
+        indices, _ = nearby_indices(lat, lon, radius, lats, lons, k=OVERPASS_MAX_ELEMENTS)
+        return [candidates[index] for index in indices.tolist()]
+
+    def _get_tiles(self, tiles, timeout=None):
+        """Retorna {tesela: lugares}, descargando solo las que faltan
+
+        Si otra búsqueda ya está descargando una tesela se espera su resultado
+        en lugar de pedirla de nuevo.
+        """
+        found = {}
+        for batch in self._iter_tiles(tiles, timeout):
+            found.update(batch)
+        return found
 
-    def get_places(self, latitude, longitude, radius):
-        """Obtiene lugares cercanos usando Overpass API"""
+    def _iter_tiles(self, tiles, timeout=None):
+        """Generador de _get_tiles: emite {tesela: lugares} por grupo listo
+
+        Primero las teselas en caché, luego cada consulta combinada y al final
+        las que descargaba otra búsqueda.
+        """
+        found = {}
+        for tile in tiles:
+            places = self.tile_cache.get(tile_cache_key(tile, PLACE_TYPES))
+            if places is not None:
+                found[tile] = places
+        if found:
+            yield dict(found)
+        
+        claimed, waiting = [], []
+        with self._lock:
+            for tile in tiles:
+                if tile in found:
+                    continue
+                fetch = self._in_flight.get(tile)
+                if fetch is None:
+                    self._in_flight[tile] = _TileFetch()
+                    claimed.append(tile)
+                else:
+                    waiting.append((tile, fetch))
+        
+        error = None
         try:
-            query = self._build_query(latitude, longitude, radius)
-            response = requests.get(
-                self.api_url,
-                params={'data': query},
-                timeout=self.timeout
-            )
+            if claimed:
+                for batch in self._iter_fetch_tiles(claimed, timeout):
+                    found.update(batch)
+                    yield batch
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # También si el consumidor abandona el generador a mitad de la descarga
+            with self._lock:
+                fetches = [self._in_flight.pop(tile) for tile in claimed]
+            for tile, fetch in zip(claimed, fetches):
+                fetch.places = found.get(tile, ())
+                if tile not in found:
+                    fetch.error = error or UpstreamError("Overpass: descarga de tesela interrumpida")
+                fetch.event.set()
+        
+        for tile, fetch in waiting:
+            if not fetch.event.wait(timeout or self.timeout):
+                raise UpstreamError("Overpass: tiempo agotado esperando una tesela")
+            if fetch.error is not None:
+                raise fetch.error
+            yield {tile: fetch.places}
+
+    def _stale_tiles(self, tiles):
+        """{tesela: lugares} con lo guardado en caché aunque haya vencido; None si falta alguna"""
+        found = {}
+        for tile in tiles:
+            places = self.tile_cache.get_stale(tile_cache_key(tile, PLACE_TYPES))
+            if places is None:
+                return None
+            found[tile] = places
+        return found
+
+    def _fetch_tiles(self, tiles, timeout=None):
+        """Descarga teselas en consultas combinadas y las guarda en caché"""
+        found = {}
+        for batch in self._iter_fetch_tiles(tiles, timeout):
+            found.update(batch)
+        logger.debug("Teselas descargadas", extra=fields(tiles=len(tiles)))
+        return found
+
+    def _iter_fetch_tiles(self, tiles, timeout=None):
+        """Generador de _fetch_tiles: emite {tesela: lugares} de cada consulta al terminarla"""
+        for start in range(0, len(tiles), OVERPASS_MAX_TILES_PER_QUERY):
+            batch = tiles[start:start + OVERPASS_MAX_TILES_PER_QUERY]
+            wanted = set(batch)
+            found = {tile: [] for tile in batch}
+            query = self._build_tile_query(merge_tiles(batch))
             
-            if response.status_code == 200:
-                return self._process_results(response.json())
+            received = 0
+            for place in self._stream_places(query, timeout, limit=OVERPASS_TILE_MAX_ELEMENTS):
+                received += 1
+                # Los rectángulos incluyen el borde: cada lugar va solo a su tesela
+                tile = tile_for(place.latitude, place.longitude, self.tile_zoom)
+                if tile in wanted:
+                    found[tile].append(place)
             
-            logger.error(f"Error Overpass API: {response.status_code}")
-            return []
+            if received >= OVERPASS_TILE_MAX_ELEMENTS:
+                # Respuesta recortada: las teselas podrían estar incompletas
+                logger.warning("Consulta de teselas truncada", extra=fields(
+                    tiles=len(batch), limit=OVERPASS_TILE_MAX_ELEMENTS
+                ))
+                yield found
+                continue
+            for tile in batch:
+                found[tile] = tuple(found[tile])
+                self.tile_cache.set(tile_cache_key(tile, PLACE_TYPES), found[tile])
+            yield found
+
+    def _build_tile_query(self, boxes):
+        """Consulta Overpass con la unión de los rectángulos de teselas"""
+        query_parts = []
+        
+        for south, west, north, east in boxes:
+            bbox = f"{south:.7f},{west:.7f},{north:.7f},{east:.7f}"
+            for category, types in PLACE_TYPES.items():
+                types_str = '|'.join(types)
+                query_parts.append(f'node["{category}"~"^({types_str})$"]["name"]({bbox});')
+        
+        return f"""
+        [out:json][timeout:{self.timeout}];
+        ({' '.join(query_parts)}); out body qt {OVERPASS_TILE_MAX_ELEMENTS};
+        """
+
+    def _stream_places(self, query, timeout=None, limit=None):
+        """Descarga y procesa la respuesta de Overpass de forma incremental
+
+        La descarga ocupa un turno del control de admisión del cliente hasta
+        terminar de leer el cuerpo; la espera por el turno descuenta del plazo.
+        """
+        budget = timeout or self.timeout
+        started = time.monotonic()
+        with self.client.admission.admit(budget):
+            with timed('overpass_fetch'):
+                response = self.client.get(
+                    {'data': query}, timeout=budget - (time.monotonic() - started), stream=True
+                )
+            yield from self._read_places(response, limit)
+
+    def _read_places(self, response, limit=None):
+        """Lee el cuerpo de la respuesta y lo convierte en lugares"""
+        received = 0
+
+        def counted(chunks):
+            nonlocal received
+            for chunk in chunks:
+                received += len(chunk)
+                yield chunk
+
+        try:
+            # Incluye la lectura del cuerpo, que se descarga a medida que se procesa
+            with timed('parse'):
+                chunks = response.iter_content(chunk_size=OVERPASS_STREAM_CHUNK_SIZE)
+                yield from self._iter_places(iter_elements(counted(chunks)), limit)
+        except (requests.RequestException, ValueError) as e:
+            raise UpstreamError(f"Respuesta inválida de Overpass: {str(e)}")
+        finally:
+            # Cerrar deja de leer el cuerpo si se cortó antes de terminar
+            response.close()
+            observe_bytes('overpass', received)
+
+    def _iter_places(self, elements, limit=None):
+        """Normaliza elementos a medida que llegan y corta al reunir suficientes"""
+        limit = limit or OVERPASS_MAX_ELEMENTS
+        total = 0
+        seen = set()
+        
+        for element in elements:
+            element_id = element.get('id')
+            if element_id is not None:
+                if element_id in seen:
+                    continue
+                seen.add(element_id)
             
-        except Exception as e:
-            logger.error(f"Error al obtener lugares: {str(e)}", exc_info=True)
-            return []
+            place = element_to_place(element)
+            if place is None:
+                continue
+            
+            total += 1
+            yield place
+            if total >= limit:
+                return
 
     def _build_query(self, lat, lon, radius):
-        """Construye la consulta Overpass"""
+        """Construye la consulta Overpass
+
+        Solo se piden nodos con nombre (los demás se descartan de todos modos),
+        con tope de resultados y orden por quadtile, que es el más barato.
+        """
         query_parts = []
         
         for category, types in PLACE_TYPES.items():
             types_str = '|'.join(types)
-            query_parts.append(
-                f'node["{category}"~"{types_str}"](around:{radius},{lat},{lon});'
-            )
+            query_parts.append(f'node["{category}"~"^({types_str})$"]["name"](around:{radius},{lat},{lon});')
         
         return f"""
         [out:json][timeout:{self.timeout}];
-        ({' '.join(query_parts)});
-        out body;
+        ({' '.join(query_parts)}); out body qt {OVERPASS_MAX_ELEMENTS};
         """
 
     def _process_results(self, results):
@@ -50,26 +490,127 @@ class OverpassAPI:
         places = []
         
         for element in results.get('elements', []):
-            if 'tags' in element:
-                place = {
-                    "name": element['tags'].get('name', 'Desconocido'),
-                    "latitude": element.get('lat'),
-                    "longitude": element.get('lon'),
-                    "type": self._get_place_type(element['tags']),
-                    "description": element['tags'].get('description', ''),
-                    "website": element['tags'].get('website', ''),
-                    "rating": element['tags'].get('rating', 'No disponible'),
-                    "opening_hours": element['tags'].get('opening_hours', ''),
-                    "phone": element['tags'].get('phone', '')
-                }
-                if place['name'] != 'Desconocido':
-                    places.append(place)
+            place = element_to_place(element)
+            if place is not None:
+                places.append(place)
         
         return places
 
     def _get_place_type(self, tags):
         """Determina el tipo principal del lugar"""
-        for category, types in PLACE_TYPES.items():
-            if category in tags and tags[category] in types:
-                return tags[category]
-        return 'other' 
\ No newline at end of file
+        return get_place_type(tags)
+
+
+def _drain(generator):
+    """Consume un generador y retorna su valor de retorno"""
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _place_key(place):
+    """Identifica un lugar entre fuentes cuyas coordenadas difieren por redondeo"""
+    return (place.name, round(place.latitude, 4), round(place.longitude, 4))
+
+
+def element_to_place(element):
+    """Normaliza un elemento de Overpass; retorna None si no tiene nombre"""
+    if 'tags' not in element:
+        return None
+    
+    tags = element['tags']
+    name = tags.get('name', 'Desconocido')
+    if name == 'Desconocido':
+        return None
+    
+    return Place(
+        name=name,
+        latitude=element.get('lat'),
+        longitude=element.get('lon'),
+        type=get_place_type(tags),
+        description=tags.get('description', ''),
+        website=tags.get('website', ''),
+        rating=tags.get('rating') or tags.get('stars') or NOT_AVAILABLE,
+        opening_hours=tags.get('opening_hours', ''),
+        phone=tags.get('phone', ''),
+        address=tags.get('addr:street', '')
+    )
+
+
+def get_place_category(tags):
+    """Retorna la clave de PLACE_TYPES (tourism, amenity, ...) del lugar"""
+    for category, types in PLACE_TYPES.items():
+        if category in tags and tags[category] in types:
+            return category
+    return None
+
+
+def iter_elements(chunks):
+    """Recorre el arreglo "elements" de una respuesta JSON que llega por partes
+
+    Cada elemento se decodifica apenas está completo, sin cargar el cuerpo
+    entero en memoria.
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    in_array = False
+    
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        
+        if not in_array:
+            match = _ELEMENTS_START.search(buffer)
+            if match is None:
+                if len(buffer) > _ENVELOPE_MAX_CHARS:
+                    raise ValueError("Respuesta de Overpass sin arreglo 'elements'")
+                continue
+            _check_remark(buffer[:match.start()])
+            pos = match.end()
+            in_array = True
+        
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ']':
+                # Un error de ejecución llega después del arreglo, que queda incompleto
+                tail = buffer[pos + 1:]
+                for chunk in chunks:
+                    if len(tail) > _ENVELOPE_MAX_CHARS:
+                        break
+                    tail += text_decoder.decode(chunk)
+                _check_remark(tail)
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Elemento incompleto: esperar el siguiente fragmento
+                break
+            pos = end
+            yield element
+    
+    if in_array:
+        raise ValueError("Respuesta de Overpass truncada")
+    _check_remark(buffer)
+    raise ValueError("Respuesta de Overpass sin arreglo 'elements'")
+
+
+def _check_remark(text):
+    match = _REMARK.search(text)
+    if match is not None:
+        raise ValueError(f"Overpass informó un error: {match.group(1)[:200]}")
+
+
+def get_place_type(tags):
+    """Determina el tipo principal del lugar según PLACE_TYPES"""
+    for category, types in PLACE_TYPES.items():
+        if category in tags and tags[category] in types:
+            return tags[category]
+    return 'other'
@@ -0,0 +1,197 @@
+import json
+import sys
+from config import PLACE_CATEGORIES
+
+NOT_AVAILABLE = sys.intern('No disponible')
+
+# Orden de los campos en las respuestas JSON
+FIELDS = (
+    'name', 'latitude', 'longitude', 'type', 'description', 'website',
+    'rating', 'opening_hours', 'phone', 'address'
+)
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional: serialización más rápida si está instalada
+    orjson = None
+
+if orjson is not None:
+    def _encode(obj):
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+def _is_empty(value):
+    """Valores que las respuestas compactas omiten"""
+    return value is None or value == '' or value == NOT_AVAILABLE
+
+
+class Place:
+    """Lugar de interés compacto; se usa igual que el diccionario que reemplaza"""
+
+    __slots__ = FIELDS + ('distance', '_json', '_compact_json')
+
+    def __init__(self, name, latitude, longitude, type='other', description='',
+                 website='', rating=NOT_AVAILABLE, opening_hours='', phone='',
+                 address='', distance=None):
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        # Tipos y valores por defecto se repiten en miles de lugares: compartir el objeto
+        self.type = sys.intern(type) if type else type
+        self.description = description
+        self.website = website
+        self.rating = NOT_AVAILABLE if rating == NOT_AVAILABLE else rating
+        self.opening_hours = opening_hours
+        self.phone = phone
+        self.address = address
+        self.distance = distance
+        self._json = None
+        self._compact_json = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in FIELDS + ('distance',) if key in data})
+
+    def __getitem__(self, key):
+        if key in FIELDS or (key == 'distance' and self.distance is not None):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in FIELDS or (key == 'distance' and self.distance is not None)
+
+    def __eq__(self, other):
+        if not isinstance(other, Place):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Place({self.name!r}, {self.latitude}, {self.longitude}, type={self.type!r})"
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in FIELDS + ('distance',))
+
+    def __setstate__(self, state):
+        for key, value in zip(FIELDS + ('distance',), state):
+            setattr(self, key, value)
+        self._json = None
+        self._compact_json = None
+
+    def with_distance(self, distance):
+        """Copia del lugar con la distancia al origen de la búsqueda"""
+        place = Place.__new__(Place)
+        for key in FIELDS:
+            setattr(place, key, getattr(self, key))
+        place.distance = distance
+        place._json = self._json
+        place._compact_json = self._compact_json
+        return place
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in FIELDS}
+        if self.distance is not None:
+            data['distance'] = self.distance
+        return data
+
+    def to_json(self, compact=False, only=None):
+        """JSON del lugar; la parte fija se codifica una sola vez y se reutiliza
+
+        compact omite los campos vacíos o con 'No disponible'; only limita la
+        salida a los campos indicados (incluida 'distance').
+        """
+        if only is not None:
+            data = {key: getattr(self, key) for key in FIELDS if key in only}
+            if compact:
+                data = {key: value for key, value in data.items() if not _is_empty(value)}
+            base = _encode(data)
+            if 'distance' not in only:
+                return base
+        elif compact:
+            if self._compact_json is None:
+                self._compact_json = _encode({
+                    key: getattr(self, key) for key in FIELDS if not _is_empty(getattr(self, key))
+                })
+            base = self._compact_json
+        else:
+            if self._json is None:
+                self._json = _encode({key: getattr(self, key) for key in FIELDS})
+            base = self._json
+        
+        if self.distance is None:
+            return base
+        separator = ',' if base != '{}' else ''
+        return f'{base[:-1]}{separator}"distance":{self.distance}}}'
+
+
+def places_to_json(places, compact=False, only=None):
+    """Serializa una lista de lugares reutilizando el JSON de cada uno"""
+    return '[' + ','.join(place.to_json(compact, only) for place in places) + ']'
+
+
+def payload_to_json(fields, places, key='places', compact=False, only=None):
+    """Serializa un objeto con campos simples más una lista de lugares"""
+    head = _encode(fields)
+    separator = ',' if fields else ''
+    return f'{head[:-1]}{separator}"{key}":{places_to_json(places, compact, only)}}}'
+
+
+class PlaceSet:
+    """Lugares de una búsqueda, indexados por categoría al cargarse
+
+    Se comporta como una secuencia de solo lectura de Place.
+    """
+
+    __slots__ = ('places', 'by_category', 'type_counts', 'fingerprint', 'features', 'hours')
+
+    def __init__(self, places=(), categories=PLACE_CATEGORIES):
+        self.places = tuple(places)
+        type_to_categories = {}
+        for category, types in categories.items():
+            for place_type in types:
+                type_to_categories.setdefault(place_type, []).append(category)
+
+        by_category = {category: [] for category in categories}
+        type_counts = {}
+        for place in self.places:
+            place_type = place.type or 'Sin clasificar'
+            type_counts[place_type] = type_counts.get(place_type, 0) + 1
+            for category in type_to_categories.get(place.type, ()):
+                by_category[category].append(place)
+
+        self.by_category = {category: tuple(items) for category, items in by_category.items()}
+        self.type_counts = type_counts
+        # Todos los campos: las cachés de ranking, horarios y respuestas dependen de ellos,
+        # así que un horario o sitio web renovado da otra huella
+        self.fingerprint = hash(tuple(tuple(getattr(p, field) for field in FIELDS) for p in self.places))
+        # Arreglos de utils.ranking, calculados la primera vez que se ordena por relevancia
+        self.features = None
+        # Horarios compilados de utils.opening_hours, para filtrar por "abierto ahora"
+        self.hours = None
+
+    def category(self, name):
+        """Lugares de una categoría de PLACE_CATEGORIES; cualquier otra retorna todos"""
+        return self.by_category.get(name, self.places)
+
+    def __len__(self):
+        return len(self.places)
+
+    def __iter__(self):
+        return iter(self.places)
+
+    def __getitem__(self, index):
+        return self.places[index]
+
+    def __bool__(self):
+        return bool(self.places)
+
+    def __reduce__(self):
+        # Solo se guardan los lugares; los índices se reconstruyen al cargar
+        return (PlaceSet, (self.places,))
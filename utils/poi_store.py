@@ -0,0 +1,704 @@
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import numpy as np
+from config import LOCAL_POI_PATHS, LOCAL_POI_CELL_DEG, PLACE_TYPES
+from utils.geo_utils import calculate_distance, haversine_many
+from utils.overpass_api import element_to_place
+from utils.place import Place, NOT_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111320
+
+# Tipos que la aplicación muestra; el resto de los POI locales se ignoran
+DEFAULT_TYPES = frozenset(t for types in PLACE_TYPES.values() for t in types)
+
+# Valores de relleno de data/places_data.json que equivalen a "sin dato"
+_PLACEHOLDER_FIELDS = ('opening_hours', 'description', 'website', 'phone', 'address')
+
+# Directorio de fragmentos generado por utils.ingest (ver ShardedPOIStore)
+MANIFEST_NAME = 'manifest.json'
+
+# Formato columnar (ver ColumnarPOIStore)
+COLUMNS_EXT = '.poi'
+COLUMNS_MAGIC = b'BPPOICOL'
+# 2: las celdas cubiertas solo se guardan si se declararon (antes, toda celda con datos)
+COLUMNS_VERSION = 2
+# magic, versión, lugares, cell_deg, cadenas, tipos, celdas, celdas cubiertas, rectángulos, bytes del heap
+_HEADER = struct.Struct('<8sIIdIIIIIQ')
+# Columnas de texto; cada una guarda el id de la cadena en el heap (0 = None)
+STRING_FIELDS = ('name', 'description', 'website', 'rating', 'opening_hours', 'phone', 'address')
+_SECTIONS = (
+    'lat', 'lon', 'type', 'strings', 'cell_keys', 'cell_starts', 'covered', 'coverage',
+    'type_names', 'string_offsets', 'heap'
+)
+_OFFSETS = struct.Struct('<' + 'Q' * len(_SECTIONS))
+_ALIGN = 8
+
+
+def _cell_key(row, col):
+    """Clave ordenable de una celda: las celdas de una misma fila quedan contiguas"""
+    return row * 2 ** 32 + col
+
+
+def _section_layout(count, n_strings, n_types, n_cells, n_covered, n_coverage, heap_len):
+    """Tipo y forma de cada sección del archivo columnar"""
+    return {
+        'lat': ('<f8', (count,)),
+        'lon': ('<f8', (count,)),
+        'type': ('<u2', (count,)),
+        'strings': ('<u4', (len(STRING_FIELDS), count)),
+        'cell_keys': ('<i8', (n_cells,)),
+        'cell_starts': ('<u4', (n_cells + 1,)),
+        'covered': ('<i8', (n_covered,)),
+        'coverage': ('<f8', (n_coverage, 4)),
+        'type_names': ('<u4', (n_types,)),
+        'string_offsets': ('<u8', (n_strings + 1,)),
+        'heap': ('u1', (heap_len,)),
+    }
+
+
+def normalize_place(raw):
+    """Convierte un lugar guardado al mismo esquema que entrega OverpassAPI"""
+    fields = {field: raw.get(field, '') for field in _PLACEHOLDER_FIELDS}
+    for field, value in fields.items():
+        if value == NOT_AVAILABLE:
+            fields[field] = ''
+    return Place(
+        name=raw.get('name'),
+        latitude=raw.get('latitude'),
+        longitude=raw.get('longitude'),
+        type=raw.get('type') or 'other',
+        rating=raw.get('rating') or NOT_AVAILABLE,
+        **fields
+    )
+
+
+class POIStore:
+    """Índice espacial en memoria (cuadrícula lat/lon) de lugares locales"""
+
+    def __init__(self, cell_deg=LOCAL_POI_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._places = []
+        self._cells = {}
+        self._covered_cells = set()
+        self._coverage_bboxes = []
+        self._extent = None
+
+    def __len__(self):
+        return len(self._places)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def load_file(self, path):
+        """Carga un archivo con el esquema de places_data.json o un volcado JSON de Overpass"""
+        places, coverage = read_places_file(path)
+        added = self.add_places(places, coverage)
+        logger.info(f"POI locales: {added} lugares cargados desde {path}")
+        return added
+
+    def add_places(self, places, coverage=None, covered_cells=None):
+        """Agrega lugares y la cobertura declarada (rectángulos o celdas completas)
+
+        Sin cobertura declarada los lugares solo complementan lo que responde
+        Overpass: que una celda tenga algún POI no significa que estén todos.
+        """
+        added = 0
+        for place in places:
+            self.add(place)
+            added += 1
+        if coverage:
+            self._coverage_bboxes.extend(coverage)
+        if covered_cells:
+            self._covered_cells.update(covered_cells)
+        return added
+
+    def add(self, place):
+        """Agrega un lugar al índice y retorna su celda"""
+        cell = self._cell(place.latitude, place.longitude)
+        self._cells.setdefault(cell, []).append(len(self._places))
+        row, col = cell
+        if self._extent is None:
+            self._extent = (row, col, row, col)
+        else:
+            min_row, min_col, max_row, max_col = self._extent
+            self._extent = (min(min_row, row), min(min_col, col), max(max_row, row), max(max_col, col))
+        self._places.append(place)
+        return cell
+
+    def _bbox(self, lat, lon, radius):
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+    def _cells_in_bbox(self, south, west, north, east):
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                yield (row, col)
+
+    def covers(self, lat, lon, radius):
+        """Indica si el área de búsqueda está completamente cubierta por datos locales"""
+        south, west, north, east = self._bbox(lat, lon, radius)
+        for b_south, b_west, b_north, b_east in self._coverage_bboxes:
+            if south >= b_south and west >= b_west and north <= b_north and east <= b_east:
+                return True
+        if not self._covered_cells:
+            return False
+        return all(
+            cell in self._covered_cells
+            for cell in self._cells_in_bbox(south, west, north, east)
+        )
+
+    def nearby(self, lat, lon, radius, types=DEFAULT_TYPES):
+        """Retorna los lugares dentro del radio, filtrados por tipo"""
+        results = []
+        for cell in self._cells_in_bbox(*self._bbox(lat, lon, radius)):
+            for index in self._cells.get(cell, ()):
+                place = self._places[index]
+                if types is not None and place.type not in types:
+                    continue
+                if calculate_distance(lat, lon, place.latitude, place.longitude) <= radius:
+                    results.append(place)
+        return results
+
+    def nearest(self, lat, lon, k, types=DEFAULT_TYPES, max_radius=None):
+        """Retorna los k lugares más cercanos con su distancia, expandiendo anillos de celdas"""
+        if not self._places:
+            return []
+        center_row, center_col = self._cell(lat, lon)
+        cell_m = self.cell_deg * METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        min_row, min_col, max_row, max_col = self._extent
+        max_ring = max(
+            abs(center_row - min_row), abs(center_row - max_row),
+            abs(center_col - min_col), abs(center_col - max_col)
+        )
+        if max_radius is not None:
+            max_ring = min(max_ring, int(max_radius / cell_m) + 1)
+
+        def visit(cell):
+            for index in self._cells.get(cell, ()):
+                place = self._places[index]
+                if types is not None and place.type not in types:
+                    continue
+                distance = calculate_distance(lat, lon, place.latitude, place.longitude)
+                if max_radius is None or distance <= max_radius:
+                    found.append((distance, index))
+
+        found = []
+        for ring in range(max_ring + 1):
+            if 8 * ring > len(self._cells):
+                # Anillo más grande que las celdas ocupadas: recorrer lo que falta de una vez
+                for row, col in list(self._cells):
+                    if ring <= max(abs(row - center_row), abs(col - center_col)) <= max_ring:
+                        visit((row, col))
+                break
+            if ring == 0:
+                visit((center_row, center_col))
+            else:
+                for offset in range(-ring, ring + 1):
+                    visit((center_row - ring, center_col + offset))
+                    visit((center_row + ring, center_col + offset))
+                for offset in range(-ring + 1, ring):
+                    visit((center_row + offset, center_col - ring))
+                    visit((center_row + offset, center_col + ring))
+            # Lo no visitado está al menos a `ring` celdas de distancia
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * cell_m:
+                    break
+
+        found.sort()
+        return [self._places[index].with_distance(round(distance)) for distance, index in found[:k]]
+
+    def save(self, path):
+        """Escribe el almacén en formato columnar para abrirlo con ColumnarPOIStore
+
+        Se escribe a un archivo temporal y se reemplaza el destino de una vez:
+        los procesos que ya tienen mapeado el archivo anterior siguen leyéndolo.
+        """
+        keyed = sorted(
+            (_cell_key(*self._cell(place.latitude, place.longitude)), index)
+            for index, place in enumerate(self._places)
+        )
+        places = [self._places[index] for _, index in keyed]
+
+        strings = {}
+        heap = bytearray()
+        offsets = [0]
+
+        def intern(value):
+            if value is None:
+                return 0
+            value = str(value)
+            string_id = strings.get(value)
+            if string_id is None:
+                heap.extend(value.encode('utf-8'))
+                offsets.append(len(heap))
+                string_id = strings[value] = len(offsets) - 1
+            return string_id
+
+        type_codes = {}
+        for place in places:
+            type_codes.setdefault(place.type, len(type_codes))
+        if len(type_codes) > 2 ** 16:
+            raise ValueError("Demasiados tipos de lugar para el formato columnar")
+
+        cell_keys = []
+        cell_starts = []
+        for position, (key, _) in enumerate(keyed):
+            if not cell_keys or cell_keys[-1] != key:
+                cell_keys.append(key)
+                cell_starts.append(position)
+        cell_starts.append(len(places))
+
+        # Las cadenas de tipos van primero para que su lista sea corta al abrir
+        type_names = [intern(name) for name in type_codes]
+        arrays = {
+            'lat': np.array([place.latitude for place in places], dtype='<f8'),
+            'lon': np.array([place.longitude for place in places], dtype='<f8'),
+            'type': np.array([type_codes[place.type] for place in places], dtype='<u2'),
+            'strings': np.array(
+                [[intern(getattr(place, field)) for place in places] for field in STRING_FIELDS],
+                dtype='<u4'
+            ).reshape(len(STRING_FIELDS), len(places)),
+            'cell_keys': np.array(cell_keys, dtype='<i8'),
+            'cell_starts': np.array(cell_starts, dtype='<u4'),
+            'covered': np.array(sorted(_cell_key(*cell) for cell in self._covered_cells), dtype='<i8'),
+            'coverage': np.array(self._coverage_bboxes, dtype='<f8').reshape(-1, 4),
+            'type_names': np.array(type_names, dtype='<u4'),
+            'string_offsets': np.array(offsets, dtype='<u8'),
+            'heap': np.frombuffer(bytes(heap), dtype='u1'),
+        }
+
+        header = _HEADER.pack(
+            COLUMNS_MAGIC, COLUMNS_VERSION, len(places), self.cell_deg, len(offsets) - 1,
+            len(type_codes), len(cell_keys), len(arrays['covered']), len(arrays['coverage']), len(heap)
+        )
+        position = len(header) + _OFFSETS.size
+        section_offsets = []
+        for name in _SECTIONS:
+            position += -position % _ALIGN
+            section_offsets.append(position)
+            position += arrays[name].nbytes
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(_OFFSETS.pack(*section_offsets))
+            for name, offset in zip(_SECTIONS, section_offsets):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(arrays[name].tobytes())
+        os.replace(tmp_path, path)
+        return len(places)
+
+
+class ColumnarPOIStore:
+    """Lugares locales leídos de un archivo columnar mapeado en memoria
+
+    Coordenadas, tipos e ids de cadenas son arreglos NumPy sobre el mmap del
+    archivo: no se copian al abrir, y varios procesos que abren el mismo
+    archivo comparten las mismas páginas físicas. Los lugares están ordenados
+    por celda, así que un rectángulo de celdas es un rango contiguo por fila.
+    Los objetos Place solo se crean para los resultados de cada consulta.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mmap, 0)
+        magic, version, count, self.cell_deg = header[:4]
+        if magic != COLUMNS_MAGIC or version != COLUMNS_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} no es un archivo de POI columnar compatible")
+        layout = _section_layout(count, *header[4:])
+        offsets = _OFFSETS.unpack_from(self._mmap, _HEADER.size)
+
+        columns = {}
+        for name, offset in zip(_SECTIONS, offsets):
+            dtype, shape = layout[name]
+            columns[name] = np.frombuffer(
+                self._mmap, dtype=dtype, count=int(np.prod(shape)), offset=offset
+            ).reshape(shape)
+        self._lats = columns['lat']
+        self._lons = columns['lon']
+        self._type_codes = columns['type']
+        self._strings = columns['strings']
+        self._cell_keys = columns['cell_keys']
+        self._cell_starts = columns['cell_starts']
+        self._covered = columns['covered']
+        self._coverage = columns['coverage']
+        self._string_offsets = columns['string_offsets']
+        self._heap_offset = offsets[_SECTIONS.index('heap')]
+
+        self._types = tuple(sys.intern(self._string(int(i))) for i in columns['type_names'])
+        self._codes_by_type = {name: code for code, name in enumerate(self._types)}
+        self._types_cache = {}
+        if len(self._cell_keys):
+            rows = (self._cell_keys + 2 ** 31) >> 32
+            cols = self._cell_keys - rows * 2 ** 32
+            self._extent = (int(rows.min()), int(cols.min()), int(rows.max()), int(cols.max()))
+        else:
+            self._extent = None
+
+    def __len__(self):
+        return len(self._lats)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _bbox(self, lat, lon, radius):
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+    def _string(self, string_id):
+        if string_id == 0:
+            return None
+        start = self._heap_offset + int(self._string_offsets[string_id - 1])
+        end = self._heap_offset + int(self._string_offsets[string_id])
+        return self._mmap[start:end].decode('utf-8')
+
+    def _places(self, indices):
+        """Crea los Place de los índices; cada cadena distinta se decodifica una sola vez"""
+        string_ids = self._strings[:, indices]
+        unique = np.unique(string_ids)
+        unique = unique[unique > 0]
+        starts = (self._string_offsets[unique - 1] + self._heap_offset).tolist()
+        ends = (self._string_offsets[unique] + self._heap_offset).tolist()
+        decoded = {0: None}
+        for string_id, start, end in zip(unique.tolist(), starts, ends):
+            decoded[string_id] = self._mmap[start:end].decode('utf-8')
+
+        columns = [[decoded[string_id] for string_id in row] for row in string_ids.tolist()]
+        types = [self._types[code] for code in self._type_codes[indices].tolist()]
+        return [
+            Place(name, lat, lon, type=place_type, description=description, website=website,
+                  rating=rating, opening_hours=opening_hours, phone=phone, address=address)
+            for name, description, website, rating, opening_hours, phone, address, lat, lon, place_type
+            in zip(*columns, self._lats[indices].tolist(), self._lons[indices].tolist(), types)
+        ]
+
+    def _type_mask_codes(self, types):
+        """Códigos de los tipos pedidos, calculados una vez por conjunto de tipos"""
+        types = frozenset(types)
+        codes = self._types_cache.get(types)
+        if codes is None:
+            codes = np.array(
+                [self._codes_by_type[name] for name in types if name in self._codes_by_type],
+                dtype='<u2'
+            )
+            self._types_cache[types] = codes
+        return codes
+
+    def _indices_in_cells(self, min_row, min_col, max_row, max_col, types):
+        """Índices de los lugares en el rectángulo de celdas, filtrados por tipo"""
+        ranges = []
+        for row in range(min_row, max_row + 1):
+            lo = np.searchsorted(self._cell_keys, _cell_key(row, min_col), side='left')
+            hi = np.searchsorted(self._cell_keys, _cell_key(row, max_col), side='right')
+            if hi > lo:
+                ranges.append(np.arange(self._cell_starts[lo], self._cell_starts[hi]))
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        indices = np.concatenate(ranges)
+        if types is not None:
+            indices = indices[np.isin(self._type_codes[indices], self._type_mask_codes(types))]
+        return indices
+
+    def covers(self, lat, lon, radius):
+        """Indica si el área de búsqueda está completamente cubierta por datos locales"""
+        south, west, north, east = self._bbox(lat, lon, radius)
+        if len(self._coverage):
+            inside = (
+                (south >= self._coverage[:, 0]) & (west >= self._coverage[:, 1])
+                & (north <= self._coverage[:, 2]) & (east <= self._coverage[:, 3])
+            )
+            if inside.any():
+                return True
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+        return self.covers_cells(min_row, min_col, max_row, max_col)
+
+    def covers_cells(self, min_row, min_col, max_row, max_col):
+        """Indica si todas las celdas del rectángulo tienen datos locales"""
+        if not len(self._covered):
+            return False
+        for row in range(min_row, max_row + 1):
+            lo = np.searchsorted(self._covered, _cell_key(row, min_col), side='left')
+            hi = np.searchsorted(self._covered, _cell_key(row, max_col), side='right')
+            if hi - lo != max_col - min_col + 1:
+                return False
+        return True
+
+    def nearby(self, lat, lon, radius, types=DEFAULT_TYPES):
+        """Retorna los lugares dentro del radio, filtrados por tipo"""
+        south, west, north, east = self._bbox(lat, lon, radius)
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+        indices = self._indices_in_cells(min_row, min_col, max_row, max_col, types)
+        distances = haversine_many(lat, lon, self._lats[indices], self._lons[indices])
+        return self._places(indices[distances <= radius])
+
+    def nearest(self, lat, lon, k, types=DEFAULT_TYPES, max_radius=None):
+        """Retorna los k lugares más cercanos con su distancia
+
+        Busca en cuadrados de celdas que duplican su lado hasta que el k-ésimo
+        lugar está más cerca que cualquier celda aún no revisada.
+        """
+        if self._extent is None or k <= 0:
+            return []
+        center_row, center_col = self._cell(lat, lon)
+        cell_m = self.cell_deg * METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        min_row, min_col, max_row, max_col = self._extent
+        max_ring = max(
+            abs(center_row - min_row), abs(center_row - max_row),
+            abs(center_col - min_col), abs(center_col - max_col)
+        )
+        if max_radius is not None:
+            max_ring = min(max_ring, int(max_radius / cell_m) + 1)
+
+        ring = 0
+        while True:
+            indices = self._indices_in_cells(
+                center_row - ring, center_col - ring, center_row + ring, center_col + ring, types
+            )
+            distances = haversine_many(lat, lon, self._lats[indices], self._lons[indices])
+            if max_radius is not None:
+                keep = distances <= max_radius
+                indices, distances = indices[keep], distances[keep]
+            if ring >= max_ring:
+                break
+            # Lo no revisado está al menos a `ring` celdas de distancia
+            if len(indices) >= k and np.partition(distances, k - 1)[k - 1] <= ring * cell_m:
+                break
+            ring = min(max_ring, max(1, ring * 2))
+
+        if len(indices) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+            indices, distances = indices[top], distances[top]
+        order = np.lexsort((indices, distances))
+        return [
+            place.with_distance(round(distance))
+            for place, distance in zip(self._places(indices[order]), distances[order].tolist())
+        ]
+
+
+class CombinedPOIStore:
+    """Consulta varios almacenes de POI locales como uno solo"""
+
+    def __init__(self, stores):
+        self.stores = list(stores)
+
+    def __len__(self):
+        return sum(len(store) for store in self.stores)
+
+    def covers(self, lat, lon, radius):
+        return any(store.covers(lat, lon, radius) for store in self.stores)
+
+    def nearby(self, lat, lon, radius, types=DEFAULT_TYPES):
+        return [place for store in self.stores for place in store.nearby(lat, lon, radius, types)]
+
+    def nearest(self, lat, lon, k, types=DEFAULT_TYPES, max_radius=None):
+        found = [place for store in self.stores for place in store.nearest(lat, lon, k, types, max_radius)]
+        found.sort(key=lambda place: place.distance)
+        return found[:k]
+
+
+def shard_for(row, col, cells_per_shard):
+    """Fragmento (fila, columna) que contiene la celda; cada celda está en uno solo"""
+    return (row // cells_per_shard, col // cells_per_shard)
+
+
+def shard_name(shard):
+    return f'{shard[0]}_{shard[1]}'
+
+
+class ShardedPOIStore:
+    """Fragmentos columnares de utils.ingest, abiertos solo cuando una consulta los toca
+
+    El directorio tiene un manifest.json con el tamaño de celda y de fragmento
+    y el archivo de cada fragmento. Los fragmentos son bloques de celdas
+    completas, así que la cobertura de un área que cruza fragmentos se revisa
+    en cada uno con sus propias celdas.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.cell_deg = manifest['cell_deg']
+        self.cells_per_shard = manifest['cells_per_shard']
+        self._files = {
+            tuple(map(int, name.split('_'))): os.path.join(directory, shard['file'])
+            for name, shard in manifest['shards'].items()
+        }
+        self._count = sum(shard['places'] for shard in manifest['shards'].values())
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _store(self, shard):
+        store = self._stores.get(shard)
+        if store is None and shard in self._files:
+            with self._lock:
+                store = self._stores.get(shard)
+                if store is None:
+                    store = self._stores[shard] = ColumnarPOIStore(self._files[shard])
+        return store
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _cell_range(self, lat, lon, radius):
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_row, min_col = self._cell(lat - dlat, lon - dlon)
+        max_row, max_col = self._cell(lat + dlat, lon + dlon)
+        return min_row, min_col, max_row, max_col
+
+    def _shards(self, min_row, min_col, max_row, max_col):
+        """Fragmentos que tocan el rectángulo de celdas, con la parte de cada uno"""
+        n = self.cells_per_shard
+        for shard_row in range(min_row // n, max_row // n + 1):
+            for shard_col in range(min_col // n, max_col // n + 1):
+                yield (shard_row, shard_col), (
+                    max(min_row, shard_row * n), max(min_col, shard_col * n),
+                    min(max_row, shard_row * n + n - 1), min(max_col, shard_col * n + n - 1)
+                )
+
+    def covers(self, lat, lon, radius):
+        """Indica si el área de búsqueda está completamente cubierta por datos locales"""
+        for shard, cells in self._shards(*self._cell_range(lat, lon, radius)):
+            store = self._store(shard)
+            if store is None or not store.covers_cells(*cells):
+                return False
+        return True
+
+    def nearby(self, lat, lon, radius, types=DEFAULT_TYPES):
+        results = []
+        for shard, _ in self._shards(*self._cell_range(lat, lon, radius)):
+            store = self._store(shard)
+            if store is not None:
+                results.extend(store.nearby(lat, lon, radius, types))
+        return results
+
+    def nearest(self, lat, lon, k, types=DEFAULT_TYPES, max_radius=None):
+        if max_radius is None:
+            shards = list(self._files)
+        else:
+            shards = [shard for shard, _ in self._shards(*self._cell_range(lat, lon, max_radius))]
+        found = [
+            place for shard in shards if shard in self._files
+            for place in self._store(shard).nearest(lat, lon, k, types, max_radius)
+        ]
+        found.sort(key=lambda place: place.distance)
+        return found[:k]
+
+
+def read_places_file(path):
+    """Lee un archivo JSON de lugares; retorna (lugares, rectángulos de cobertura declarados)"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    if 'elements' in data:
+        raw_places = (element_to_place(element) for element in data['elements'])
+    else:
+        raw_places = (normalize_place(place) for place in data.get('places', []))
+
+    places = [
+        place for place in raw_places
+        if place is not None and place.latitude is not None and place.longitude is not None
+    ]
+    return places, [tuple(bbox) for bbox in data.get('coverage') or ()]
+
+
+def is_columnar_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(COLUMNS_MAGIC)) == COLUMNS_MAGIC
+
+
+def is_current_columnar_file(path):
+    """Archivo columnar con la versión de formato actual"""
+    with open(path, 'rb') as f:
+        header = f.read(len(COLUMNS_MAGIC) + 4)
+    if len(header) < len(COLUMNS_MAGIC) + 4 or header[:len(COLUMNS_MAGIC)] != COLUMNS_MAGIC:
+        return False
+    return struct.unpack_from('<I', header, len(COLUMNS_MAGIC))[0] == COLUMNS_VERSION
+
+
+def columnar_path(path):
+    """Archivo columnar compilado junto a un JSON, si existe y está al día"""
+    compiled = os.path.splitext(path)[0] + COLUMNS_EXT
+    if (compiled != path and os.path.exists(compiled)
+            and os.path.getmtime(compiled) >= os.path.getmtime(path) and is_current_columnar_file(compiled)):
+        return compiled
+    return path
+
+
+_poi_store = None
+_poi_store_lock = threading.Lock()
+
+
+def get_poi_store():
+    """Retorna el almacén local compartido, cargado desde LOCAL_POI_PATHS"""
+    global _poi_store
+    if _poi_store is None:
+        with _poi_store_lock:
+            if _poi_store is None:
+                store = POIStore()
+                stores = [store]
+                for path in LOCAL_POI_PATHS:
+                    if not os.path.exists(path):
+                        logger.warning(f"Archivo de POI locales no encontrado: {path}")
+                        continue
+                    try:
+                        if os.path.isdir(path):
+                            stores.append(ShardedPOIStore(path))
+                            logger.info(f"POI locales: {len(stores[-1])} lugares en fragmentos de {path}")
+                            continue
+                        path = columnar_path(path)
+                        if is_columnar_file(path):
+                            stores.append(ColumnarPOIStore(path))
+                            logger.info(f"POI locales: {len(stores[-1])} lugares mapeados desde {path}")
+                        else:
+                            store.load_file(path)
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.error(f"Error al cargar POI locales de {path}: {str(e)}")
+                if len(store) == 0 and len(stores) > 1:
+                    stores.remove(store)
+                _poi_store = stores[0] if len(stores) == 1 else CombinedPOIStore(stores)
+    return _poi_store
+
+
+def main(argv=None):
+    """Convierte archivos JSON de lugares al formato columnar"""
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument('inputs', nargs='+',
+                            help='archivos con el esquema de places_data.json o volcados de Overpass')
+    arg_parser.add_argument('--output', '-o',
+                            help=f'archivo de salida (por defecto el primer JSON con extensión {COLUMNS_EXT})')
+    args = arg_parser.parse_args(argv)
+
+    store = POIStore()
+    for path in args.inputs:
+        store.load_file(path)
+    output = args.output or os.path.splitext(args.inputs[0])[0] + COLUMNS_EXT
+    count = store.save(output)
+    print(f"{count} lugares escritos en {output} ({os.path.getsize(output)} bytes)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
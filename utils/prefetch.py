@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    SEARCH_RADIUS, GEOCODE_CACHE_TTL, PLACES_CACHE_TTL, PREFETCH_DESTINATIONS,
+    PREFETCH_INTERVAL, PREFETCH_REFRESH_MARGIN, PREFETCH_HOT_SIZE, PREFETCH_MIN_HITS,
+    PREFETCH_DECAY, PREFETCH_TRACKED_KEYS, PREFETCH_WORKERS, PREFETCH_OVERPASS_RATE,
+    PREFETCH_LOCK_PATH
+)
+from utils.log_utils import fields
+from utils.rate_limiter import TokenBucket
+
+try:
+    import fcntl
+except ImportError:  # sin flock (Windows) cada proceso hace su propia precarga
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def acquire_host_lock(path):
+    """Toma sin esperar un bloqueo exclusivo del archivo; retorna el archivo abierto o None
+
+    El bloqueo dura mientras el archivo siga abierto y el sistema lo suelta
+    si el proceso termina, así que otro worker puede tomar el relevo.
+    """
+    if fcntl is None:
+        return open(os.devnull)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class PopularityTracker:
+    """Cuenta solicitudes por clave, con decaimiento, para aprender qué es frecuente"""
+
+    def __init__(self, max_keys=PREFETCH_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self._scores = {}  # clave -> [puntaje, argumentos para renovarla]
+        self._lock = threading.Lock()
+
+    def record(self, key, args):
+        with self._lock:
+            entry = self._scores.get(key)
+            if entry is None:
+                if len(self._scores) >= self.max_keys:
+                    self._drop_coldest()
+                entry = self._scores[key] = [0.0, args]
+            entry[0] += 1
+
+    def _drop_coldest(self):
+        # Descartar la mitad menos consultada de una vez para no ordenar en cada alta
+        ranked = sorted(self._scores.items(), key=lambda item: item[1][0])
+        for key, _ in ranked[:len(ranked) // 2 or 1]:
+            del self._scores[key]
+
+    def decay(self, factor=PREFETCH_DECAY):
+        with self._lock:
+            for key in list(self._scores):
+                entry = self._scores[key]
+                entry[0] *= factor
+                if entry[0] < 0.1:
+                    del self._scores[key]
+
+    def top(self, n=PREFETCH_HOT_SIZE, min_score=PREFETCH_MIN_HITS):
+        """Argumentos de las claves más frecuentes"""
+        with self._lock:
+            ranked = sorted(self._scores.values(), key=lambda entry: entry[0], reverse=True)
+        return [args for score, args in ranked[:n] if score >= min_score]
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class Prefetcher:
+    """Precarga destinos populares y los renueva antes de que venzan en caché
+
+    Al iniciar calienta PREFETCH_DESTINATIONS; luego, cada PREFETCH_INTERVAL,
+    renueva esos destinos y las consultas y áreas más pedidas cuyo TTL esté
+    por vencer. Las tareas corren en un pool acotado y las descargas de
+    Overpass respetan su propio límite de tasa; Nominatim usa el del servicio
+    de geocodificación. Con varios workers solo precarga el que toma el
+    bloqueo de lock_path; para que el resto aproveche lo precargado, las
+    cachés deben compartirse (PLACES_CACHE_PATH y GEOCODE_CACHE_PATH).
+    """
+
+    def __init__(self, geocoder, overpass_api, destinations=PREFETCH_DESTINATIONS,
+                 interval=PREFETCH_INTERVAL, workers=PREFETCH_WORKERS, lock_path=PREFETCH_LOCK_PATH):
+        self.geocoder = geocoder
+        self.overpass_api = overpass_api
+        self.destinations = list(destinations)
+        self.interval = interval
+        self.lock_path = lock_path
+        self._lock_file = None
+        self.geocodes = PopularityTracker()
+        self.areas = PopularityTracker()
+        geocoder.tracker = self.geocodes
+        overpass_api.tracker = self.areas
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._limiter = TokenBucket(PREFETCH_OVERPASS_RATE, capacity=1)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._retry_at = 0.0  # próximo intento de tomar el bloqueo
+
+        self.geocode_refreshes = 0
+        self.area_refreshes = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def start(self):
+        """Inicia la precarga en segundo plano si ningún otro proceso la hace
+
+        Si otro proceso tiene el bloqueo se vuelve a intentar cada intervalo,
+        por si ese proceso terminó. Con la precarga en marcha no hace nada.
+        """
+        with self._lock:
+            if self._thread is not None or time.monotonic() < self._retry_at:
+                return
+            self._lock_file = acquire_host_lock(self.lock_path)
+            if self._lock_file is None:
+                self._retry_at = time.monotonic() + self.interval
+                logger.debug("Precarga a cargo de otro proceso", extra=fields(lock=self.lock_path))
+                return
+            self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _run(self):
+        self.refresh_hot()
+        while not self._stop.wait(self.interval):
+            self.refresh_hot()
+            self.geocodes.decay()
+            self.areas.decay()
+
+    def refresh_hot(self):
+        """Encola la renovación de todo lo frecuente que esté por vencer"""
+        for name in self.destinations:
+            self._submit(('destination', name), self._refresh_destination, name)
+        geocode_margin = GEOCODE_CACHE_TTL * PREFETCH_REFRESH_MARGIN
+        for query in self.geocodes.top():
+            remaining = self.geocoder.expires_in(query)
+            if remaining is None or remaining < geocode_margin:
+                self._submit(('geocode', query), self._refresh_geocode, query)
+        for lat, lon, radius in self.areas.top():
+            self._submit(('area', lat, lon, radius), self._refresh_area, lat, lon, radius)
+
+    def _submit(self, key, func, *args):
+        with self._lock:
+            if key in self._pending or self._stop.is_set():
+                return
+            self._pending.add(key)
+
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Error en la precarga", extra=fields(task=key[0], error=str(e)))
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        self._executor.submit(run)
+
+    def _refresh_destination(self, name):
+        # Los nombres del nomenclátor no pasan por Nominatim: solo se renuevan sus lugares
+        location = self.geocoder.local(name)
+        if location is None:
+            remaining = self.geocoder.expires_in(name)
+            if remaining is None or remaining < GEOCODE_CACHE_TTL * PREFETCH_REFRESH_MARGIN:
+                location = self._refresh_geocode(name)
+            else:
+                location = self.geocoder.geocode(name)
+        if location is not None:
+            self._refresh_area(location.latitude, location.longitude, SEARCH_RADIUS)
+
+    def _refresh_geocode(self, query):
+        self.geocode_refreshes += 1
+        return self.geocoder.refresh(query)
+
+    def _refresh_area(self, lat, lon, radius):
+        tiles = self.overpass_api.stale_tiles(lat, lon, radius, PLACES_CACHE_TTL * PREFETCH_REFRESH_MARGIN)
+        if not tiles:
+            return
+        if not self._limiter.acquire(timeout=self.interval):
+            # Ya hay demasiadas descargas esperando turno; se reintenta en la próxima revisión
+            self.skipped += 1
+            return
+        self.area_refreshes += 1
+        self.overpass_api.refresh_places(lat, lon, radius, tiles)
+        logger.debug("Área precargada", extra=fields(latitude=lat, longitude=lon, tiles=len(tiles)))
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'tracked_geocodes': len(self.geocodes),
+            'tracked_areas': len(self.areas),
+            'geocode_refreshes': self.geocode_refreshes,
+            'area_refreshes': self.area_refreshes,
+            'skipped': self.skipped,
+            'errors': self.errors
+        }
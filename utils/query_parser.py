@@ -0,0 +1,173 @@
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+from config import (
+    LANGUAGE_PATTERNS, GREETING_PATTERNS, BOT_QUESTION_PATTERNS, LOCATION_PREPOSITIONS,
+    OPEN_NOW_PATTERNS, OPEN_NOW_ADJECTIVES
+)
+
+# intent: 'greeting', 'bot', 'places' o None si no se reconoce nada;
+# open_now indica que se pidieron solo lugares abiertos en este momento
+ParsedQuery = namedtuple(
+    'ParsedQuery', ['intent', 'category', 'location', 'phrase', 'open_now'], defaults=(False,)
+)
+
+_EDGE_PUNCTUATION = ' \t¿?¡!.,;:"\''
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(ch):
+    lowered = ch.lower()
+    if len(lowered) != 1:
+        lowered = ch
+    base = ''.join(c for c in unicodedata.normalize('NFD', lowered) if not unicodedata.combining(c))
+    return base if len(base) == 1 else lowered
+
+
+def fold(text):
+    """Minúsculas y sin acentos, conservando la longitud para mapear posiciones"""
+    return ''.join(map(_fold_char, text))
+
+
+def _trie_pattern(phrases):
+    """Expresión regular con prefijos compartidos: el costo por posición no
+    crece con la cantidad de frases, solo con su longitud"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        optional = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if optional:
+            # Cuantificador codicioso: se prefiere la frase más larga
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    return build(trie)
+
+
+class QueryParser:
+    """Reconoce saludo, pregunta sobre el bot, categoría y ubicación en una sola pasada"""
+
+    def __init__(self, language_patterns=LANGUAGE_PATTERNS, greetings=GREETING_PATTERNS,
+                 bot_questions=BOT_QUESTION_PATTERNS, prepositions=LOCATION_PREPOSITIONS,
+                 open_now=OPEN_NOW_PATTERNS, open_adjectives=OPEN_NOW_ADJECTIVES):
+        self._phrases = {}
+        # El orden define la prioridad si una frase aparece en varias listas
+        for phrase in prepositions:
+            self._phrases[fold(phrase)] = ('preposition', None)
+        for phrase in greetings:
+            self._phrases[fold(phrase)] = ('greeting', None)
+        for phrase in bot_questions:
+            self._phrases[fold(phrase)] = ('bot', None)
+        for category, patterns in language_patterns.items():
+            for phrase in patterns:
+                self._phrases[fold(phrase)] = ('category', category)
+
+        self._regex = re.compile(r'(?<!\w)' + _trie_pattern(self._phrases) + r'(?!\w)')
+        self._open_now = re.compile(r'(?<!\w)' + _trie_pattern({fold(p) for p in open_now}) + r'(?!\w)')
+
+        # "restaurantes abiertos en": el adjetivo va entre la categoría y su preposición
+        folded_prepositions = {fold(p) for p in prepositions}
+        heads = set()
+        for patterns in language_patterns.values():
+            for phrase in patterns:
+                head, _, last = fold(phrase).rpartition(' ')
+                if head and last in folded_prepositions:
+                    heads.add(head)
+        self._open_adjective = None
+        if heads and open_adjectives:
+            self._open_adjective = re.compile(
+                r'(?<!\w)' + _trie_pattern(heads) + r'\s+(' + _trie_pattern({fold(a) for a in open_adjectives})
+                + r')\s+(?=' + _trie_pattern(folded_prepositions) + r'(?!\w))'
+            )
+
+    def __len__(self):
+        return len(self._phrases)
+
+    def parse(self, text):
+        """Analiza un mensaje del usuario y retorna un ParsedQuery"""
+        text = text.strip()
+        # "abiertos ahora" se quita del texto para que no quede dentro de la ubicación
+        folded = fold(text)
+        match = self._open_now.search(folded)
+        start = end = None
+        if match is not None:
+            start, end = match.span()
+        elif self._open_adjective is not None:
+            match = self._open_adjective.search(folded)
+            if match is not None:
+                start, end = match.span(1)
+        if start is None:
+            return self._parse(text)
+        text = (text[:start].rstrip() + ' ' + text[end:].lstrip()).strip()
+        return self._parse(text)._replace(open_now=True)
+
+    def _parse(self, text):
+        folded = fold(text)
+        word_count = len(folded.split())
+
+        greeting = bot = category = preposition = None
+        for match in self._regex.finditer(folded):
+            kind, name = self._phrases[match.group()]
+            if kind == 'category':
+                category = (match, name)
+                break
+            if kind == 'greeting' and greeting is None:
+                greeting = match
+            elif kind == 'bot' and bot is None:
+                bot = match
+            elif kind == 'preposition' and preposition is None:
+                preposition = match
+
+        # Solo saludo (con alguna palabra de cortesía), sin consulta adicional
+        if greeting is not None and category is None and word_count <= 3:
+            return ParsedQuery('greeting', None, None, greeting.group())
+
+        if bot is not None and category is None:
+            if word_count <= len(bot.group().split()) + 2:
+                return ParsedQuery('bot', None, None, bot.group())
+
+        if category is not None:
+            match, name = category
+            return ParsedQuery('places', name, self._location_after(text, match.end()), match.group())
+
+        if preposition is not None:
+            location = self._location_after(text, preposition.end())
+            if location:
+                return ParsedQuery('places', 'general', location, preposition.group())
+
+        # Nombres propios: palabra con mayúscula que no inicia la oración
+        words = text.split()
+        for i, word in enumerate(words[1:], start=1):
+            if word[0].isupper():
+                return ParsedQuery('places', 'general', ' '.join(words[i:]).strip(_EDGE_PUNCTUATION), None)
+
+        return ParsedQuery(None, 'general', None, None)
+
+    @staticmethod
+    def _location_after(text, position):
+        return text[position:].strip(_EDGE_PUNCTUATION)
+
+
+_query_parser = None
+_query_parser_lock = threading.Lock()
+
+
+def get_query_parser():
+    """Retorna el analizador compartido, compilado una vez desde config"""
+    global _query_parser
+    if _query_parser is None:
+        with _query_parser_lock:
+            if _query_parser is None:
+                _query_parser = QueryParser()
+    return _query_parser
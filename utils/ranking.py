@@ -0,0 +1,164 @@
+import math
+from functools import lru_cache
+import numpy as np
+from config import (
+    PLACE_CATEGORIES, RANKING_WEIGHTS, RANKING_DISTANCE_SCALE, RANKING_FEATURES_CACHE_ENTRIES,
+    PLACES_CACHE_TTL
+)
+from utils.cache import TTLCache
+from utils.gazetteer import normalize_query
+from utils.geo_utils import EARTH_RADIUS
+from utils.opening_hours import hours_index_for
+from utils.place import PlaceSet, NOT_AVAILABLE
+
+# Campos que hacen más útil un resultado para el viajero
+RICHNESS_FIELDS = ('website', 'opening_hours', 'phone', 'description')
+
+# Nombres que solo repiten el tipo de lugar ("Restaurante", "Parque"...)
+GENERIC_NAMES = frozenset({
+    'restaurante', 'restaurant', 'soda', 'bar', 'cafe', 'cafeteria', 'parque', 'jardin',
+    'museo', 'mirador', 'monumento', 'teatro', 'galeria', 'ruinas', 'desconocido', 'sin nombre'
+})
+
+# Cada búsqueda crea un PlaceSet nuevo; las características se reutilizan por huella
+_features_cache = TTLCache(
+    max_entries=RANKING_FEATURES_CACHE_ENTRIES, ttl=PLACES_CACHE_TTL, name='ranking'
+)
+
+
+# Los mismos lugares vuelven en cada búsqueda de la zona: no repetir la normalización
+@lru_cache(maxsize=65536)
+def name_quality(name, place_type=None):
+    """Puntaje entre 0 y 1 de qué tan informativo es el nombre"""
+    if not name:
+        return 0.0
+    folded = normalize_query(name)
+    if not folded or folded in GENERIC_NAMES or folded == place_type:
+        return 0.2
+    quality = 1.0
+    if len(folded) < 4 or len(name) > 60:
+        quality -= 0.3
+    if name.isupper():
+        quality -= 0.2
+    if sum(ch.isdigit() for ch in folded) * 2 > len(folded):
+        quality -= 0.3
+    return quality
+
+
+def _has_value(value):
+    return bool(value) and value != NOT_AVAILABLE
+
+
+class RankingFeatures:
+    """Arreglos por lugar que no dependen de la consulta; se calculan una vez por PlaceSet"""
+
+    __slots__ = ('lat_radians', 'lon_radians', 'cos_lat', 'richness', 'name_quality',
+                 'type_codes', 'type_index', '_category_masks')
+
+    def __init__(self, places):
+        self.type_index = {}
+        lats, lons, richness, quality, type_codes = [], [], [], [], []
+        for place in places:
+            lats.append(place.latitude)
+            lons.append(place.longitude)
+            richness.append(
+                _has_value(place.website) + _has_value(place.opening_hours)
+                + _has_value(place.phone) + _has_value(place.description)
+            )
+            quality.append(name_quality(place.name, place.type))
+            type_codes.append(self.type_index.setdefault(place.type, len(self.type_index)))
+
+        self.lat_radians = np.radians(np.array(lats, dtype=np.float64))
+        self.lon_radians = np.radians(np.array(lons, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat_radians)
+        self.richness = np.array(richness, dtype=np.float64) / len(RICHNESS_FIELDS)
+        self.name_quality = np.array(quality, dtype=np.float64)
+        self.type_codes = np.array(type_codes, dtype=np.int32)
+        self._category_masks = {}
+
+    def distances(self, lat, lon):
+        """Distancias haversine en metros, con los radianes de los lugares ya calculados"""
+        lat1 = math.radians(lat)
+        dlat = self.lat_radians - lat1
+        dlon = self.lon_radians - math.radians(lon)
+        a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * self.cos_lat * np.sin(dlon / 2) ** 2
+        return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    def category_mask(self, category):
+        """Lugares cuyo tipo pertenece a la categoría de PLACE_CATEGORIES"""
+        mask = self._category_masks.get(category)
+        if mask is None:
+            codes = [self.type_index[t] for t in PLACE_CATEGORIES.get(category, ()) if t in self.type_index]
+            mask = np.isin(self.type_codes, codes)
+            self._category_masks[category] = mask
+        return mask
+
+
+def features_for(places):
+    """Características de ranking; en un PlaceSet se guardan para las siguientes consultas"""
+    if not isinstance(places, PlaceSet):
+        return RankingFeatures(places)
+    if places.features is None:
+        key = (places.fingerprint, len(places))
+        features = _features_cache.get(key)
+        if features is None:
+            features = RankingFeatures(places)
+            _features_cache.set(key, features)
+        places.features = features
+    return places.features
+
+
+def score_places(features, lat=None, lon=None, category=None, weights=RANKING_WEIGHTS):
+    """Puntaje de relevancia de todos los lugares en una sola pasada; retorna (puntajes, distancias)"""
+    scores = weights['richness'] * features.richness + weights['name'] * features.name_quality
+    distances = None
+    if lat is not None and lon is not None:
+        distances = features.distances(lat, lon)
+        scores += weights['distance'] * np.exp(-distances / RANKING_DISTANCE_SCALE)
+    if category in PLACE_CATEGORIES:
+        scores += weights['category'] * features.category_mask(category)
+    return scores, distances
+
+
+def rank_places(places, lat, lon, k, category=None, strict=False, max_distance=None,
+                weights=RANKING_WEIGHTS, open_at=None):
+    """Los k lugares más relevantes, de mayor a menor puntaje, y el total de candidatos
+
+    Con strict solo compiten los lugares de la categoría; con max_distance,
+    los que están dentro de esa distancia (y se retornan con 'distance'); con
+    open_at (minuto de la semana), los que su horario indica abiertos.
+    Solo se ordenan los k elegidos (selección parcial con argpartition); los
+    empates conservan el orden original.
+    """
+    if not places:
+        return [], 0
+    features = features_for(places)
+    scores, distances = score_places(features, lat, lon, category, weights)
+
+    valid = None
+    if strict and category in PLACE_CATEGORIES:
+        valid = features.category_mask(category)
+    if max_distance is not None and distances is not None:
+        inside = distances <= max_distance
+        valid = inside if valid is None else valid & inside
+    if open_at is not None:
+        is_open = hours_index_for(places).open_mask(open_at)
+        valid = is_open if valid is None else valid & is_open
+    if valid is not None:
+        scores = np.where(valid, scores, -np.inf)
+        total = int(np.count_nonzero(valid))
+    else:
+        total = len(places)
+
+    k = min(k, total)
+    if k <= 0:
+        return [], total
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    order = top[np.lexsort((top, -scores[top]))]
+
+    if max_distance is None or distances is None:
+        return [places[index] for index in order.tolist()], total
+    return [
+        places[index].with_distance(int(round(distance)))
+        for index, distance in zip(order.tolist(), distances[order].tolist())
+    ], total
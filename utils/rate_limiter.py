@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Limitador de tasa tipo token bucket que encola en lugar de rechazar"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.total_wait = 0.0
+
+    def acquire(self, timeout=None):
+        """Reserva un token y espera su turno; retorna False si excede el timeout"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            if timeout is not None and wait > timeout:
+                # Devolver la reserva, el llamador no esperará
+                self._tokens += 1
+                return False
+            self.waiting += 1
+
+        try:
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                self.total_wait += wait
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'capacity': self.capacity,
+                'waiting': self.waiting,
+                'total_wait': round(self.total_wait, 3)
+            }
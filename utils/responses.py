@@ -0,0 +1,92 @@
+import base64
+import gzip
+from config import (
+    COMPRESS_MIN_BYTES, COMPRESS_LEVEL, COMPRESS_MIMETYPES, PLACES_PAGE_SIZE,
+    PLACES_MAX_PAGE_SIZE
+)
+from utils.place import FIELDS
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional: sin ella solo se usa gzip
+    brotli = None
+
+PROJECTABLE_FIELDS = FIELDS + ('distance',)
+
+
+def parse_fields(value):
+    """Convierte 'name,latitude,...' en una tupla de campos; None si no se pidió"""
+    if not value:
+        return None
+    requested = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in requested if field not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    return requested
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(f'o:{offset}'.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Posición codificada en el cursor; lanza ValueError si no es válido"""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        prefix, offset = raw.split(':', 1)
+        offset = int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+    if prefix != 'o' or offset < 0:
+        raise ValueError("Cursor inválido")
+    return offset
+
+
+def parse_limit(value, default=PLACES_PAGE_SIZE):
+    if value in (None, ''):
+        return default
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError("El límite debe ser positivo")
+    return min(limit, PLACES_MAX_PAGE_SIZE)
+
+
+def paginate(places, limit, offset=0, total=None):
+    """Retorna (página, cursor siguiente o None) de una lista ya ordenada
+
+    total indica cuántos resultados hay cuando la lista solo llega hasta esta página.
+    """
+    page = places[offset:offset + limit]
+    next_offset = offset + limit
+    total = len(places) if total is None else total
+    return page, (encode_cursor(next_offset) if next_offset < total else None)
+
+
+def compress_response(response, request):
+    """Comprime con brotli o gzip las respuestas de texto que lo justifican"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if brotli is not None and request.accept_encodings['br']:
+        encoding, data = 'br', brotli.compress(data, quality=COMPRESS_LEVEL)
+    elif request.accept_encodings['gzip']:
+        encoding, data = 'gzip', gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # El cuerpo comprimido no es idéntico byte a byte al original
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
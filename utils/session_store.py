@@ -0,0 +1,195 @@
+import logging
+import pickle
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    SESSION_IDLE_TIMEOUT, SESSION_MAX_ENTRIES, SESSION_MAX_BYTES, SESSION_STORE_PATH
+)
+from utils.place import PlaceSet
+
+logger = logging.getLogger(__name__)
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+
+
+class SessionState:
+    """Estado de conversación de un usuario: ubicación y lugares actuales"""
+
+    def __init__(self, current_location=None, current_places=None):
+        self.current_location = current_location
+        self.current_places = PlaceSet(current_places or ())
+
+
+class MemorySessionBackend:
+    """Sesiones en memoria del proceso, acotadas por cantidad, bytes e inactividad"""
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES,
+                 idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            state, size, last_access, places = entry
+            if now - last_access > self.idle_timeout:
+                self._remove(session_id)
+                return None
+            self._data[session_id] = (state, size, now, places)
+            self._data.move_to_end(session_id)
+            return state
+
+    def put(self, session_id, state):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(session_id)
+        # Los lugares son casi todo el tamaño: solo se mide de nuevo si se reemplazaron
+        if entry is not None and entry[0] is state and entry[3] is state.current_places:
+            size = entry[1]
+        else:
+            size = len(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            if session_id in self._data:
+                self._remove(session_id)
+            self._data[session_id] = (state, size, now, state.current_places)
+            self._bytes += size
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id in self._data:
+                self._remove(session_id)
+
+    def _remove(self, session_id):
+        size = self._data.pop(session_id)[1]
+        self._bytes -= size
+
+    def _evict(self, now):
+        """Elimina sesiones inactivas y luego las menos recientes si se excede el límite"""
+        while self._data:
+            oldest_id, (_, _, last_access, _) = next(iter(self._data.items()))
+            over_limit = len(self._data) > self.max_entries or self._bytes > self.max_bytes
+            if not over_limit and now - last_access <= self.idle_timeout:
+                break
+            self._remove(oldest_id)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._data),
+                'bytes': self._bytes,
+                'evictions': self.evictions
+            }
+
+
+class SQLiteSessionBackend:
+    """Sesiones en un archivo SQLite compartido por varios procesos del servidor"""
+
+    PURGE_EVERY = 100
+
+    def __init__(self, path, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data BLOB, last_access REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, last_access FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.idle_timeout:
+            return None
+        return pickle.loads(row[0])
+
+    def put(self, session_id, state):
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, last_access) VALUES (?, ?, ?)",
+                (session_id, data, now)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE last_access < ?", (now - self.idle_timeout,)
+                )
+            self._conn.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {'backend': 'sqlite', 'sessions': count}
+
+
+class SessionStore:
+    """Asocia identificadores de sesión con su estado de conversación"""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            if SESSION_STORE_PATH:
+                backend = SQLiteSessionBackend(SESSION_STORE_PATH)
+            else:
+                backend = MemorySessionBackend()
+        self.backend = backend
+
+    @staticmethod
+    def new_id():
+        return secrets.token_urlsafe(24)
+
+    @staticmethod
+    def is_valid_id(session_id):
+        return bool(session_id) and bool(_SESSION_ID.match(session_id))
+
+    def open(self, session_id):
+        """Retorna (id, estado, es_nueva) para el id que envió el cliente
+
+        Solo se aceptan ids que el servidor emitió y siguen vigentes; con
+        cualquier otro se crea una sesión con un id nuevo, así un tercero no
+        puede fijar de antemano el id de otro usuario.
+        """
+        state = None
+        if self.is_valid_id(session_id):
+            try:
+                state = self.backend.get(session_id)
+            except Exception as e:
+                logger.error(f"Error al leer la sesión: {str(e)}", exc_info=True)
+        if state is None:
+            return self.new_id(), SessionState(), True
+        return session_id, state, False
+
+    def save(self, session_id, state):
+        try:
+            self.backend.put(session_id, state)
+        except Exception as e:
+            logger.error(f"Error al guardar la sesión: {str(e)}", exc_info=True)
+
+    def stats(self):
+        return self.backend.stats()
@@ -0,0 +1,98 @@
+import math
+from collections import namedtuple
+from utils.geo_utils import EARTH_RADIUS, calculate_distance
+
+# Tesela del esquema slippy map (el mismo de los mapas de OSM y Leaflet)
+Tile = namedtuple('Tile', ['z', 'x', 'y'])
+
+MAX_LATITUDE = 85.0511287798  # límite de la proyección Web Mercator
+
+
+def tile_for(lat, lon, zoom):
+    """Tesela que contiene el punto"""
+    n = 2 ** zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return Tile(zoom, min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+
+def tile_bounds(tile):
+    """Rectángulo (sur, oeste, norte, este) de la tesela"""
+    n = 2 ** tile.z
+    west = tile.x / n * 360.0 - 180.0
+    east = (tile.x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile.y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (tile.y + 1) / n))))
+    return south, west, north, east
+
+
+def tiles_for_circle(lat, lon, radius_meters, zoom, max_tiles=None):
+    """Teselas que tocan el círculo, sin las esquinas que quedan fuera
+
+    Con max_tiles retorna None, sin recorrerlas, si el rectángulo que
+    contiene al círculo tiene más teselas que eso.
+    """
+    dlat = math.degrees(radius_meters / EARTH_RADIUS)
+    dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, MAX_LATITUDE))), 1e-6)
+    north_west = tile_for(lat + dlat, lon - dlon, zoom)
+    south_east = tile_for(lat - dlat, lon + dlon, zoom)
+    span = (south_east.y - north_west.y + 1) * (south_east.x - north_west.x + 1)
+    if max_tiles is not None and span > max_tiles:
+        return None
+
+    tiles = []
+    for y in range(north_west.y, south_east.y + 1):
+        for x in range(north_west.x, south_east.x + 1):
+            tile = Tile(zoom, x, y)
+            south, west, north, east = tile_bounds(tile)
+            # Punto de la tesela más cercano al centro
+            nearest_lat = min(max(lat, south), north)
+            nearest_lon = min(max(lon, west), east)
+            if calculate_distance(lat, lon, nearest_lat, nearest_lon) <= radius_meters:
+                tiles.append(tile)
+    return tiles
+
+
+def merge_tiles(tiles):
+    """Agrupa teselas contiguas en rectángulos (sur, oeste, norte, este)
+
+    Primero une las teselas seguidas de cada fila y luego las filas vecinas
+    con el mismo tramo, para que la consulta tenga pocas cláusulas.
+    """
+    rows = {}
+    for tile in tiles:
+        rows.setdefault((tile.z, tile.y), []).append(tile.x)
+
+    runs = []
+    for (zoom, y), xs in sorted(rows.items()):
+        xs.sort()
+        start = prev = xs[0]
+        for x in xs[1:] + [None]:
+            if x is not None and x == prev + 1:
+                prev = x
+                continue
+            runs.append((zoom, start, prev, y))
+            start = prev = x
+
+    # (zoom, x0, x1) -> [y0, y1] del rectángulo abierto
+    open_rects = {}
+    rects = []
+    for zoom, x0, x1, y in runs:
+        key = (zoom, x0, x1)
+        rect = open_rects.get(key)
+        if rect is not None and rect[1] == y - 1:
+            rect[1] = y
+        else:
+            if rect is not None:
+                rects.append((zoom, x0, x1, rect[0], rect[1]))
+            open_rects[key] = [y, y]
+    rects.extend((zoom, x0, x1, y0, y1) for (zoom, x0, x1), (y0, y1) in open_rects.items())
+
+    boxes = []
+    for zoom, x0, x1, y0, y1 in sorted(rects):
+        south, west, _, _ = tile_bounds(Tile(zoom, x0, y1))
+        _, _, north, east = tile_bounds(Tile(zoom, x1, y0))
+        boxes.append((south, west, north, east))
+    return boxes
@@ -0,0 +1,286 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    OVERPASS_API_URLS, OVERPASS_TIMEOUT, UPSTREAM_POOL_SIZE, UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_BASE, UPSTREAM_BACKOFF_MAX, CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT, OVERPASS_MAX_CONCURRENT, OVERPASS_MAX_QUEUE, OVERPASS_QUEUE_TIMEOUT,
+    OVERLOAD_RETRY_AFTER
+)
+from utils.log_utils import fields
+from utils.metrics import count_shed, count_upstream, observe_admission_wait, record_admission
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Ningún endpoint del servicio externo respondió correctamente"""
+
+
+class Overloaded(UpstreamError):
+    """Demasiadas llamadas en curso al servicio externo: se rechaza sin esperar más"""
+
+    def __init__(self, message, retry_after=OVERLOAD_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Limita las llamadas simultáneas a un servicio externo con una cola acotada
+
+    Si la cola está llena la solicitud se rechaza de inmediato; si el turno no
+    llega dentro de queue_timeout (o del plazo del llamador, si es menor) se
+    rechaza al vencer. En ambos casos se lanza Overloaded, para que el llamador
+    responda desde caché vencida o con un 503 rápido en lugar de dejar al
+    worker bloqueado.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout,
+                 retry_after=OVERLOAD_RETRY_AFTER):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """Reserva un turno durante el bloque; lanza Overloaded si no se consigue"""
+        started = time.monotonic()
+        wait = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        with self._cond:
+            if self.in_flight >= self.max_concurrent:
+                if self.queued >= self.max_queue:
+                    self._reject('queue_full')
+                self.queued += 1
+                self._publish()
+                try:
+                    deadline = started + wait
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject('queue_timeout')
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+                    self._publish()
+            self.in_flight += 1
+            self.admitted += 1
+            self._publish()
+        observe_admission_wait(self.name, time.monotonic() - started)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._publish()
+                self._cond.notify()
+
+    def _reject(self, reason):
+        # Se llama con el lock tomado
+        self.shed += 1
+        self._publish()
+        count_shed(self.name, reason)
+        logger.warning("Solicitud rechazada por sobrecarga", extra=fields(
+            service=self.name, reason=reason, in_flight=self.in_flight, queued=self.queued
+        ))
+        raise Overloaded(f"{self.name}: servicio saturado ({reason})", self.retry_after)
+
+    def _publish(self):
+        record_admission(self.name, self.in_flight, self.queued)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'shed': self.shed
+            }
+
+
+class CircuitBreaker:
+    """Deja de llamar a un endpoint tras varios fallos seguidos durante un tiempo"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Permite la llamada si el circuito está cerrado o listo para probar"""
+        return self.state != 'open'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                # Abrir (o reabrir tras una prueba fallida en estado semiabierto)
+                self.opened_at = time.monotonic()
+
+
+def parse_retry_after(value):
+    """Convierte la cabecera Retry-After (segundos o fecha HTTP) a segundos"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamClient:
+    """Cliente HTTP con conexiones persistentes, reintentos y réplicas de respaldo
+
+    `admission` limita las descargas simultáneas; get() no lo usa por sí solo
+    porque una respuesta en streaming ocupa el turno hasta leer todo el cuerpo,
+    así que el llamador abre `with client.admission.admit():` alrededor de la
+    llamada y la lectura.
+    """
+
+    def __init__(self, endpoints, name='upstream', timeout=OVERPASS_TIMEOUT,
+                 max_retries=UPSTREAM_MAX_RETRIES, backoff_base=UPSTREAM_BACKOFF_BASE,
+                 backoff_max=UPSTREAM_BACKOFF_MAX, pool_size=UPSTREAM_POOL_SIZE,
+                 max_concurrent=OVERPASS_MAX_CONCURRENT, max_queue=OVERPASS_MAX_QUEUE,
+                 queue_timeout=OVERPASS_QUEUE_TIMEOUT):
+        self.endpoints = list(endpoints)
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breakers = {url: CircuitBreaker() for url in self.endpoints}
+        self.admission = AdmissionGate(name, max_concurrent, max_queue, queue_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.calls = 0
+        self.retries = 0
+        self.failovers = 0
+
+    def get(self, params, timeout=None, **kwargs):
+        """Hace un GET al primer endpoint disponible; lanza UpstreamError si todos fallan"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        last_error = None
+
+        for index, url in enumerate(self.endpoints):
+            breaker = self.breakers[url]
+            if not breaker.allow():
+                continue
+            if index > 0:
+                self.failovers += 1
+
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise UpstreamError(f"{self.name}: tiempo agotado ({last_error})")
+
+                self.calls += 1
+                try:
+                    response = self.session.get(url, params=params, timeout=remaining, **kwargs)
+                except requests.RequestException as e:
+                    count_upstream(self.name, 'network_error')
+                    last_error = str(e)
+                    retry_after = None
+                else:
+                    if response.status_code == 200:
+                        count_upstream(self.name, 'ok')
+                        breaker.record_success()
+                        return response
+                    count_upstream(self.name, f'http_{response.status_code}')
+                    last_error = f"HTTP {response.status_code}"
+                    if response.status_code < 500 and response.status_code not in RETRY_STATUS_CODES:
+                        # Error de la solicitud (consulta mal formada...): otra réplica
+                        # respondería lo mismo y el endpoint no está fallando
+                        response.close()
+                        raise UpstreamError(f"{self.name}: solicitud rechazada ({last_error})")
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        breaker.record_failure()
+                        break
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    response.close()
+
+                if attempt == self.max_retries:
+                    breaker.record_failure()
+                    break
+
+                delay = self._backoff(attempt, retry_after)
+                if delay >= deadline - time.monotonic():
+                    # No hay tiempo para esperar aquí; probar la siguiente réplica
+                    breaker.record_failure()
+                    break
+                self.retries += 1
+                logger.warning("Reintentando servicio externo", extra=fields(
+                    service=self.name, url=url, error=last_error, delay=round(delay, 2)
+                ))
+                time.sleep(delay)
+
+        raise UpstreamError(f"{self.name}: todos los endpoints fallaron ({last_error})")
+
+    def _backoff(self, attempt, retry_after=None):
+        """Espera exponencial con jitter completo, respetando Retry-After"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'retries': self.retries,
+            'failovers': self.failovers,
+            'admission': self.admission.stats(),
+            'circuits': {url: breaker.state for url, breaker in self.breakers.items()}
+        }
+
+
+_overpass_client = None
+_overpass_client_lock = threading.Lock()
+
+
+def get_overpass_client():
+    """Retorna el cliente compartido para Overpass y sus réplicas"""
+    global _overpass_client
+    if _overpass_client is None:
+        with _overpass_client_lock:
+            if _overpass_client is None:
+                _overpass_client = UpstreamClient(OVERPASS_API_URLS, name='overpass')
+    return _overpass_client